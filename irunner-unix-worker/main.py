@@ -57,14 +57,18 @@ def main():
 
     need_sleep = False
     while True:
+        jsonjob = None
         if need_sleep:
             try:
-                sleeper.sleep()
+                jsonjob = sleeper.sleep()
             except KeyboardInterrupt:
                 logging.info('Bye!')
                 break
 
-        job = api_client.take_job(cache)
+        if jsonjob is not None:
+            job = api_client.parse_job(cache, jsonjob)
+        else:
+            job = api_client.take_job(cache)
         if job is None:
             logging.info('Nothing to test')
             need_sleep = True
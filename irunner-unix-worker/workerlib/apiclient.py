@@ -3,7 +3,7 @@ import urllib
 import requests
 
 from requests.adapters import HTTPAdapter
-from requests.exceptions import Timeout
+from requests.exceptions import ConnectionError, Timeout
 from requests.packages.urllib3.util.retry import Retry
 
 from .resourceid import (
@@ -32,21 +32,38 @@ class IRunnerApiClient:
         self._set_up_retries(self._session)
 
     def wait_on_semaphore(self):
+        '''
+        Returns (ok, jsonjob). jsonjob is not None if the server has pushed a job
+        to us in the wake-up response; then there is no need to call take_job().
+        '''
+        headers = {
+            'X-iRunner-Accept-Push': '1',
+            'X-iRunner-Worker-Name': self._greeting['name'],
+        }
         try:
-            r = self._session.post(self._url('semaphore/wait'), timeout=60.0)
+            r = self._session.post(self._url('semaphore/wait'), headers=headers, timeout=60.0)
         except Timeout:
             logging.warning('Semaphore request timeout')
-            return False
-        return r.status_code == requests.codes.OK
+            return False, None
+        except ConnectionError:
+            # the worker falls back to polling with the interval from the config
+            logging.warning('Semaphore is unavailable')
+            return False, None
+        if r.status_code != requests.codes.OK:
+            return False, None
+        if r.content:
+            return True, r.json()
+        return True, None
 
     def take_job(self, cache):
         r = self._session.post(self._url('jobs/take'), json=self._greeting)
         if r.status_code == requests.codes.NOT_FOUND:
             return None
+        return self.parse_job(cache, r.json())
 
-        logging.debug('Got job: %s', r.json())
+    def parse_job(self, cache, jsonjob):
+        logging.debug('Got job: %s', jsonjob)
 
-        jsonjob = r.json()
         jsonproblem = jsonjob['problem']
         jsonchecker = jsonproblem['checker']
         assert jsonchecker['kind'] in (TestingJob.PYTEST, TestingJob.GTEST)
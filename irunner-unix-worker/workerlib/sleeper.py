@@ -7,14 +7,17 @@ class Sleeper:
         self._min_sleep_time = min_sleep_time
 
     def sleep(self):
+        '''
+        Returns the job pushed by the server (JSON) or None.
+        '''
         t1 = time.time()
-        ok = self._client.wait_on_semaphore()
+        ok, jsonjob = self._client.wait_on_semaphore()
         if ok:
-            return True
+            return jsonjob
         t2 = time.time()
 
         passed = max(0., t2 - t1)
         if passed < self._min_sleep_time:
             time.sleep(self._min_sleep_time - passed)
 
-        return False
+        return None
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from api.models import DbObjectInQueue
+from api.queue import claim
+from api.worker import Worker
+
+# Real workers never take objects with negative priority (see api.worker),
+# so the benchmark does not interfere with the production queue.
+BENCHMARK_PRIORITY = -100500
+
+
+class BenchmarkWorker(Worker):
+    TAG = 'benchmark'
+
+    @classmethod
+    def filter_queue(cls, db_obj_qs):
+        return db_obj_qs.filter(priority=BENCHMARK_PRIORITY)
+
+    @classmethod
+    def mark(cls, db_obj):
+        db_obj.priority = BENCHMARK_PRIORITY
+
+
+def _run_worker(name, claimed_ids):
+    try:
+        while True:
+            db_obj = claim(BenchmarkWorker, name)
+            if db_obj is None:
+                break
+            claimed_ids.append(db_obj.id)
+    finally:
+        connection.close()
+
+
+def _fill_queue(jobs):
+    ts = timezone.now()
+    db_objs = []
+    for _ in range(jobs):
+        db_obj = DbObjectInQueue(state=DbObjectInQueue.WAITING, creation_time=ts, last_update_time=ts, priority=0)
+        BenchmarkWorker.mark(db_obj)
+        db_objs.append(db_obj)
+    DbObjectInQueue.objects.bulk_create(db_objs)
+
+
+def _clear_queue():
+    DbObjectInQueue.objects.filter(priority=BENCHMARK_PRIORITY).delete()
+
+
+class Command(BaseCommand):
+    help = 'Measures the rate of concurrent job claims from the testing queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-j', '--jobs', type=int, default=2000, help='number of jobs to put into the queue')
+        parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                            help='numbers of simulated workers to try')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        jobs = options['jobs']
+
+        logger.info('Database: %s, SKIP LOCKED: %s', connection.vendor, connection.features.has_select_for_update_skip_locked)
+        _clear_queue()
+
+        print('workers\tjobs\tseconds\tclaims/s\tduplicates')
+        for num_workers in options['workers']:
+            _fill_queue(jobs)
+
+            claimed = [[] for _ in range(num_workers)]
+            threads = [
+                threading.Thread(target=_run_worker, args=('benchmark:{}'.format(i), claimed[i]))
+                for i in range(num_workers)
+            ]
+
+            t1 = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            t2 = time.time()
+
+            all_ids = [pk for ids in claimed for pk in ids]
+            duplicates = len(all_ids) - len(set(all_ids))
+            elapsed = max(t2 - t1, 1e-9)
+            print('{}\t{}\t{:.3f}\t{:.1f}\t{}'.format(num_workers, len(all_ids), elapsed, len(all_ids) / elapsed, duplicates))
+
+            if len(all_ids) != jobs:
+                logger.warning('%d jobs were put, but %d were claimed', jobs, len(all_ids))
+
+            _clear_queue()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from solutions.models import JudgementExtraInfo
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _print_row(name, latencies):
+    if not latencies:
+        print('{}\t0'.format(name))
+        return
+    latencies.sort()
+    print('{}\t{}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}\t{:.3f}'.format(
+        name,
+        len(latencies),
+        sum(latencies) / len(latencies),
+        _percentile(latencies, 0.5),
+        _percentile(latencies, 0.9),
+        _percentile(latencies, 0.99),
+        latencies[-1],
+    ))
+
+
+class Command(BaseCommand):
+    help = 'Reports the latency between receiving solutions and giving them to workers (PREPARING state)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24., help='consider judgements started testing during the last N hours')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+
+        submitted = []
+        queued = []
+        for reception_time, creation_time, start_testing_time, rejudge_id in JudgementExtraInfo.objects.\
+                filter(start_testing_time__gte=since).\
+                values_list('judgement__solution__reception_time', 'creation_time', 'start_testing_time', 'judgement__rejudge_id').\
+                iterator():
+            if creation_time is not None:
+                queued.append((start_testing_time - creation_time).total_seconds())
+            if rejudge_id is None:
+                # rejudged solutions have been received long ago
+                submitted.append((start_testing_time - reception_time).total_seconds())
+
+        print('seconds\tcount\tmean\tp50\tp90\tp99\tmax')
+        _print_row('submit', submitted)
+        _print_row('queue', queued)
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_dbobjectinqueue_challenged_solution'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dbobjectinqueue',
+            index=models.Index(fields=['state', 'priority', 'id'], name='api_dbobjec_state_aeb864_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0020_auto_20210706_0236'),
+        ('api', '0003_dbobjectinqueue_claim_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerProblemRevision',
+            fields=[
+                ('problem', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='problems.problem')),
+                ('revision', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,7 +1,7 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
-from problems.models import Validation
+from problems.models import Problem, Validation
 from solutions.models import Judgement, ChallengedSolution
 
 
@@ -27,3 +27,18 @@ class DbObjectInQueue(models.Model):
     judgement = models.ForeignKey(Judgement, null=True, on_delete=models.CASCADE)
     validation = models.ForeignKey(Validation, null=True, on_delete=models.CASCADE)
     challenged_solution = models.ForeignKey(ChallengedSolution, null=True, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # serves the claim query of api.queue.claim()
+            models.Index(fields=['state', 'priority', 'id']),
+        ]
+
+
+class WorkerProblemRevision(models.Model):
+    '''
+    Changes whenever the problem data sent to workers changes.
+    Used as a part of the cache key for problem descriptors.
+    '''
+    problem = models.OneToOneField(Problem, on_delete=models.CASCADE, primary_key=True)
+    revision = models.IntegerField(default=0)
@@ -1,6 +1,8 @@
 from django.utils import timezone
 
 from common.outcome import Outcome
+from contests.models import register_solution_changes
+from plagiarism.plagiarism_api import register_accepted_solution
 from problems.models import (
     DEFAULT_TIME_LIMIT,
     ProblemExtraInfo,
@@ -16,8 +18,13 @@ from solutions.models import (
     JudgementExtraInfo,
     JudgementLog,
     ChallengedSolution,
+    update_solution_list,
+    update_solution_list_state,
 )
+from solutions.rejudge.progress import register_rejudge_result
+from solutions.status import notify_judgements_changed
 
+from api.problemcache import load_worker_problems
 from api.workerstructs import (
     WorkerChecker,
     WorkerFile,
@@ -25,6 +32,7 @@ from api.workerstructs import (
     WorkerProblem,
     WorkerTestCase,
     WorkerTestingJob,
+    WorkerTestingJobGroup,
     WorkerValidator,
 )
 
@@ -59,6 +67,18 @@ class IObjectInQueue(object):
         '''
         raise NotImplementedError()
 
+    @classmethod
+    def get_jobs(cls, objs):
+        '''
+        Works as get_job() for several objects of the class at once.
+        Jobs for the same problem may share a WorkerProblem instance.
+        Must not modify the database.
+
+        returns:
+            list of WorkerTestingJob in the order of objs
+        '''
+        return [obj.get_job() for obj in objs]
+
     def update_state(self, state):
         '''
         args:
@@ -66,6 +86,11 @@ class IObjectInQueue(object):
         '''
         raise NotImplementedError()
 
+    @classmethod
+    def bulk_update_state(cls, objs, state):
+        for obj in objs:
+            obj.update_state(state)
+
     def put_report(self, report):
         '''
         Is executed under transaction.
@@ -160,52 +185,87 @@ class JudgementInQueue(IObjectInQueue):
         db_obj.judgement_id = self._judgement_id
 
     def get_job(self):
-        judgement = Judgement.objects.select_related('solution').get(pk=self._judgement_id)
-        job = WorkerTestingJob()
-        job.problem = self._make_workerproblem(judgement.solution.problem)
-        job.solution = judgement.solution
-        job.stop_after_first_failed_test = judgement.solution.stop_on_fail
-        return job
+        return JudgementInQueue.get_jobs([self])[0]
+
+    @classmethod
+    def get_jobs(cls, objs):
+        judgements = Judgement.objects.\
+            select_related('solution', 'solution__problem', 'solution__compiler', 'solution__source_code').\
+            in_bulk([obj.judgement_id for obj in objs])
+
+        problems = {}
+        for judgement in judgements.values():
+            problems[judgement.solution.problem_id] = judgement.solution.problem
+        # serialized descriptors shared by all the jobs for the problem
+        wproblems = load_worker_problems(problems.values(), cls._make_workerproblems)
+
+        jobs = []
+        for obj in objs:
+            judgement = judgements[obj.judgement_id]
+            job = WorkerTestingJob()
+            job.problem = wproblems[judgement.solution.problem_id]
+            job.solution = judgement.solution
+            job.stop_after_first_failed_test = judgement.solution.stop_on_fail
+            jobs.append(job)
+        return jobs
 
     @staticmethod
-    def _make_workerproblem(problem):
-        default_time_limit, sample_test_count = ProblemExtraInfo.objects.\
-            filter(problem=problem).\
-            values_list('default_time_limit', 'sample_test_count').\
-            first() or (DEFAULT_TIME_LIMIT, 0)
-
-        wtests = []
-        for tc in problem.testcase_set.all().order_by('ordinal_number', 'id'):
-            wtest = WorkerTestCase(tc.id)
+    def _make_workerproblems(problems):
+        '''
+        Returns a dict {problem_id: WorkerProblem}.
+        The number of DB queries does not depend on the number of problems.
+        '''
+        problem_ids = [problem.id for problem in problems]
+
+        extra_infos = {}
+        for problem_id, default_time_limit, sample_test_count in ProblemExtraInfo.objects.\
+                filter(problem_id__in=problem_ids).\
+                values_list('problem_id', 'default_time_limit', 'sample_test_count'):
+            extra_infos[problem_id] = (default_time_limit, sample_test_count)
+
+        wproblems = {}
+        sample_test_counts = {}
+        for problem in problems:
+            default_time_limit, sample_test_count = extra_infos.get(problem.id, (DEFAULT_TIME_LIMIT, 0))
+
+            wproblem = WorkerProblem(problem.id)
+            wproblem.name = problem.numbered_full_name()
+            wproblem.input_file_name = problem.input_filename
+            wproblem.output_file_name = problem.output_filename
+            wproblem.default_time_limit = default_time_limit
+            wproblems[problem.id] = wproblem
+            sample_test_counts[problem.id] = sample_test_count
+
+        for tc in TestCase.objects.filter(problem_id__in=problem_ids).order_by('ordinal_number', 'id'):
+            wproblem = wproblems[tc.problem_id]
 
+            wtest = WorkerTestCase(tc.id)
             wtest.input = WorkerFile(tc.input_resource_id)
             wtest.answer = WorkerFile(tc.answer_resource_id)
             wtest.time_limit = tc.time_limit
             wtest.memory_limit = tc.memory_limit
             wtest.max_score = tc.points
-            wtest.is_sample = (tc.ordinal_number <= sample_test_count)
-            wtests.append(wtest)
-
-        wproblem = WorkerProblem(problem.id)
-        wproblem.name = problem.numbered_full_name()
-        wproblem.input_file_name = problem.input_filename
-        wproblem.output_file_name = problem.output_filename
-        wproblem.tests = wtests
-        wproblem.default_time_limit = default_time_limit
-
-        checker = problem.problemrelatedsourcefile_set.filter(file_type=ProblemRelatedSourceFile.CHECKER).first()
-        if checker is not None:
-            kind = {
-                ProgrammingLanguage.CPP: WorkerChecker.TESTLIB_H,
-                ProgrammingLanguage.PYTHON: WorkerChecker.PYTEST,
-                ProgrammingLanguage.ZIP: WorkerChecker.GTEST,
-            }.get(checker.compiler.language, WorkerChecker.IRUNNER)
-            wproblem.checker = WorkerChecker(checker, kind)
-
-        for lib in problem.problemrelatedsourcefile_set.filter(file_type=ProblemRelatedSourceFile.LIBRARY):
-            wproblem.libraries.append(WorkerLibrary(lib))
-
-        return wproblem
+            wtest.is_sample = (tc.ordinal_number <= sample_test_counts[tc.problem_id])
+            wproblem.tests.append(wtest)
+
+        for source_file in ProblemRelatedSourceFile.objects.\
+                filter(problem_id__in=problem_ids).\
+                filter(file_type__in=(ProblemRelatedSourceFile.CHECKER, ProblemRelatedSourceFile.LIBRARY)).\
+                select_related('compiler').\
+                order_by('id'):
+            wproblem = wproblems[source_file.problem_id]
+
+            if source_file.file_type == ProblemRelatedSourceFile.LIBRARY:
+                wproblem.libraries.append(WorkerLibrary(source_file))
+            elif wproblem.checker is None:
+                kind = {
+                    ProgrammingLanguage.CPP: WorkerChecker.TESTLIB_H,
+                    ProgrammingLanguage.PYTHON: WorkerChecker.PYTEST,
+                    ProgrammingLanguage.ZIP: WorkerChecker.GTEST,
+                }.get(source_file.compiler.language, WorkerChecker.IRUNNER)
+                wproblem.checker = WorkerChecker(source_file, kind)
+
+        return wproblems
 
     def put_report(self, report):
         present_score = 0
@@ -224,6 +284,7 @@ class JudgementInQueue(IObjectInQueue):
                 present_first_failed_test = i + 1
 
         judgement = Judgement.objects.get(pk=self._judgement_id)
+        previous_outcome = judgement.outcome if judgement.status == Judgement.DONE else None
         judgement.status = Judgement.DONE
         judgement.outcome = report.outcome
         judgement.score = report.score if report.score is not None else present_score
@@ -261,12 +322,29 @@ class JudgementInQueue(IObjectInQueue):
             log.judgement = judgement
         JudgementLog.objects.bulk_create(report.logs)
 
+        register_solution_changes([judgement.solution_id])
+        update_solution_list([judgement.solution_id])
+        register_rejudge_result(judgement, previous_outcome)
+        notify_judgements_changed([judgement.id])
+        if judgement.outcome == Outcome.ACCEPTED:
+            # accepted solutions are checked for plagiarism
+            register_accepted_solution(judgement.solution_id)
+
     def update_state(self, state):
-        Judgement.objects.filter(pk=self._judgement_id).exclude(status=Judgement.DONE).\
+        JudgementInQueue.bulk_update_state([self], state)
+
+    @classmethod
+    def bulk_update_state(cls, objs, state):
+        judgement_ids = [obj.judgement_id for obj in objs]
+
+        Judgement.objects.filter(pk__in=judgement_ids).exclude(status=Judgement.DONE).\
             update(status=state.status, test_number=state.test_number)
 
         if state.status == Judgement.PREPARING:
-            JudgementExtraInfo.objects.filter(pk=self._judgement_id).update(start_testing_time=timezone.now())
+            JudgementExtraInfo.objects.filter(pk__in=judgement_ids).update(start_testing_time=timezone.now())
+
+        update_solution_list_state(judgement_ids, state.status)
+        notify_judgements_changed(judgement_ids)
 
 
 class ChallengedSolutionInQueue(IObjectInQueue):
@@ -342,3 +420,43 @@ def create_object_in_queue(db_obj):
         obj = cls.create(db_obj)
         if obj is not None:
             return obj
+
+
+def get_jobs(objs):
+    '''
+    Returns WorkerTestingJob objects with ids filled for the given objects in queue.
+    '''
+    objs = list(objs)
+    jobs = [None] * len(objs)
+
+    for cls in OBJECT_IN_QUEUE_CLASSES:
+        positions = [i for i, obj in enumerate(objs) if isinstance(obj, cls)]
+        if positions:
+            for i, job in zip(positions, cls.get_jobs([objs[i] for i in positions])):
+                job.id = objs[i].get_db_obj_id()
+                jobs[i] = job
+    return jobs
+
+
+def bulk_update_state(objs, state):
+    objs = list(objs)
+    for cls in OBJECT_IN_QUEUE_CLASSES:
+        cls_objs = [obj for obj in objs if isinstance(obj, cls)]
+        if cls_objs:
+            cls.bulk_update_state(cls_objs, state)
+
+
+def group_jobs_by_problem(jobs):
+    '''
+    Groups jobs that share the same WorkerProblem object, keeping the order of first occurrences.
+    '''
+    groups = []
+    group_by_problem = {}
+    for job in jobs:
+        group = group_by_problem.get(id(job.problem))
+        if group is None:
+            group = WorkerTestingJobGroup(job.problem)
+            group_by_problem[id(job.problem)] = group
+            groups.append(group)
+        group.jobs.append(job)
+    return groups
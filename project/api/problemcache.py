@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.db.models import F
+
+from api.models import WorkerProblemRevision
+from api.serializers import WorkerProblemSerializer
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _make_key(problem_id, revision):
+    return 'api:workerproblem:{}:{}'.format(problem_id, revision)
+
+
+def invalidate_worker_problem(problem_id):
+    '''
+    Must be called whenever anything that is sent to workers with the problem changes:
+    name, file names, tests, limits, checker or libraries.
+
+    The revision is stored in DB, so all the processes see the change
+    at the moment the transaction is committed.
+    '''
+    rows_updated = WorkerProblemRevision.objects.filter(pk=problem_id).update(revision=F('revision') + 1)
+    if rows_updated == 0:
+        WorkerProblemRevision.objects.get_or_create(pk=problem_id, defaults={'revision': 1})
+
+
+def load_worker_problems(problems, make_workerproblems):
+    '''
+    Returns a dict {problem_id: data}, where data is serialized WorkerProblem.
+
+    Descriptors are taken from cache by (problem id, revision) key.
+    Missing ones are built by make_workerproblems(problems) that returns
+    a dict {problem_id: WorkerProblem}.
+    '''
+    problems = list(problems)
+    revisions = dict(WorkerProblemRevision.objects.
+                     filter(pk__in=[problem.id for problem in problems]).
+                     values_list('problem_id', 'revision'))
+    keys = {problem.id: _make_key(problem.id, revisions.get(problem.id, 0)) for problem in problems}
+
+    found = cache.get_many(keys.values())
+
+    missing_problems = [problem for problem in problems if keys[problem.id] not in found]
+    if missing_problems:
+        fresh = {}
+        for problem_id, wproblem in make_workerproblems(missing_problems).items():
+            fresh[keys[problem_id]] = WorkerProblemSerializer(wproblem).data
+        cache.set_many(fresh, CACHE_TIMEOUT)
+        found.update(fresh)
+
+    return {problem_id: found[key] for problem_id, key in keys.items()}
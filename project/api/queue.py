@@ -1,5 +1,7 @@
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection, transaction
+
+from rest_framework.settings import api_settings
 
 from solutions.models import Judgement
 
@@ -8,7 +10,11 @@ from api.workerchoose import choose_workers
 from api.workernotifier import WorkerNotifier
 from api.models import DbObjectInQueue
 from api.workerstructs import WorkerState
-from api.objectinqueue import create_object_in_queue
+from api.objectinqueue import bulk_update_state, create_object_in_queue, get_jobs
+from api.serializers import WorkerTestingJobSerializer
+
+# the queue objects are claimed under this name while being pushed to a worker
+PUSH_WORKER_NAME = 'push'
 
 
 def enqueue(obj, priority=10):
@@ -29,7 +35,7 @@ def bulk_enqueue(objs, priority=10):
     Works as the function above
     '''
     ts = timezone.now()
-    notifier = WorkerNotifier()
+    notifier = WorkerNotifier(push_job)
 
     db_objs = []
     for obj, worker in choose_workers(objs):
@@ -45,37 +51,153 @@ def bulk_enqueue(objs, priority=10):
     return notifier
 
 
-def dequeue(worker_name, worker_tag):
-    worker = identify_worker(worker_tag)
+def _waiting_objects(worker):
+    qs = DbObjectInQueue.objects.\
+        order_by('-priority', 'id').\
+        filter(state=DbObjectInQueue.WAITING)
+    return worker.filter_queue(qs)
 
-    while True:
-        qs = DbObjectInQueue.objects.\
-            order_by('-priority', 'id').\
-            filter(state=DbObjectInQueue.WAITING)
-        qs = worker.filter_queue(qs)
-        db_obj = qs.first()
 
-        if db_obj is None:
-            # no jobs
-            return None
+def _mark_claimed(db_obj, worker_name, ts):
+    db_obj.state = DbObjectInQueue.EXECUTING
+    db_obj.last_update_time = ts
+    db_obj.worker = worker_name
 
+
+def claim_many(worker, worker_name, limit):
+    '''
+    Moves up to `limit` first waiting objects suitable for the worker into EXECUTING state.
+    Returns the list of claimed DbObjectInQueue objects (empty if there is nothing to take).
+
+    When the database supports SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8, PostgreSQL),
+    concurrent workers lock different rows and never wait for each other.
+    Otherwise (SQLite) the rows are claimed optimistically with a conditional UPDATE
+    that skips the rows another worker has been faster to take.
+    In both cases an object is never given to two workers.
+    '''
+    if connection.features.has_select_for_update_skip_locked:
         with transaction.atomic():
-            rows_updated = DbObjectInQueue.objects.\
-                filter(pk=db_obj.pk, state=DbObjectInQueue.WAITING).\
-                update(state=DbObjectInQueue.EXECUTING, last_update_time=timezone.now(), worker=worker_name)
-            rows_updated = 1
+            db_objs = list(_waiting_objects(worker).select_for_update(skip_locked=True)[:limit])
+            if not db_objs:
+                return []
+
+            ts = timezone.now()
+            DbObjectInQueue.objects.\
+                filter(pk__in=[db_obj.pk for db_obj in db_objs]).\
+                update(state=DbObjectInQueue.EXECUTING, last_update_time=ts, worker=worker_name)
+            for db_obj in db_objs:
+                _mark_claimed(db_obj, worker_name, ts)
+            return db_objs
 
-            assert rows_updated in (0, 1)
-            if rows_updated == 0:
-                continue
+    while True:
+        db_objs = list(_waiting_objects(worker)[:limit])
+        if not db_objs:
+            return []
+
+        ts = timezone.now()
+        pks = [db_obj.pk for db_obj in db_objs]
+        rows_updated = DbObjectInQueue.objects.\
+            filter(pk__in=pks, state=DbObjectInQueue.WAITING).\
+            update(state=DbObjectInQueue.EXECUTING, last_update_time=ts, worker=worker_name)
+
+        if rows_updated == 0:
+            continue
+
+        if rows_updated < len(db_objs):
+            # some objects have been taken by other workers in the meantime
+            claimed_pks = set(DbObjectInQueue.objects.
+                              filter(pk__in=pks, state=DbObjectInQueue.EXECUTING, worker=worker_name, last_update_time=ts).
+                              values_list('pk', flat=True))
+            db_objs = [db_obj for db_obj in db_objs if db_obj.pk in claimed_pks]
+
+        for db_obj in db_objs:
+            _mark_claimed(db_obj, worker_name, ts)
+        return db_objs
+
+
+def claim(worker, worker_name):
+    '''
+    Works as claim_many() for a single object. Returns DbObjectInQueue or None.
+    '''
+    db_objs = claim_many(worker, worker_name, 1)
+    return db_objs[0] if db_objs else None
 
-            db_obj.refresh_from_db()
 
+def dequeue_many(worker_name, worker_tag, limit):
+    '''
+    Takes up to `limit` objects from the queue in one transaction.
+    Returns a list of IObjectInQueue.
+    '''
+    worker = identify_worker(worker_tag)
+
+    with transaction.atomic():
+        objs = []
+        for db_obj in claim_many(worker, worker_name, limit):
             obj = create_object_in_queue(db_obj)
             if obj is not None:
-                obj.update_state(WorkerState(Judgement.PREPARING))
-                return obj
-            return None
+                objs.append(obj)
+
+        bulk_update_state(objs, WorkerState(Judgement.PREPARING))
+        return objs
+
+
+def dequeue(worker_name, worker_tag):
+    objs = dequeue_many(worker_name, worker_tag, 1)
+    return objs[0] if objs else None
+
+
+def _put_back(db_obj, obj):
+    '''
+    Returns the object claimed by push_job() to the queue. obj is None if it has not been created.
+    '''
+    with transaction.atomic():
+        rows_updated = DbObjectInQueue.objects.\
+            filter(pk=db_obj.pk, state=DbObjectInQueue.EXECUTING, worker=PUSH_WORKER_NAME).\
+            update(state=DbObjectInQueue.WAITING, last_update_time=timezone.now())
+        if rows_updated == 1 and obj is not None:
+            bulk_update_state([obj], WorkerState(Judgement.WAITING))
+
+
+def push_job(worker, deliver):
+    '''
+    Takes the first waiting object for the worker and passes the job to deliver(payload),
+    where payload is the JSON that /jobs/take would return. deliver() returns the name
+    of the worker that has received the job, or None if nobody has (including a worker
+    that has gone before getting the job: the semaphore does not keep undelivered jobs).
+
+    Returns True if the job has been delivered. Otherwise the object is put back to the queue.
+    If deliver() raises, the job may have been delivered, so the object is left claimed
+    by PUSH_WORKER_NAME until it is cancelled or put back to the queue manually.
+    '''
+    db_obj = claim(worker, PUSH_WORKER_NAME)
+    if db_obj is None:
+        return False
+
+    obj = None
+    try:
+        obj = create_object_in_queue(db_obj)
+        if obj is None:
+            _put_back(db_obj, obj)
+            return False
+
+        # the state is set before delivery: the worker may report COMPILING at once
+        bulk_update_state([obj], WorkerState(Judgement.PREPARING))
+        job = get_jobs([obj])[0]
+        payload = api_settings.DEFAULT_RENDERER_CLASSES[0]().render(WorkerTestingJobSerializer(job).data)
+    except Exception:
+        _put_back(db_obj, obj)
+        raise
+
+    worker_name = deliver(payload)
+    if worker_name is None:
+        _put_back(db_obj, obj)
+        return False
+
+    if worker_name:
+        DbObjectInQueue.objects.\
+            filter(pk=db_obj.pk, worker=PUSH_WORKER_NAME).\
+            update(worker=worker_name)
+    return True
 
 
 def finalize(db_obj_id):
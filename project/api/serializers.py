@@ -119,13 +119,34 @@ class WorkerProblemSerializer(serializers.Serializer):
     default_time_limit = serializers.IntegerField()
 
 
+class WorkerProblemField(serializers.Field):
+    '''
+    Accepts both WorkerProblem objects and already serialized (cached) problem descriptors.
+    '''
+    def to_representation(self, obj):
+        if isinstance(obj, dict):
+            return obj
+        return WorkerProblemSerializer(obj).data
+
+
 class WorkerTestingJobSerializer(serializers.Serializer):
     id = serializers.IntegerField()
-    problem = WorkerProblemSerializer()
+    problem = WorkerProblemField()
+    solution = SolutionSerializer()
+    stop_after_first_failed_test = serializers.BooleanField()
+
+
+class WorkerBatchJobSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
     solution = SolutionSerializer()
     stop_after_first_failed_test = serializers.BooleanField()
 
 
+class WorkerTestingJobGroupSerializer(serializers.Serializer):
+    problem = WorkerProblemField()
+    jobs = WorkerBatchJobSerializer(many=True)
+
+
 class TestCaseResultSerializer(serializers.Serializer):
     outcome = OutcomeField()
     id = serializers.IntegerField(allow_null=True, default=None, source='test_case_id')
@@ -200,6 +221,13 @@ class WorkerGreetingSerializer(serializers.Serializer):
     def create(self, validated_data):
         return WorkerGreeting(**validated_data)
 
+
+MAX_BATCH_SIZE = 100
+
+
+class WorkerBatchGreetingSerializer(WorkerGreetingSerializer):
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_BATCH_SIZE, default=10)
+
 #
 # Plagiarism serializers
 #
@@ -224,6 +252,11 @@ class PlagiarismJobField(serializers.Field):
         return {"id": obj.id, "language": obj.language, "resourceId": obj.resource_id}
 
 
+class PlagiarismBatchGreetingSerializer(serializers.Serializer):
+    name = serializers.CharField(required=False, allow_blank=True, default='')
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_BATCH_SIZE, default=10)
+
+
 class PlagiarismJobSerializer(serializers.Serializer):
     solution = PlagiarismJobFieldSerializer(read_only=True)
     solutions = serializers.ListField(child=PlagiarismJobField())
@@ -1,3 +1,308 @@
+import json
+import socket
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from six.moves import http_client
+
+from problems.models import Problem, ProblemRelatedSourceFile
+from problems.models import TestCase as ProblemTestCase
+from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from solutions.models import Judgement, Solution
+from solutions.utils import judge
+from storage.models import FileMetadata
+from storage.resource_id import ResourceId
+
+from plagiarism.models import AggregatedResult, PendingSolution
+
+from api.models import DbObjectInQueue
+from api.problemcache import invalidate_worker_problem
+from api.queue import PUSH_WORKER_NAME, claim, push_job
+from api.worker import DefaultWorker, UnixWorker
+from api.workernotifier import NotificationDispatcher, PushNotConfirmed
+
+
+class ClaimTests(TestCase):
+    def _put(self, priority):
+        ts = timezone.now()
+        return DbObjectInQueue.objects.create(state=DbObjectInQueue.WAITING, creation_time=ts, last_update_time=ts, priority=priority)
+
+    def test_claim_order(self):
+        low = self._put(5)
+        high = self._put(10)
+        unix = self._put(0)
+
+        first = claim(DefaultWorker, 'w1')
+        second = claim(DefaultWorker, 'w2')
+        self.assertEqual(first.id, high.id)
+        self.assertEqual(second.id, low.id)
+        self.assertIsNone(claim(DefaultWorker, 'w3'))
+
+        self.assertEqual(claim(UnixWorker, 'u1').id, unix.id)
+        self.assertIsNone(claim(UnixWorker, 'u2'))
+
+    def test_claim_marks_object(self):
+        db_obj = self._put(10)
+        claim(DefaultWorker, 'w1')
+        db_obj.refresh_from_db()
+        self.assertEqual(db_obj.state, DbObjectInQueue.EXECUTING)
+        self.assertEqual(db_obj.worker, 'w1')
+
+
+class FakeResponse(object):
+    def __init__(self, status, worker_name=None):
+        self.status = status
+        self._worker_name = worker_name
+
+    def getheader(self, name):
+        return self._worker_name
+
+    def read(self):
+        return b''
+
+
+class FakeDispatcher(NotificationDispatcher):
+    def __init__(self, response):
+        super(FakeDispatcher, self).__init__('http://127.0.0.1:17083/', 1.)
+        self.response = response
+        self.requests = []
+
+    def _run(self):
+        # notifications are sent by flush() in tests
+        pass
+
+    def _request(self, worker, path, body, headers, retry=False):
+        self.requests.append((worker.TAG, path, headers.get('X-iRunner-Signal-Count')))
+        return self.response
+
+
+class FakeConnection(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.requests = 0
+
+    def request(self, method, url, body, headers):
+        self.requests += 1
+
+    def getresponse(self):
+        if self.error is not None:
+            raise self.error
+        return FakeResponse(200)
+
+    def close(self):
+        pass
+
+
+class NotificationDispatcherTests(TestCase):
+    def test_coalesce(self):
+        dispatcher = FakeDispatcher(FakeResponse(200))
+        dispatcher.enqueue([(DefaultWorker, 1)])
+        dispatcher.enqueue([(DefaultWorker, 3), (UnixWorker, 1)])
+        dispatcher.flush()
+
+        self.assertEqual(dispatcher.requests, [('', 'signal', '2'), ('unix', 'signal', '1')])
+        stats = dispatcher.get_stats()
+        self.assertEqual((stats['enqueued'], stats['coalesced'], stats['sent']), (3, 1, 2))
+
+    def test_unreachable(self):
+        dispatcher = FakeDispatcher(None)
+        dispatcher.enqueue([(DefaultWorker, 1)])
+        dispatcher.enqueue([(DefaultWorker, 1)])
+        dispatcher.flush()
+        self.assertEqual(dispatcher.get_stats()['dropped'], 2)
+
+    def test_push(self):
+        pushed = []
+
+        def push_job(worker, deliver):
+            if pushed:
+                return False
+            pushed.append(deliver(b'{}'))
+            return True
+
+        dispatcher = FakeDispatcher(FakeResponse(200, 'unix:1'))
+        dispatcher.enqueue([(UnixWorker, 2), (DefaultWorker, 1)], push_job)
+        dispatcher.flush()
+
+        self.assertEqual(pushed, ['unix:1'])
+        # the second job has not been pushed, the workers are signalled
+        self.assertEqual(dispatcher.requests, [('unix', 'push', None), ('unix', 'signal', '1'), ('', 'signal', '1')])
+        self.assertEqual(dispatcher.get_stats()['pushed'], 1)
+
+    def test_stale_connection(self):
+        dispatcher = NotificationDispatcher('http://127.0.0.1:17083/', 1.)
+        for path, retry, error, repeated in [
+            ('signal', True, http_client.RemoteDisconnected(), True),
+            ('signal', True, socket.timeout(), False),
+            ('push', False, http_client.RemoteDisconnected(), False),
+        ]:
+            stale = FakeConnection(error)
+            fresh = FakeConnection()
+            dispatcher._conn = stale
+            with mock.patch('api.workernotifier.http_client.HTTPConnection', return_value=fresh):
+                response = dispatcher._request(DefaultWorker, path, b'', {}, retry=retry)
+            self.assertEqual(response is not None, repeated)
+            self.assertEqual((stale.requests, fresh.requests), (1, 1 if repeated else 0))
+
+    def test_push_not_confirmed(self):
+        def push_job(worker, deliver):
+            return deliver(b'{}') is not None
+
+        for status, unconfirmed in [(404, 0), (500, 1)]:
+            dispatcher = FakeDispatcher(FakeResponse(status))
+            dispatcher.enqueue([(UnixWorker, 1)], push_job)
+            dispatcher.flush()
+            # the workers are signalled in both cases
+            self.assertEqual(dispatcher.requests[-1], ('unix', 'signal', '1'))
+            self.assertEqual(dispatcher.get_stats().get('unconfirmed', 0), unconfirmed)
+
+
+class TakeBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = get_user_model().objects.create(username='author')
+        compiler = Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP)
+
+        self.problems = []
+        for number in (1, 2):
+            problem = Problem.objects.create(number=number, full_name='Problem')
+            for ordinal_number in (1, 2, 3):
+                ProblemTestCase.objects.create(problem=problem, ordinal_number=ordinal_number, time_limit=1000,
+                                               input_resource_id=ResourceId(b'in'), answer_resource_id=ResourceId(b'out'))
+            ProblemRelatedSourceFile.objects.create(problem=problem, file_type=ProblemRelatedSourceFile.CHECKER, filename='check.cpp',
+                                                    size=0, resource_id=ResourceId(b'check'), compiler=compiler)
+            self.problems.append(problem)
+
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+        for problem in (self.problems[0], self.problems[1], self.problems[0]):
+            solution = Solution.objects.create(problem=problem, author=author, reception_time=timezone.now(),
+                                               source_code=source_code, compiler=compiler)
+            judge(solution)
+
+    def _take(self, limit):
+        return self.client.post(reverse('api:take_job_batch'), {'name': 'w', 'limit': limit},
+                                content_type='application/json', HTTP_WORKER_TOKEN=settings.WORKER_TOKEN)
+
+    def test_take_batch(self):
+        response = self._take(10)
+        self.assertEqual(response.status_code, 200)
+
+        groups = response.json()
+        self.assertEqual([group['problem']['id'] for group in groups], [p.id for p in self.problems])
+        self.assertEqual([len(group['jobs']) for group in groups], [2, 1])
+        for group in groups:
+            self.assertEqual(len(group['problem']['tests']), 3)
+            self.assertEqual(group['problem']['checker']['kind'], 'TESTLIB_H')
+
+        self.assertFalse(Judgement.objects.filter(status=Judgement.WAITING).exists())
+        self.assertEqual(self._take(10).status_code, 404)
+
+    def test_take_single(self):
+        response = self.client.post(reverse('api:take_job'), {'name': 'w'},
+                                    content_type='application/json', HTTP_WORKER_TOKEN=settings.WORKER_TOKEN)
+        job = response.json()
+        self.assertEqual(job['problem']['id'], self.problems[0].id)
+        self.assertEqual([test['isSample'] for test in job['problem']['tests']], [False] * 3)
+
+    def test_take_batch_limit(self):
+        response = self._take(2)
+        self.assertEqual(sum(len(group['jobs']) for group in response.json()), 2)
+        self.assertEqual(Judgement.objects.filter(status=Judgement.WAITING).count(), 1)
+
+    def test_problem_cache(self):
+        def take_time_limits():
+            groups = self._take(10).json()
+            DbObjectInQueue.objects.update(state=DbObjectInQueue.WAITING)
+            return [group['problem']['tests'][0]['timeLimit'] for group in groups]
+
+        self.assertEqual(take_time_limits(), [1000, 1000])
+
+        ProblemTestCase.objects.update(time_limit=2000)
+        self.assertEqual(take_time_limits(), [1000, 1000])
+
+        invalidate_worker_problem(self.problems[1].id)
+        self.assertEqual(take_time_limits(), [1000, 2000])
+
+    def test_push_job(self):
+        payloads = []
+
+        def deliver(payload):
+            payloads.append(json.loads(payload.decode('utf-8')))
+            return 'w'
+
+        self.assertTrue(push_job(DefaultWorker, deliver))
+        job = payloads[0]
+        self.assertEqual(job['problem']['id'], self.problems[0].id)
+        self.assertEqual(len(job['problem']['tests']), 3)
+
+        db_obj = DbObjectInQueue.objects.get(pk=job['id'])
+        self.assertEqual((db_obj.state, db_obj.worker), (DbObjectInQueue.EXECUTING, 'w'))
+        self.assertEqual(Judgement.objects.get(pk=db_obj.judgement_id).status, Judgement.PREPARING)
+
+    def test_push_job_not_delivered(self):
+        self.assertFalse(push_job(DefaultWorker, lambda payload: None))
+        self.assertFalse(DbObjectInQueue.objects.exclude(state=DbObjectInQueue.WAITING).exists())
+        self.assertFalse(DbObjectInQueue.objects.filter(worker=PUSH_WORKER_NAME, state=DbObjectInQueue.EXECUTING).exists())
+        self.assertEqual(Judgement.objects.filter(status=Judgement.WAITING).count(), 3)
+
+    def test_push_job_not_confirmed(self):
+        def deliver(payload):
+            raise PushNotConfirmed()
+
+        with self.assertRaises(PushNotConfirmed):
+            push_job(DefaultWorker, deliver)
+        # the job may have been delivered
+        db_obj = DbObjectInQueue.objects.get(state=DbObjectInQueue.EXECUTING)
+        self.assertEqual(db_obj.worker, PUSH_WORKER_NAME)
+        self.assertEqual(Judgement.objects.get(pk=db_obj.judgement_id).status, Judgement.PREPARING)
+
+    def test_push_job_failed(self):
+        with mock.patch('api.queue.get_jobs', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                push_job(DefaultWorker, lambda payload: 'w')
+        with mock.patch('api.queue.create_object_in_queue', return_value=None):
+            self.assertFalse(push_job(DefaultWorker, lambda payload: 'w'))
+
+        self.assertFalse(DbObjectInQueue.objects.exclude(state=DbObjectInQueue.WAITING).exists())
+        self.assertFalse(Judgement.objects.exclude(status=Judgement.WAITING).exists())
+
+
+class PlagiarismBatchTests(TestCase):
+    def setUp(self):
+        author = get_user_model().objects.create(username='author')
+        compiler = Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP)
+        problem = Problem.objects.create(number=1, full_name='Problem')
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+
+        self.solutions = []
+        for _ in range(3):
+            solution = Solution.objects.create(problem=problem, author=author, reception_time=timezone.now(),
+                                               source_code=source_code, compiler=compiler)
+            PendingSolution.objects.create(solution=solution, problem=problem, available_time=timezone.now())
+            self.solutions.append(solution)
+
+    def _take(self, limit):
+        return self.client.post(reverse('api:take_plagiarism_batch'), {'name': 'w', 'limit': limit},
+                                content_type='application/json', HTTP_WORKER_TOKEN=settings.WORKER_TOKEN)
+
+    def test_take_and_put(self):
+        response = self._take(2)
+        self.assertEqual(response.status_code, 200)
+        jobs = response.json()
+        self.assertEqual([job['solution']['id'] for job in jobs], [s.id for s in self.solutions[:2]])
+
+        reports = [{'id': job['solution']['id'], 'plagiarismLevel': 0., 'comparasion': []} for job in jobs]
+        response = self.client.put(reverse('api:put_plagiarism'), reports,
+                                   content_type='application/json', HTTP_WORKER_TOKEN=settings.WORKER_TOKEN)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AggregatedResult.objects.count(), 2)
 
-# Create your tests here.
+        self.assertEqual([job['solution']['id'] for job in self._take(10).json()], [self.solutions[2].id])
+        self.assertEqual(self._take(10).status_code, 404)
@@ -28,14 +28,19 @@ from contests.models import Printout
 import plagiarism.plagiarism_api
 
 from api.models import DbObjectInQueue
-from api.queue import dequeue, update, finalize
+from api.objectinqueue import get_jobs, group_jobs_by_problem
+from api.queue import dequeue, dequeue_many, update, finalize
+from api.workernotifier import get_dispatcher
 from api.workerstructs import WorkerFile
 from api.serializers import parse_resource_id
 from api.serializers import (
+    PlagiarismBatchGreetingSerializer,
     PlagiarismJobSerializer,
+    WorkerBatchGreetingSerializer,
     WorkerGreetingSerializer,
     WorkerFileSerializer,
     WorkerStateSerializer,
+    WorkerTestingJobGroupSerializer,
     WorkerTestingJobSerializer,
     WorkerTestingReportSerializer,
 )
@@ -69,7 +74,8 @@ class FileStatusView(WorkerAPIView):
         resource_ids = [parse_resource_id(s) for s in set(ids)]
 
         storage = create_storage()
-        availabilities = storage.check_availability(resource_ids)
+        # the worker will reference the files it has found instead of uploading them
+        availabilities = storage.check_availability(resource_ids, touch=True)
 
         result = {}
         for resource_id, avail in zip(resource_ids, availabilities):
@@ -138,6 +144,25 @@ class JobTakeView(WorkerAPIView):
         return Response(serializer.data)
 
 
+class JobTakeBatchView(WorkerAPIView):
+    '''
+    Takes up to `limit` jobs at once.
+    Jobs are grouped by problem, so the tests of a problem are listed once per group.
+    '''
+    def post(self, request, format=None):
+        serializer = WorkerBatchGreetingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        greeting = serializer.save()
+
+        objs = dequeue_many(greeting.name, greeting.tag, greeting.limit)
+        if not objs:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        groups = group_jobs_by_problem(get_jobs(objs))
+        serializer = WorkerTestingJobGroupSerializer(groups, many=True)
+        return Response(serializer.data)
+
+
 class JobPutResultView(WorkerAPIView):
     def put(self, request, job_id, format=None):
         serializer = WorkerTestingReportSerializer(data=request.data)
@@ -207,6 +232,7 @@ class QueueView(StaffMemberRequiredMixin, generic.View):
             'new_objects': new_objects,
             'last_done_objects': last_done_objects,
             'done_count': done_count,
+            'notifier_stats': sorted(get_dispatcher().get_stats().items()) if settings.SEMAPHORE else [],
         })
 
     def post(self, request):
@@ -229,18 +255,39 @@ class PlagiarismTakeView(WorkerAPIView):
         return self.post(request, format)
 
     def post(self, request, format=None):
-        job = plagiarism.plagiarism_api.get_testing_job()
+        jobs = plagiarism.plagiarism_api.get_testing_jobs()
 
-        if job is None:
+        if not jobs:
             raise Http404('Nothing to test')
 
-        serializer = PlagiarismJobSerializer(job)
+        serializer = PlagiarismJobSerializer(jobs[0])
+        return Response(serializer.data)
+
+
+class PlagiarismTakeBatchView(WorkerAPIView):
+    '''
+    Leases up to `limit` solutions at once.
+    The solutions that have not been reported within the lease time are given out again.
+    '''
+    def post(self, request, format=None):
+        serializer = PlagiarismBatchGreetingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        jobs = plagiarism.plagiarism_api.get_testing_jobs(serializer.validated_data['name'], serializer.validated_data['limit'])
+        if not jobs:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        serializer = PlagiarismJobSerializer(jobs, many=True)
         return Response(serializer.data)
 
 
 class PlagiarismPutView(WorkerAPIView):
+    '''
+    Accepts a report or a list of reports.
+    '''
     def put(self, request, format=None):
-        plagiarism.plagiarism_api.dump_plagiarism_report(request.data)
+        reports = request.data if isinstance(request.data, list) else [request.data]
+        plagiarism.plagiarism_api.dump_plagiarism_reports(reports)
         return Response(['ok'])
 
 
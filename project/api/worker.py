@@ -1,4 +1,7 @@
 class Worker(object):
+    # whether the worker can receive a job in the wake-up response of the semaphore
+    ACCEPTS_PUSH = False
+
     @classmethod
     def filter_queue(cls, db_obj_qs):
         raise NotImplementedError()
@@ -37,6 +40,7 @@ class UnixWorker(Worker):
     irunner-unix-worker
     '''
     TAG = 'unix'
+    ACCEPTS_PUSH = True
 
     @classmethod
     def filter_queue(cls, db_obj_qs):
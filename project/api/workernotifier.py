@@ -1,29 +1,224 @@
+import collections
+import logging
+import os
+import threading
+import time
+
 from django.conf import settings
+from django.db import close_old_connections, transaction
 
 from six.moves import urllib
 from six.moves import http_client
 
+# notifications that have not been sent within this time are counted as late
+LATE_THRESHOLD = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class PushNotConfirmed(Exception):
+    '''
+    The semaphore has not answered /push: the job may or may not have been given to a worker.
+    '''
+    pass
+
 
 class WorkerNotifier(object):
     '''
-    notify() should be called after the transaction has been committed
+    notify() may be called inside or after the transaction: the notifications
+    are passed to the background dispatcher when the transaction has been committed.
+
+    If `push_job` is given and the worker accepts pushed jobs, the jobs are claimed
+    and handed to idle workers by the semaphore directly (see api.queue.push_job).
+    The jobs nobody has taken are left to the workers that poll the queue.
     '''
-    def __init__(self):
-        self._workers = set()
+    def __init__(self, push_job=None):
+        self._workers = collections.OrderedDict()
+        self._push_job = push_job
 
     def add_worker(self, worker):
-        self._workers.add(worker)
+        self._workers[worker] = self._workers.get(worker, 0) + 1
 
     def notify(self):
-        if not settings.SEMAPHORE:
+        if not settings.SEMAPHORE or not self._workers:
             return
 
-        for worker in self._workers:
-            req = urllib.request.Request(settings.SEMAPHORE + 'signal', b'')
-            if worker.TAG:
-                req.add_header('X-iRunner-Worker-Tag', worker.TAG)
+        push_job = self._push_job if settings.SEMAPHORE_PUSH else None
+        workers = list(self._workers.items())
+        transaction.on_commit(lambda: get_dispatcher().enqueue(workers, push_job))
+
+
+class _Notification(object):
+    def __init__(self, enqueue_time, push_job):
+        self.enqueue_time = enqueue_time
+        self.push_job = push_job
+        self.signals = 0
+        self.jobs = 0
+
+
+class NotificationDispatcher(object):
+    '''
+    Sends notifications to the semaphore from a background thread over a persistent connection.
+
+    Notifications for the same worker that arrive while the previous ones are being sent
+    are merged into one request with X-iRunner-Signal-Count header, so a burst of submissions
+    costs a single round-trip.
+    A notification that cannot be delivered within the timeout is dropped: the workers
+    will find the job on their next poll of the queue.
+
+    The counters are kept per process:
+        enqueued    notify() calls
+        coalesced   notifications merged into a pending one
+        pushed      jobs given to idle workers
+        unconfirmed jobs that may have been given to workers, left claimed (see api.queue.push_job)
+        sent        signal requests
+        late        notifications sent later than LATE_THRESHOLD after enqueueing
+        dropped     notifications lost because the semaphore was unreachable
+    '''
+    def __init__(self, url, timeout):
+        parts = urllib.parse.urlsplit(url)
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = parts.path or '/'
+        self._timeout = timeout
+
+        self._cond = threading.Condition()
+        self._pending = collections.OrderedDict()
+        self._thread = None
+        self._pid = None
+        self._conn = None
+        self.stats = collections.Counter()
 
+    def enqueue(self, workers, push_job=None):
+        now = time.time()
+        with self._cond:
+            for worker, jobs in workers:
+                notification = self._pending.get(worker)
+                if notification is None:
+                    notification = _Notification(now, push_job)
+                    self._pending[worker] = notification
+                else:
+                    self.stats['coalesced'] += 1
+                notification.signals += 1
+                if push_job is not None and worker.ACCEPTS_PUSH:
+                    notification.jobs += jobs
+                self.stats['enqueued'] += 1
+
+            # the thread does not survive fork() of the web server process
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._conn = None
+                self._thread = threading.Thread(target=self._run, name='WorkerNotifier', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self.stats)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            close_old_connections()
+            self.flush()
+
+    def flush(self):
+        '''
+        Sends the pending notifications in the calling thread.
+        '''
+        with self._cond:
+            batch = self._pending
+            self._pending = collections.OrderedDict()
+
+        for worker, notification in batch.items():
             try:
-                urllib.request.urlopen(req).read()
-            except (urllib.error.URLError, http_client.HTTPException):
-                pass
+                self.process(worker, notification)
+            except Exception:
+                logger.exception('Failed to notify workers')
+                self._count('dropped', notification.signals)
+
+    def process(self, worker, notification):
+        jobs = notification.jobs
+        try:
+            while jobs > 0 and notification.push_job(worker, lambda payload: self._push(worker, payload)):
+                jobs -= 1
+                self._count('pushed')
+        except PushNotConfirmed:
+            self._count('unconfirmed')
+
+        if notification.jobs == 0 or jobs > 0:
+            response = self._request(worker, 'signal', b'', {'X-iRunner-Signal-Count': str(notification.signals)}, retry=True)
+            if response is None:
+                self._count('dropped', notification.signals)
+            else:
+                self._count('sent')
+
+        if time.time() - notification.enqueue_time > LATE_THRESHOLD:
+            self._count('late')
+
+    def _count(self, name, value=1):
+        with self._cond:
+            self.stats[name] += value
+
+    def _push(self, worker, payload):
+        '''
+        Returns the name of the worker that has received the payload, or None if nobody has.
+        Raises PushNotConfirmed if the semaphore has not said either.
+        '''
+        response = self._request(worker, 'push', payload, {'Content-Type': 'application/json'})
+        if response is not None and response.status == 404:
+            # there are no idle workers at the moment, or the worker has gone before getting the job
+            return None
+        if response is None or response.status != 200:
+            raise PushNotConfirmed()
+        return response.getheader('X-iRunner-Worker-Name') or ''
+
+    def _request(self, worker, path, body, headers, retry=False):
+        '''
+        Returns HTTPResponse (already read) or None if the semaphore is unreachable.
+        retry: the request may be repeated on a fresh connection if the server has closed
+        the idle keep-alive one. It must not be set for the requests that are not idempotent
+        (/push): the failed request may have been processed.
+        '''
+        headers = dict(headers)
+        if worker.TAG:
+            headers['X-iRunner-Worker-Tag'] = worker.TAG
+
+        while True:
+            reused = self._conn is not None
+            if not reused:
+                self._conn = http_client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            stale = False
+            try:
+                try:
+                    self._conn.request('POST', self._path + path, body, headers)
+                except (BrokenPipeError, ConnectionResetError):
+                    stale = True
+                    raise
+                try:
+                    response = self._conn.getresponse()
+                except http_client.RemoteDisconnected:
+                    # the server has closed the connection without a response
+                    stale = True
+                    raise
+                response.read()
+                return response
+            except (OSError, http_client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if not (retry and reused and stale):
+                    return None
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(settings.SEMAPHORE, settings.SEMAPHORE_TIMEOUT)
+        return _dispatcher
@@ -35,6 +35,12 @@ class WorkerTestingJob(object):
         self.stop_after_first_failed_test = False
 
 
+class WorkerTestingJobGroup(object):
+    def __init__(self, problem):
+        self.problem = problem
+        self.jobs = []
+
+
 class WorkerTestingReport(object):
     def __init__(self, outcome, first_failed_test, tests, score, max_score, logs,
                  general_failure_reason, general_failure_message, sample_tests_passed):
@@ -78,6 +84,7 @@ class WorkerValidator(object):
 
 
 class WorkerGreeting(object):
-    def __init__(self, name, tag):
+    def __init__(self, name, tag, limit=1):
         self.name = name
         self.tag = tag
+        self.limit = limit
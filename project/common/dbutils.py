@@ -26,3 +26,26 @@ def retry_deadlock(func):
                     raise
 
     return wrapper
+
+
+class MemberRoles(object):
+    '''
+    Loads roles of users in courses or contests: {group id -> list of roles}.
+    The roles are not cached across requests: the cache is not shared by the processes,
+    and memberships are also created in bulk. SolutionPermissionResolver remembers them
+    for the request.
+    '''
+    def __init__(self, membership_model, group_field):
+        self._model = membership_model
+        self._group_field = group_field
+
+    def get_many(self, group_ids, user):
+        result = {group_id: [] for group_id in group_ids}
+        if not user.is_authenticated or not result:
+            return result
+
+        for group_id, role in self._model.objects.\
+                filter(user=user, **{'{}_id__in'.format(self._group_field): list(result)}).\
+                values_list('{}_id'.format(self._group_field), 'role'):
+            result[group_id].append(role)
+        return result
@@ -1,12 +1,25 @@
 from __future__ import unicode_literals
 
-from django.core.exceptions import ImproperlyConfigured
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
 from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
 from django.http import Http404
 from django.utils.encoding import force_text
 
 SIZE = 'size'
 PAGE = 'page'
+AFTER = 'after'
+BEFORE = 'before'
+
+# the total number of objects in keyset mode is cached for this number of seconds
+COUNT_CACHE_TIMEOUT = 60
 
 
 class IRunnerPaginationContext(object):
@@ -18,6 +31,7 @@ class IRunnerPaginationContext(object):
         self.query_params_other = ''
         self.page_size_constants = []
         self.allow_all = False
+        self.keyset = False
 
 
 class SimplePage(object):
@@ -45,12 +59,115 @@ class SimplePage(object):
         return self._size * self.number
 
 
+class KeysetPage(object):
+    '''
+    A page of keyset pagination: the neighbouring pages are referred to by the cursors
+    made from the keys of the first and the last objects.
+    start_index is None if the position of the page is unknown.
+    '''
+    def __init__(self, object_list, previous_cursor, next_cursor, start_index):
+        self.object_list = object_list
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+        self._start_index = start_index
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def start_index(self):
+        return self._start_index
+
+    def end_index(self):
+        if self._start_index is None:
+            return None
+        return self._start_index + len(self.object_list) - 1
+
+
+def _encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, fields):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError()
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        raise Http404('Invalid cursor')
+
+
+def get_cached_count(queryset):
+    '''
+    Returns the number of objects in the queryset. The number is cached for COUNT_CACHE_TIMEOUT seconds.
+    '''
+    sql, params = queryset.query.sql_with_params()
+    key = 'pagination:count:{}'.format(hashlib.sha1(force_text((sql, params)).encode('utf-8')).hexdigest())
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class KeysetOrdering(object):
+    '''
+    The ordering of the queryset that is used as the key: model fields, the last one must be the primary key.
+    '''
+    def __init__(self, queryset):
+        self.names = []
+        self.descending = []
+        self.fields = []
+        opts = queryset.model._meta
+        for item in queryset.query.order_by:
+            if not isinstance(item, str) or '__' in item or item == '?':
+                raise ImproperlyConfigured('Keyset pagination requires ordering by fields of the model, not {}'.format(item))
+            name = item.lstrip('-')
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured('Keyset pagination requires ordering by fields of the model, not {}'.format(item))
+            self.names.append(field.attname)
+            self.descending.append(item.startswith('-'))
+            self.fields.append(field)
+        if not self.fields or not self.fields[-1].primary_key:
+            raise ImproperlyConfigured('Keyset pagination requires the ordering to end with the primary key')
+
+    def get_values(self, obj):
+        return [getattr(obj, name) for name in self.names]
+
+    def reversed_order_by(self):
+        return [name if descending else '-' + name for name, descending in zip(self.names, self.descending)]
+
+    def make_filter(self, values, backward):
+        '''
+        Returns a condition for the objects that follow (or precede if backward) the object with the given key.
+        '''
+        condition = None
+        for i in reversed(range(len(self.names))):
+            lookup = 'lt' if self.descending[i] != backward else 'gt'
+            clause = Q(**{'{}__{}'.format(self.names[i], lookup): values[i]})
+            if condition is not None:
+                clause |= Q(**{self.names[i]: values[i]}) & condition
+            condition = clause
+        return condition
+
+
 class IRunnerPaginator(object):
-    def __init__(self, default_page_size, allow_all, show_total_count):
+    def __init__(self, default_page_size, allow_all, show_total_count, keyset=False):
+        '''
+        keyset: page by the ordering of the queryset instead of OFFSET: the pages are referred to
+        by cursors, and deep pages are as fast as the first one. The ordering must end with the primary key.
+        '''
         self.default_page_size = default_page_size
         self.allow_all = allow_all
         self.page_size_constants = [7, 12, 25, 50, 100]
         self.show_total_count = show_total_count
+        self.keyset = keyset
 
     @staticmethod
     def _get_int_param(request, name, default=None, special={}):
@@ -133,11 +250,65 @@ class IRunnerPaginator(object):
         params = request.GET.copy()
         params.pop(SIZE, None)
         params.pop(PAGE, None)
+        params.pop(AFTER, None)
+        params.pop(BEFORE, None)
         result = params.urlencode()
         if result:
             result = '&' + result
         return result
 
+    def _paginate_by_keyset(self, request, queryset, page_size, object_count):
+        ordering = KeysetOrdering(queryset)
+        after = request.GET.get(AFTER)
+        before = request.GET.get(BEFORE)
+        start_index = None
+
+        if after is not None or before is not None:
+            backward = after is None
+            values = _decode_cursor(before if backward else after, ordering.fields)
+            qs = queryset.filter(ordering.make_filter(values, backward))
+            if backward:
+                qs = qs.order_by(*ordering.reversed_order_by())
+            objects = list(qs[:page_size + 1])
+            has_more = len(objects) > page_size
+            del objects[page_size:]
+            if backward:
+                objects.reverse()
+                has_previous, has_next = has_more, True
+            else:
+                has_previous, has_next = True, has_more
+        else:
+            special = {'last': -1}
+            page_number = self._parse_page_number(request, special=special)
+            if page_number == -1:
+                # the last page
+                objects = list(queryset.order_by(*ordering.reversed_order_by())[:page_size + 1])
+                has_previous = len(objects) > page_size
+                del objects[page_size:]
+                objects.reverse()
+                has_next = False
+                if object_count is not None:
+                    start_index = object_count - len(objects) + 1
+            else:
+                # the old links with page numbers still work
+                bottom = (max(page_number, 1) - 1) * page_size
+                objects = list(queryset[bottom:bottom + page_size + 1])
+                has_next = len(objects) > page_size
+                del objects[page_size:]
+                has_previous = bottom > 0
+                start_index = bottom + 1
+
+        if not objects:
+            has_previous = has_next = False
+            start_index = None
+        page = KeysetPage(
+            objects,
+            _encode_cursor(ordering.get_values(objects[0])) if has_previous else None,
+            _encode_cursor(ordering.get_values(objects[-1])) if has_next else None,
+            start_index,
+        )
+        return page
+
     def paginate(self, request, queryset):
         '''
         Returns a dict
@@ -159,7 +330,13 @@ class IRunnerPaginator(object):
         pc.query_params_other = self._get_other_query_params(request)
         pc.allow_all = self.allow_all
 
-        if page_size == 0:
+        if page_size != 0 and self.keyset:
+            pc.keyset = True
+            pc.object_count = get_cached_count(queryset) if self.show_total_count else None
+            pc.page_obj = self._paginate_by_keyset(request, queryset, page_size, pc.object_count)
+            actual_queryset = pc.page_obj.object_list
+
+        elif page_size == 0:
             # no pagination
             actual_queryset = queryset
 
@@ -7,10 +7,11 @@ class IRunnerBaseListView(generic.list.MultipleObjectMixin, generic.View):
     allow_all = True
     paginate_by = 25
     show_total_count = True
+    keyset = False
 
     def get_context_data(self, **kwargs):
         queryset = kwargs.pop('object_list', self.object_list)
-        p = IRunnerPaginator(self.paginate_by, self.allow_all, self.show_total_count)
+        p = IRunnerPaginator(self.paginate_by, self.allow_all, self.show_total_count, self.keyset)
         context = p.paginate(self.request, queryset)
         context.update(**kwargs)
         return super(generic.list.MultipleObjectMixin, self).get_context_data(**context)
@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+import hashlib
+
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name
 from pygments.formatters import HtmlFormatter
@@ -12,6 +14,8 @@ from django.utils.html import mark_safe
 
 from common.highlight import get_highlight_style
 from proglangs.utils import get_pygments_lexer
+from storage.resource_id import ResourceId
+from storage.storage import create_derived_cache
 
 register = template.Library()
 
@@ -25,13 +29,9 @@ def irunner_sourcecode_css(context):
     return mark_safe('<style type="text/css">{0}</style>'.format(styles))
 
 
-@register.simple_tag(takes_context=False)
-def irunner_sourcecode(code, language, hrefs=False):
-    if code is None:
-        return ''
-
+def _highlight(code, lexer_name, hrefs):
     try:
-        lexer = get_lexer_by_name(get_pygments_lexer(language))
+        lexer = get_lexer_by_name(lexer_name)
     except ClassNotFound:
         lexer = get_lexer_by_name('text')  # Null lexer, does not highlight anything
 
@@ -40,6 +40,20 @@ def irunner_sourcecode(code, language, hrefs=False):
     else:
         formatter = HtmlFormatter(linenos='table')
 
-    result = highlight(code, lexer, formatter)
+    return highlight(code, lexer, formatter)
+
+
+@register.simple_tag(takes_context=False)
+def irunner_sourcecode(code, language, hrefs=False):
+    if code is None:
+        return ''
+
+    # the code is identified by its own hash: it may be a truncated file
+    resource_id = ResourceId(hashlib.sha1(code.encode('utf-8', 'surrogatepass')).digest())
+    lexer_name = get_pygments_lexer(language)
+    result = create_derived_cache().get_or_make(
+        resource_id, 'pygments', (lexer_name, hrefs),
+        lambda _: _highlight(code, lexer_name, hrefs)
+    )
 
     return mark_safe('<div class="ir-pygments codehilite">{0}</div>'.format(result))
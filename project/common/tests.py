@@ -4,8 +4,13 @@ from __future__ import unicode_literals
 
 import datetime
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
 
+from common.pagination import paginate
 from common.templatetags.irunner_time import irunner_timedelta_hms, irunner_timedelta_humanized
 from common.locales.tests import *  # noqa
 from common.pylightex.tests import *  # noqa
@@ -33,3 +38,62 @@ class TimeTagsTests(TestCase):
         dt = datetime.timedelta(days=7, hours=23, minutes=59, seconds=59)
         self.assertEqual(irunner_timedelta_hms(dt), '7 дней, 23:59:59')
         self.assertEqual(irunner_timedelta_humanized(dt), '7\xa0дней 23\xa0часа')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        for i in range(23):
+            # the ties are ordered by id
+            get_user_model().objects.create(username='user{}'.format(i), date_joined=now - datetime.timedelta(microseconds=i // 3))
+        self.queryset = get_user_model().objects.order_by('-date_joined', 'id')
+        self.expected = list(self.queryset.values_list('id', flat=True))
+        self.factory = RequestFactory()
+
+    def _paginate(self, **params):
+        context = paginate(self.factory.get('/', params), self.queryset, 7, keyset=True)
+        page = context['pagination_context'].page_obj
+        return page, [user.id for user in context['object_list']]
+
+    def test_forward_and_backward(self):
+        pages = []
+        page, ids = self._paginate()
+        self.assertFalse(page.has_previous())
+        self.assertEqual(page.start_index(), 1)
+        pages.append(ids)
+        while page.has_next():
+            page, ids = self._paginate(after=page.next_cursor)
+            pages.append(ids)
+        self.assertEqual([len(ids) for ids in pages], [7, 7, 7, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        backward = []
+        while page.has_previous():
+            page, ids = self._paginate(before=page.previous_cursor)
+            backward.append(ids)
+        self.assertEqual(backward, pages[-2::-1])
+
+    def test_last_page_and_page_numbers(self):
+        page, ids = self._paginate(page='last')
+        self.assertEqual(ids, self.expected[-7:])
+        self.assertEqual((page.start_index(), page.end_index()), (17, 23))
+        self.assertFalse(page.has_next())
+
+        page, ids = self._paginate(page=2)
+        self.assertEqual(ids, self.expected[7:14])
+        page, ids = self._paginate(after=page.next_cursor)
+        self.assertEqual(ids, self.expected[14:21])
+
+    def test_cached_count(self):
+        context = paginate(self.factory.get('/'), self.queryset, 7, keyset=True)
+        self.assertEqual(context['pagination_context'].object_count, 23)
+        get_user_model().objects.create(username='new')
+        with self.assertNumQueries(1):
+            context = paginate(self.factory.get('/'), self.queryset, 7, keyset=True)
+            list(context['object_list'])
+        self.assertEqual(context['pagination_context'].object_count, 23)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self._paginate(after='garbage')
@@ -1,6 +1,6 @@
 from solutions.permissions import SolutionAccessLevel, SolutionPermissions
 
-from .models import Contest, Membership, UnauthorizedAccessLevel
+from .models import Contest, Membership, UnauthorizedAccessLevel, member_roles
 from .permissions import ContestPermissions, InContestAccessPermissions
 from .services import ContestTiming, create_contest_service
 
@@ -17,21 +17,32 @@ class ContestMemberFlags(object):
 
     @staticmethod
     def load(contest, user):
-        flags = ContestMemberFlags()
+        return ContestMemberFlags.load_many([contest], user)[contest.id]
 
-        if user.is_authenticated:
-            for role in Membership.objects.filter(contest=contest, user=user).values_list('role', flat=True):
-                if role == Membership.CONTESTANT:
-                    flags.is_contestant = True
-                elif role == Membership.JUROR:
-                    flags.is_juror = True
-
-            # if is_instance_owned(contest, user):
-            #    flags.is_admin = True
-            if user.is_staff:
-                flags.is_admin = True
-
-        return flags
+    @staticmethod
+    def load_many(contests, user):
+        '''
+        Returns a dict {contest_id: ContestMemberFlags}.
+        '''
+        roles = member_roles.get_many([contest.id for contest in contests], user)
+        result = {}
+        for contest in contests:
+            flags = ContestMemberFlags()
+
+            if user.is_authenticated:
+                for role in roles[contest.id]:
+                    if role == Membership.CONTESTANT:
+                        flags.is_contestant = True
+                    elif role == Membership.JUROR:
+                        flags.is_juror = True
+
+                # if is_instance_owned(contest, user):
+                #    flags.is_admin = True
+                if user.is_staff:
+                    flags.is_admin = True
+
+            result[contest.id] = flags
+        return result
 
 
 def calculate_contest_permissions(contest, member_flags):
@@ -57,22 +68,17 @@ def calculate_contest_permissions(contest, member_flags):
     return permissions
 
 
-def calculate_contest_solution_permissions_ex(solution, user):
+def make_contest_solution_permissions(contest, member_flags, solution, user):
     permissions = SolutionPermissions()
 
-    contest = Contest.objects.filter(contestsolution__solution_id=solution.id).first()
     if contest is None:
         # the solution does not belong to any contest
         return InContestAccessPermissions(None, False, permissions)
 
-    timing = ContestTiming(contest)
-    service = create_contest_service(contest)
-    member_flags = ContestMemberFlags.load(contest, user)
-
     if member_flags.is_contestant and solution.author_id == user.id:
         cp = SolutionPermissions()
         cp.update(contest.contestant_own_solutions_access)
-        if not service.should_show_my_solutions_completely(timing):
+        if not create_contest_service(contest).should_show_my_solutions_completely(ContestTiming(contest)):
             cp.deny_view_state()
         permissions |= cp
 
@@ -85,3 +91,9 @@ def calculate_contest_solution_permissions_ex(solution, user):
     # `permissions` remains default-constructed if user is not a member of the contest
 
     return InContestAccessPermissions(contest, bool(member_flags), permissions)
+
+
+def calculate_contest_solution_permissions_ex(solution, user):
+    contest = Contest.objects.filter(contestsolution__solution_id=solution.id).first()
+    member_flags = ContestMemberFlags.load(contest, user) if contest is not None else None
+    return make_contest_solution_permissions(contest, member_flags, solution, user)
@@ -1,6 +1,8 @@
+import io
 import xml.dom.minidom
 import xml.etree.ElementTree as ET
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.encoding import smart_text
 from django.utils import timezone
 
@@ -12,23 +14,84 @@ from contests.services import SolutionKind
 from contests.services import total_minutes, total_seconds
 
 
-def export_to_s4ris_json(contest, results):
-    runs = [{
+# the streaming exporters give the output to the web server by chunks of about this size
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_JSON_BATCH_SIZE = 1000
+
+
+def _join_chunks(parts):
+    chunk = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _is_exported(run):
+    return run.kind in (SolutionKind.ACCEPTED, SolutionKind.REJECTED)
+
+
+def _make_s4ris_run(run):
+    return {
         'contestant': run.user.get_full_name(),
         'problemLetter': run.labeled_problem.letter,
         'timeMinutesFromStart': total_minutes(run.when),
         'success': (run.kind is SolutionKind.ACCEPTED),
-    } for run in results.all_runs if run.kind in (SolutionKind.ACCEPTED, SolutionKind.REJECTED)]
+    }
+
 
-    json = {
+def export_to_s4ris_json(contest, results):
+    runs = [_make_s4ris_run(run) for run in results.all_runs if _is_exported(run)]
+
+    data = {
         'contestName': smart_text(contest),
         'problemLetters': [lp.letter for lp in results.contest_descr.labeled_problems],
         'contestants': [ur.user.get_full_name() for ur in results.user_results],
         'runs': runs
     }
     if contest.freeze_time is not None:
-        json['freezeTimeMinutesFromStart'] = total_minutes(contest.freeze_time)
-    return json
+        data['freezeTimeMinutesFromStart'] = total_minutes(contest.freeze_time)
+    return data
+
+
+def _generate_s4ris_json(contest, results):
+    # as JsonResponse(..., json_dumps_params={'ensure_ascii': False}) does
+    dump = DjangoJSONEncoder(ensure_ascii=False).encode
+
+    yield '{{"contestName": {}, "problemLetters": {}, "contestants": {}, "runs": ['.format(
+        dump(smart_text(contest)),
+        dump([lp.letter for lp in results.contest_descr.labeled_problems]),
+        dump([ur.user.get_full_name() for ur in results.user_results]),
+    )
+    # the runs are encoded by batches: a list without brackets is the same as its items joined by ', '
+    separator = ''
+    batch = []
+    for run in results.all_runs:
+        if _is_exported(run):
+            batch.append(_make_s4ris_run(run))
+            if len(batch) == EXPORT_JSON_BATCH_SIZE:
+                yield separator + dump(batch)[1:-1]
+                separator = ', '
+                batch = []
+    if batch:
+        yield separator + dump(batch)[1:-1]
+    yield ']'
+    if contest.freeze_time is not None:
+        yield ', "freezeTimeMinutesFromStart": {}'.format(dump(total_minutes(contest.freeze_time)))
+    yield '}'
+
+
+def stream_s4ris_json(contest, results):
+    '''
+    Yields the same text as export_to_s4ris_json() serialized by JsonResponse does.
+    '''
+    return _join_chunks(_generate_s4ris_json(contest, results))
 
 
 EJUDGE_DATETIME_FORMAT = '%Y/%m/%d %H:%M:%S'
@@ -121,3 +184,149 @@ def export_to_ejudge_xml(contest, results):
     xml_data = ET.tostring(root, 'utf-8')
     reparsed = xml.dom.minidom.parseString(xml_data)
     return reparsed.toprettyxml()
+
+
+def _iterate_exported_runs(contest, results):
+    '''
+    Yields (run, solution) where solution is (reception_time, id, author_id, problem_id, compiler_id,
+    judgement status, judgement outcome, judgement test number).
+
+    Both the runs and the solutions are ordered by reception time and id, so they are merged in a single pass
+    without loading the solutions into memory.
+    '''
+    solutions = Solution.objects.\
+        filter(contestsolution__contest=contest).\
+        filter(reception_time__gte=contest.start_time, reception_time__lt=contest.start_time+contest.duration).\
+        order_by('reception_time', 'id').\
+        values_list('reception_time', 'id', 'author_id', 'problem_id', 'compiler_id',
+                    'best_judgement__status', 'best_judgement__outcome', 'best_judgement__test_number').\
+        iterator()
+    solution = next(solutions, None)
+
+    for run in results.all_runs:
+        if not _is_exported(run):
+            continue
+        key = (contest.start_time + run.when, run.solution_id)
+        while solution is not None and solution[:2] < key:
+            solution = next(solutions, None)
+        if solution is None or solution[1] != run.solution_id:
+            # something strange
+            continue
+        yield run, solution
+
+
+class _PrettyXmlWriter(object):
+    '''
+    Writes the elements the way xml.dom.minidom's toprettyxml() does.
+    '''
+    def __init__(self):
+        self._document = xml.dom.minidom.Document()
+
+    def _write(self, node, indent):
+        writer = io.StringIO()
+        node.writexml(writer, indent, '\t', '\n')
+        return writer.getvalue()
+
+    def header(self):
+        return self._write(self._document, '')
+
+    def element(self, depth, tag, attrs, text=None):
+        elem = self._document.createElement(tag)
+        for name, value in attrs:
+            elem.setAttribute(name, value)
+        if text:
+            elem.appendChild(self._document.createTextNode(text))
+        return self._write(elem, '\t' * depth)
+
+    def open(self, depth, tag, attrs=()):
+        empty = self.element(depth, tag, attrs)
+        return empty[:-len('/>\n')] + '>\n'
+
+    def close(self, depth, tag):
+        return '{}</{}>\n'.format('\t' * depth, tag)
+
+    def container(self, depth, tag, children):
+        '''
+        Yields the element with children given as strings.
+        '''
+        first = True
+        for child in children:
+            if first:
+                yield self.open(depth, tag)
+                first = False
+            yield child
+        if first:
+            yield self.element(depth, tag, ())
+        else:
+            yield self.close(depth, tag)
+
+
+def _make_ejudge_runlog_attrs(contest):
+    attrs = [
+        ('contest_id', smart_text(contest.id)),
+        ('duration', smart_text(total_seconds(contest.duration))),
+        ('sched_start_time', as_ejudge_ts(contest.start_time)),
+        ('start_time', as_ejudge_ts(contest.start_time)),
+        ('stop_time', as_ejudge_ts(contest.start_time + contest.duration)),
+        ('current_time', as_ejudge_ts(timezone.now())),
+    ]
+    if contest.freeze_time is not None:
+        attrs.append(('fog_time', smart_text(total_seconds(contest.duration - contest.freeze_time))))
+    return attrs
+
+
+def _generate_ejudge_xml(contest, results):
+    w = _PrettyXmlWriter()
+
+    yield w.header()
+    yield w.open(0, 'runlog', _make_ejudge_runlog_attrs(contest))
+    yield w.element(1, 'name', (), smart_text(contest))
+
+    def make_users():
+        for ur in results.user_results:
+            attrs = [('id', smart_text(ur.user.id)), ('name', ur.user.get_full_name()), ('username', ur.user.username)]
+            if ur.members:
+                attrs.append(('members', ur.members))
+            yield w.element(2, 'user', attrs)
+
+    yield from w.container(1, 'users', make_users())
+
+    yield from w.container(1, 'problems', (
+        w.element(2, 'problem', [
+            ('id', smart_text(lp.problem.id)),
+            ('short_name', smart_text(lp.letter)),
+            ('long_name', smart_text(lp.problem.full_name)),
+        ]) for lp in results.contest_descr.labeled_problems
+    ))
+
+    # the languages precede the runs, so the runs are looked through twice
+    compiler_ids = set(solution[4] for _, solution in _iterate_exported_runs(contest, results))
+    yield from w.container(1, 'languages', (
+        w.element(2, 'language', [
+            ('id', smart_text(compiler.id)),
+            ('short_name', compiler.handle),
+            ('long_name', compiler.description),
+        ]) for compiler in Compiler.objects.filter(pk__in=compiler_ids)
+    ))
+
+    def make_runs():
+        # the attributes are numbers and outcome codes: the lines are formatted directly, it is much faster
+        for run, (_, solution_id, author_id, problem_id, compiler_id, status, outcome, test_number) in \
+                _iterate_exported_runs(contest, results):
+            judgement_attrs = ''
+            if status == Judgement.DONE:
+                judgement_attrs = ' status="{}"'.format(EJUDGE_OUTCOME_CODES.get(outcome, ''))
+                if test_number != 0:
+                    judgement_attrs += ' test="{}"'.format(test_number)
+            yield '\t\t<run run_id="{}" time="{}"{} user_id="{}" prob_id="{}" lang_id="{}" nsec="0"/>\n'.format(
+                solution_id, total_seconds(run.when), judgement_attrs, author_id, problem_id, compiler_id)
+
+    yield from w.container(1, 'runs', make_runs())
+    yield w.close(0, 'runlog')
+
+
+def stream_ejudge_xml(contest, results):
+    '''
+    Yields the same text as export_to_ejudge_xml() returns.
+    '''
+    return _join_chunks(_generate_ejudge_xml(contest, results))
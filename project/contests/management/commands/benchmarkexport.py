@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import re
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from contests.exporting import export_to_ejudge_xml, export_to_s4ris_json, stream_ejudge_xml, stream_s4ris_json
+from contests.services import create_contest_service
+
+from .benchmarkstandings import Rollback, _fill_contest
+
+
+def _s4ris_json(contest, results):
+    return JsonResponse(export_to_s4ris_json(contest, results), json_dumps_params={'ensure_ascii': False})
+
+
+def _s4ris_json_streaming(contest, results):
+    return StreamingHttpResponse(stream_s4ris_json(contest, results), content_type='application/json')
+
+
+def _ejudge_xml(contest, results):
+    return HttpResponse(export_to_ejudge_xml(contest, results), content_type='application/xml; charset=utf-8')
+
+
+def _ejudge_xml_streaming(contest, results):
+    return StreamingHttpResponse(stream_ejudge_xml(contest, results), content_type='application/xml; charset=utf-8')
+
+
+def _send(response):
+    '''
+    Passes the response to nowhere as a web server does, returns the number of bytes.
+    '''
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def _measure(func, contest, results):
+    t1 = time.time()
+    size = _send(func(contest, results))
+    t2 = time.time()
+
+    tracemalloc.start()
+    _send(func(contest, results))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, t2 - t1, peak
+
+
+def _get_content(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def _strip_current_time(data):
+    return re.sub(br' current_time="[^"]*"', b'', data)
+
+
+class Command(BaseCommand):
+    help = 'Compares the exporters of standings that build the whole document with the streaming ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-u', '--users', type=int, default=1000)
+        parser.add_argument('-p', '--problems', type=int, default=15)
+        parser.add_argument('-r', '--runs', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        rng = random.Random(1)
+
+        try:
+            with transaction.atomic():
+                t1 = time.time()
+                contest, _, _, _, _ = _fill_contest(options['users'], options['problems'], options['runs'], rng)
+                logger.info('Test contest has been filled in %.1f s', time.time() - t1)
+
+                results = create_contest_service(contest).make_contest_results(contest, frozen=False)
+                logger.info('%d runs', len(results.all_runs))
+
+                print('exporter\tseconds\tpeak MB\tbytes')
+                for name, func, streaming_func in [
+                    ('s4ris', _s4ris_json, _s4ris_json_streaming),
+                    ('ejudge', _ejudge_xml, _ejudge_xml_streaming),
+                ]:
+                    for label, f in [(name, func), (name + ', streaming', streaming_func)]:
+                        size, elapsed, peak = _measure(f, contest, results)
+                        print('{}\t{:.3f}\t{:.1f}\t{}'.format(label, elapsed, peak / 2.**20, size))
+
+                    expected = _get_content(func(contest, results))
+                    actual = _get_content(streaming_func(contest, results))
+                    if _strip_current_time(actual) != _strip_current_time(expected):
+                        logger.error('The output of the streaming %s exporter differs', name)
+
+                raise Rollback()
+        except Rollback:
+            pass
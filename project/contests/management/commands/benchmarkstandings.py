@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from common.outcome import Outcome
+from problems.models import Problem
+from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from solutions.models import Judgement, Solution
+from storage.models import FileMetadata
+from storage.resource_id import ResourceId
+from users.models import UserProfile
+
+from contests.models import Contest, ContestProblem, ContestSolution, Membership, register_solution_changes
+from contests.services import (
+    ACMUserResult,
+    ColumnPresence,
+    _make_cached_contest_results,
+    _make_contest_results,
+    _make_standings_key,
+)
+
+USERNAME_PREFIX = 'standings-benchmark-'
+OUTCOMES = [Outcome.ACCEPTED, Outcome.WRONG_ANSWER, Outcome.TIME_LIMIT_EXCEEDED, Outcome.COMPILATION_ERROR]
+
+
+class Rollback(Exception):
+    pass
+
+
+def _fill_contest(num_users, num_problems, num_runs, rng):
+    start_time = timezone.now() - timezone.timedelta(hours=4)
+    contest = Contest.objects.create(name='Standings benchmark', start_time=start_time,
+                                     duration=timezone.timedelta(hours=5), freeze_time=timezone.timedelta(hours=4))
+
+    Problem.objects.bulk_create(Problem(number=100500 + i, full_name='Problem') for i in range(num_problems))
+    problem_ids = list(Problem.objects.filter(number__gte=100500).order_by('number').values_list('pk', flat=True))[:num_problems]
+    ContestProblem.objects.bulk_create(
+        ContestProblem(contest=contest, problem_id=problem_id, ordinal_number=i) for i, problem_id in enumerate(problem_ids)
+    )
+
+    get_user_model().objects.bulk_create(get_user_model()(username='{}{}'.format(USERNAME_PREFIX, i)) for i in range(num_users))
+    user_ids = list(get_user_model().objects.filter(username__startswith=USERNAME_PREFIX).values_list('pk', flat=True))
+    UserProfile.objects.bulk_create(UserProfile(user_id=user_id) for user_id in user_ids)
+    Membership.objects.bulk_create(Membership(user_id=user_id, contest=contest, role=Membership.CONTESTANT) for user_id in user_ids)
+
+    compiler = Compiler.objects.create(handle='standings-benchmark', language=ProgrammingLanguage.CPP)
+    source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+    Solution.objects.bulk_create((
+        Solution(problem_id=rng.choice(problem_ids), author_id=rng.choice(user_ids), source_code=source_code, compiler=compiler,
+                 reception_time=start_time + timezone.timedelta(seconds=rng.randrange(4 * 60 * 60)))
+        for _ in range(num_runs)
+    ), batch_size=1000)
+    solutions = Solution.objects.filter(compiler=compiler)
+
+    Judgement.objects.bulk_create((
+        Judgement(solution_id=solution_id, status=Judgement.DONE, outcome=rng.choice(OUTCOMES),
+                  score=rng.randrange(11), max_score=10, sample_tests_passed=True)
+        for solution_id in solutions.values_list('pk', flat=True)
+    ), batch_size=1000)
+    solutions.update(best_judgement=Subquery(Judgement.objects.filter(solution=OuterRef('pk')).values('pk')[:1]))
+    ContestSolution.objects.bulk_create((
+        ContestSolution(contest=contest, solution_id=solution_id) for solution_id in solutions.values_list('pk', flat=True)
+    ), batch_size=1000)
+
+    return contest, user_ids, problem_ids, compiler, source_code
+
+
+def _measure(func, repeat):
+    t1 = time.time()
+    for _ in range(repeat):
+        result = func()
+    t2 = time.time()
+    return result, (t2 - t1) / repeat
+
+
+def _describe(results):
+    return [(ur.user.id, ur.get_place(), ur.get_key(), [pr.as_html() for pr in ur.problem_results]) for ur in results.user_results]
+
+
+class Command(BaseCommand):
+    help = 'Compares the full recomputation of contest standings with the cached standings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-u', '--users', type=int, default=1000)
+        parser.add_argument('-p', '--problems', type=int, default=15)
+        parser.add_argument('-r', '--runs', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        rng = random.Random(1)
+        repeat = options['repeat']
+        column_presence = ColumnPresence(True, True, False)
+
+        try:
+            with transaction.atomic():
+                t1 = time.time()
+                contest, user_ids, problem_ids, compiler, source_code = _fill_contest(options['users'], options['problems'], options['runs'], rng)
+                logger.info('Test contest has been filled in %.1f s', time.time() - t1)
+
+                def full():
+                    return _make_contest_results(contest, False, ACMUserResult, column_presence, None)
+
+                def cached():
+                    return _make_cached_contest_results(contest, False, ACMUserResult, column_presence, None)
+
+                key = _make_standings_key(contest.id, None, ACMUserResult.problem_result_class)
+                cache.delete(key)
+
+                print('mode\tseconds')
+                expected, elapsed = _measure(full, repeat)
+                print('full recomputation\t{:.4f}'.format(elapsed))
+
+                def cold():
+                    cache.delete(key)
+                    return cached()
+
+                _, elapsed = _measure(cold, repeat)
+                print('cached, cold cache\t{:.4f}'.format(elapsed))
+
+                actual, elapsed = _measure(cached, repeat)
+                print('cached, no changes\t{:.4f}'.format(elapsed))
+
+                elapsed = 0.
+                for _ in range(repeat):
+                    solution = Solution.objects.create(problem_id=rng.choice(problem_ids), author_id=rng.choice(user_ids),
+                                                       source_code=source_code, compiler=compiler, reception_time=timezone.now())
+                    ContestSolution.objects.create(contest=contest, solution=solution)
+                    register_solution_changes([solution.id])
+                    elapsed += _measure(cached, 1)[1]
+                print('cached, one new run\t{:.4f}'.format(elapsed / repeat))
+
+                if _describe(actual) != _describe(expected):
+                    logger.error('Cached standings differ from the full recomputation')
+                if _describe(cached()) != _describe(full()):
+                    logger.error('Cached standings differ from the full recomputation after the changes')
+
+                cache.delete(key)
+                raise Rollback()
+        except Rollback:
+            pass
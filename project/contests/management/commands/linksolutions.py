@@ -4,7 +4,7 @@ import logging
 from django.core.management.base import BaseCommand
 
 from common.irunner_import import connect_irunner_db
-from contests.models import ContestSolution
+from contests.models import ContestSolution, register_solution_changes
 from solutions.models import Solution
 
 
@@ -28,3 +28,4 @@ class Command(BaseCommand):
 
         objs = [ContestSolution(contest_id=options['new_contest_id'], solution_id=solution_id) for solution_id in present_solution_ids]
         ContestSolution.objects.bulk_create(objs)
+        register_solution_changes(present_solution_ids)
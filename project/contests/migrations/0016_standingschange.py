@@ -0,0 +1,28 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0015_contest_scoring_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StandingsChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('solution_id', models.IntegerField()),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('contest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contests.contest')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='standingschange',
+            index=models.Index(fields=['contest', 'timestamp'], name='contests_st_contest_18bf41_idx'),
+        ),
+    ]
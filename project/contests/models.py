@@ -8,8 +8,10 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from common.dbutils import MemberRoles
 from common.ir18n.fields import IR18nCharField
 from problems.models import Problem
 from proglangs.models import Compiler
@@ -132,6 +134,10 @@ class Membership(models.Model):
     role = models.IntegerField(_('role'), choices=ROLE_CHOICES)
 
 
+# roles of users, see contests.calcpermissions.ContestMemberFlags
+member_roles = MemberRoles(Membership, 'contest')
+
+
 class ContestProblem(models.Model):
     contest = models.ForeignKey(Contest, on_delete=models.CASCADE)
     problem = models.ForeignKey(Problem, on_delete=models.CASCADE, related_name='link_to_contest')
@@ -148,6 +154,37 @@ class ContestSolution(models.Model):
     is_disqualified = models.BooleanField(default=False)
 
 
+class StandingsChange(models.Model):
+    '''
+    Log of solutions whose contribution to the standings may have changed.
+    Cached standings (see contests.services) reload these solutions only.
+    '''
+    contest = models.ForeignKey(Contest, on_delete=models.CASCADE)
+    solution_id = models.IntegerField()
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['contest', 'timestamp']),
+        ]
+
+
+def register_solution_changes(solution_ids):
+    '''
+    Must be called in the same transaction as (or after) the change of a contest solution:
+    its creation, disqualification, a change of its best judgement or of its outcome.
+    Solutions that do not belong to any contest are ignored.
+    '''
+    ts = timezone.now()
+    changes = [
+        StandingsChange(contest_id=contest_id, solution_id=solution_id, timestamp=ts)
+        for contest_id, solution_id in ContestSolution.objects.
+        filter(solution_id__in=solution_ids).
+        values_list('contest_id', 'solution_id')
+    ]
+    StandingsChange.objects.bulk_create(changes)
+
+
 class Message(models.Model):
     QUESTION = 3
     ANSWER = 4
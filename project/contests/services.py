@@ -4,6 +4,8 @@ from __future__ import unicode_literals
 
 from collections import namedtuple
 
+from django.core.cache import cache
+from django.db.models import Max
 from django.utils import timezone
 from django.utils.encoding import force_text
 from django.utils.safestring import mark_safe
@@ -16,7 +18,7 @@ from solutions.models import Judgement, Solution
 from solutions.permissions import SolutionAccessLevel
 from solutions.submit.limit import ILimitPolicy
 
-from .models import Contest, ContestSolution, Membership, ContestScoringPolicy
+from .models import Contest, ContestSolution, Membership, ContestScoringPolicy, StandingsChange
 from .utils.problemstats import ProblemStats
 from .utils.types import SolutionKind
 
@@ -168,20 +170,29 @@ def _get_judgement(cs):
 
 
 def _get_kind(cs, freeze_time, show_pending_runs):
-    if (freeze_time is not None) and (cs.solution.reception_time >= freeze_time):
-        return SolutionKind.PENDING if show_pending_runs else None
-
     judgement = _get_judgement(cs)
+    if judgement is None:
+        return _get_run_kind(cs.solution.reception_time, None, None, None, freeze_time, show_pending_runs)
+    return _get_run_kind(cs.solution.reception_time, judgement.status, judgement.outcome, judgement.sample_tests_passed,
+                         freeze_time, show_pending_runs)
+
+
+def _get_run_kind(reception_time, status, outcome, sample_tests_passed, freeze_time, show_pending_runs):
+    '''
+    status, outcome and sample_tests_passed are the fields of the judgement (None if there is no judgement).
+    '''
+    if (freeze_time is not None) and (reception_time >= freeze_time):
+        return SolutionKind.PENDING if show_pending_runs else None
 
-    if judgement is not None and judgement.status == Judgement.DONE:
-        if judgement.outcome == Outcome.COMPILATION_ERROR:
+    if status == Judgement.DONE:
+        if outcome == Outcome.COMPILATION_ERROR:
             # skip CE (compatibility, this case is included into 'sample_tests_passed is False')
             return None
-        if judgement.sample_tests_passed is False:
+        if sample_tests_passed is False:
             return None
-        if judgement.outcome == Outcome.ACCEPTED:
+        if outcome == Outcome.ACCEPTED:
             return SolutionKind.ACCEPTED
-        elif judgement.outcome == Outcome.CHECK_FAILED:
+        elif outcome == Outcome.CHECK_FAILED:
             return SolutionKind.PENDING
         else:
             return SolutionKind.REJECTED
@@ -195,16 +206,51 @@ def _get_score(cs):
     return (judgement.score, judgement.max_score)
 
 
-def _make_contest_results(contest, frozen, user_result_class, column_presence, user_regex):
-    contest_descr = ContestDescr(contest)
+def _get_freeze_time(contest, frozen):
+    if frozen and (contest.freeze_time is not None):
+        return contest.start_time + contest.freeze_time
+    return None
 
-    # fetch all contestants from the contest
+
+def _get_contestants(contest, user_regex):
     users = contest.members.filter(contestmembership__role=Membership.CONTESTANT).select_related('userprofile')
-    user_id_result = {}
     for user in users:
         if user_regex is not None:
             if not user_regex.match(user.username):
                 continue
+        yield user
+
+
+def _put_places(user_results):
+    '''
+    Returns the list of finalized user results ordered by place.
+    '''
+    user_results = sorted(user_results, key=lambda x: x.get_key())
+
+    place = 0
+    tag = 0
+    for i, user_result in enumerate(user_results):
+        if (i == 0) or (user_results[i - 1].get_key() != user_results[i].get_key()):
+            place = i
+        if (i > 0) and (user_results[i - 1].get_tag_key() != user_results[i].get_tag_key()):
+            tag = tag ^ 1
+
+        user_result.set_place(place + 1)
+        user_result.set_row_tag(tag)
+
+    return user_results
+
+
+def _make_contest_results(contest, frozen, user_result_class, column_presence, user_regex):
+    '''
+    Computes the standings from scratch.
+    Requests are served by _make_cached_contest_results(), this function is the reference for it.
+    '''
+    contest_descr = ContestDescr(contest)
+
+    # fetch all contestants from the contest
+    user_id_result = {}
+    for user in _get_contestants(contest, user_regex):
         user_id_result[user.id] = user_result_class(contest_descr, user)
 
     # fetch solutions
@@ -215,9 +261,7 @@ def _make_contest_results(contest, frozen, user_result_class, column_presence, u
         select_related('solution', 'solution__best_judgement').\
         order_by('solution__reception_time')
 
-    freeze_time = None
-    if frozen and (contest.freeze_time is not None):
-        freeze_time = contest.start_time + contest.freeze_time
+    freeze_time = _get_freeze_time(contest, frozen)
 
     all_runs = []
     last_success = None
@@ -273,25 +317,257 @@ def _make_contest_results(contest, frozen, user_result_class, column_presence, u
     for user_result in user_results:
         user_result.finalize()
 
-    # order the table
-    user_results = sorted(user_results, key=lambda x: x.get_key())
-
-    # put places
-    place = 0
-    tag = 0
-    for i, user_result in enumerate(user_results):
-        if (i == 0) or (user_results[i - 1].get_key() != user_results[i].get_key()):
-            place = i
-        if (i > 0) and (user_results[i - 1].get_tag_key() != user_results[i].get_tag_key()):
-            tag = tag ^ 1
-
-        user_result.set_place(place + 1)
-        user_result.set_row_tag(tag)
+    user_results = _put_places(user_results)
 
     return ContestResults(contest, contest_descr, frozen, user_results, all_runs,
                           last_success, last_run, column_presence)
 
 
+'''
+Cached standings
+
+The state of the standings (StandingsState) is kept in the cache for every contest, frozen/unfrozen view
+and kind of problem results. It holds the runs of each (user, problem) pair and the problem result they
+sum up to. On a request the solutions mentioned in StandingsChange since the last synchronization are
+reloaded and only their cells are replayed, then the table is built from the ready problem results.
+'''
+
+STANDINGS_CACHE_TIMEOUT = 60 * 60
+# a change is committed later than it is timestamped, so the recent changes are looked through again
+STANDINGS_CHANGE_GRACE = timezone.timedelta(minutes=1)
+# must be much longer than STANDINGS_CACHE_TIMEOUT
+STANDINGS_CHANGE_LOG_TTL = timezone.timedelta(days=2)
+
+
+class StandingsCell(object):
+    '''
+    Runs of a user for a problem.
+    '''
+    def __init__(self):
+        self.runs = {}  # solution_id -> (reception_time, kind, score)
+        self.result = None
+        self.run_count = 0
+        self.success_count = 0
+        self.valid_runs = []  # (reception_time, solution_id, kind) for runs of known kind
+
+    def replay(self, problem_result_class, start_time):
+        result = problem_result_class()
+        self.run_count = 0
+        self.success_count = 0
+        self.valid_runs = []
+
+        for solution_id, (received, kind, score) in sorted(self.runs.items(), key=lambda item: (item[1][0], item[0])):
+            if kind is None:
+                continue
+            if result.register_solution(kind, total_minutes(received - start_time), score):
+                self.run_count += 1
+                if kind == SolutionKind.ACCEPTED:
+                    self.success_count += 1
+            self.valid_runs.append((received, solution_id, kind))
+
+        self.result = result
+
+    def get_last_run(self):
+        return self.valid_runs[-1] if self.valid_runs else None
+
+    def get_last_success(self):
+        for run in reversed(self.valid_runs):
+            if run[2] == SolutionKind.ACCEPTED:
+                return run
+        return None
+
+
+class StandingsState(object):
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.synced_at = None
+        self.seen_change_ids = set()
+        self.cells = {}  # (user_id, problem_id) -> StandingsCell
+        self.solution_cells = {}  # solution_id -> (user_id, problem_id)
+
+    def remove_solution(self, solution_id):
+        cell_key = self.solution_cells.pop(solution_id, None)
+        if cell_key is not None:
+            del self.cells[cell_key].runs[solution_id]
+            return cell_key
+
+    def add_run(self, solution_id, cell_key, run):
+        cell = self.cells.get(cell_key)
+        if cell is None:
+            cell = StandingsCell()
+            self.cells[cell_key] = cell
+        cell.runs[solution_id] = run
+        self.solution_cells[solution_id] = cell_key
+
+    def replay(self, cell_keys, problem_result_class, start_time):
+        for cell_key in cell_keys:
+            cell = self.cells[cell_key]
+            if cell.runs:
+                cell.replay(problem_result_class, start_time)
+            else:
+                del self.cells[cell_key]
+
+
+def _make_standings_key(contest_id, freeze_time, problem_result_class):
+    return 'contests:standings:{}:{}:{}'.format(contest_id, int(freeze_time is not None), problem_result_class.__name__)
+
+
+def _fetch_runs(contest, freeze_time, solution_ids=None):
+    '''
+    Yields (solution_id, (user_id, problem_id), (reception_time, kind, score)).
+    '''
+    queryset = ContestSolution.objects.\
+        filter(contest=contest).\
+        filter(is_disqualified=False).\
+        filter(solution__reception_time__gte=contest.start_time, solution__reception_time__lt=contest.start_time+contest.duration)
+    if solution_ids is not None:
+        queryset = queryset.filter(solution_id__in=solution_ids)
+
+    for solution_id, user_id, problem_id, received, status, outcome, sample_tests_passed, score, max_score in queryset.\
+            values_list('solution_id', 'solution__author_id', 'solution__problem_id', 'solution__reception_time',
+                        'solution__best_judgement__status', 'solution__best_judgement__outcome',
+                        'solution__best_judgement__sample_tests_passed', 'solution__best_judgement__score',
+                        'solution__best_judgement__max_score').\
+            iterator():
+        kind = _get_run_kind(received, status, outcome, sample_tests_passed, freeze_time, contest.show_pending_runs)
+        run_score = None
+        if (kind == SolutionKind.REJECTED) or (kind == SolutionKind.ACCEPTED):
+            run_score = (score, max_score)
+        yield solution_id, (user_id, problem_id), (received, kind, run_score)
+
+
+def _sync_standings_state(contest, freeze_time, problem_result_class):
+    key = _make_standings_key(contest.id, freeze_time, problem_result_class)
+    fingerprint = (contest.start_time, contest.duration, freeze_time, contest.show_pending_runs)
+    ts = timezone.now()
+
+    state = cache.get(key)
+    if state is None or state.fingerprint != fingerprint:
+        state = StandingsState(fingerprint)
+        # the changes that are visible now are reflected in the runs loaded below
+        state.seen_change_ids = set(StandingsChange.objects.
+                                    filter(contest=contest, timestamp__gte=ts - STANDINGS_CHANGE_GRACE).
+                                    values_list('id', flat=True))
+        for solution_id, cell_key, run in _fetch_runs(contest, freeze_time):
+            state.add_run(solution_id, cell_key, run)
+        state.replay(list(state.cells.keys()), problem_result_class, contest.start_time)
+
+        StandingsChange.objects.filter(contest=contest, timestamp__lt=ts - STANDINGS_CHANGE_LOG_TTL).delete()
+    else:
+        changes = list(StandingsChange.objects.
+                       filter(contest=contest, timestamp__gte=state.synced_at - STANDINGS_CHANGE_GRACE).
+                       values_list('id', 'solution_id', 'timestamp'))
+        solution_ids = set(solution_id for change_id, solution_id, _ in changes if change_id not in state.seen_change_ids)
+        if not solution_ids:
+            return state
+
+        state.seen_change_ids = set(change_id for change_id, _, timestamp in changes if timestamp >= ts - STANDINGS_CHANGE_GRACE)
+        affected = set()
+        for solution_id in solution_ids:
+            cell_key = state.remove_solution(solution_id)
+            if cell_key is not None:
+                affected.add(cell_key)
+        for solution_id, cell_key, run in _fetch_runs(contest, freeze_time, solution_ids):
+            state.add_run(solution_id, cell_key, run)
+            affected.add(cell_key)
+        state.replay(affected, problem_result_class, contest.start_time)
+
+    state.synced_at = ts
+    cache.set(key, state, STANDINGS_CACHE_TIMEOUT)
+    return state
+
+
+class _LazyRunList(object):
+    '''
+    The list of all runs is needed for export only, it is built on the first iteration.
+    '''
+    def __init__(self, make_runs):
+        self._make_runs = make_runs
+        self._runs = None
+
+    def _get(self):
+        if self._runs is None:
+            self._runs = self._make_runs()
+        return self._runs
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+
+def get_standings_version(contest):
+    '''
+    Returns a value that changes whenever a run of the contest is changed (see StandingsChange).
+    '''
+    return StandingsChange.objects.filter(contest=contest).aggregate(Max('id'))['id__max']
+
+
+def _make_cached_contest_results(contest, frozen, user_result_class, column_presence, user_regex):
+    '''
+    Works as _make_contest_results().
+    '''
+    freeze_time = _get_freeze_time(contest, frozen)
+    state = _sync_standings_state(contest, freeze_time, user_result_class.problem_result_class)
+
+    contest_descr = ContestDescr(contest)
+    ts_now = timezone.now()
+
+    user_results = []
+    used_cells = []
+    last_run = None
+    last_success = None
+
+    for user in _get_contestants(contest, user_regex):
+        user_result = user_result_class(contest_descr, user)
+        user_results.append(user_result)
+
+        for problem_index, labeled_problem in enumerate(contest_descr.labeled_problems):
+            cell = state.cells.get((user.id, labeled_problem.problem.id))
+            if cell is None:
+                continue
+
+            user_result.has_any_submissions = True
+            cell_last_run = cell.get_last_run()
+            if cell_last_run is None:
+                continue
+
+            user_result.has_valid_submissions = True
+            # the state has already been saved, so the result object may be changed
+            user_result.problem_results[problem_index] = cell.result
+            labeled_problem.stats.run_count += cell.run_count
+            labeled_problem.stats.success_count += cell.success_count
+            if cell_last_run[0] + RECENT_CHANGES_WINDOW >= ts_now:
+                cell.result.notify_recently_updated()
+
+            used_cells.append((user, labeled_problem, cell))
+            if last_run is None or last_run[0][:2] < cell_last_run[:2]:
+                last_run = (cell_last_run, user, labeled_problem)
+            cell_last_success = cell.get_last_success()
+            if cell_last_success is not None and (last_success is None or last_success[0][:2] < cell_last_success[:2]):
+                last_success = (cell_last_success, user, labeled_problem)
+
+    def make_run(run, user, labeled_problem):
+        received, solution_id, kind = run
+        return RunDescription(user, labeled_problem, received - contest.start_time, kind, solution_id)
+
+    def make_all_runs():
+        runs = [(run, user, labeled_problem) for user, labeled_problem, cell in used_cells for run in cell.valid_runs]
+        runs.sort(key=lambda item: item[0][:2])
+        return [make_run(*item) for item in runs]
+
+    for user_result in user_results:
+        user_result.finalize()
+
+    user_results = _put_places(user_results)
+
+    return ContestResults(contest, contest_descr, frozen, user_results, _LazyRunList(make_all_runs),
+                          make_run(*last_success) if last_success is not None else None,
+                          make_run(*last_run) if last_run is not None else None,
+                          column_presence)
+
+
 class ContestDescr(object):
     def __init__(self, contest):
         self.labeled_problems = []
@@ -442,8 +718,10 @@ class UserResultBase(object):
 
 
 class ACMUserResult(UserResultBase):
+    problem_result_class = ACMProblemResult
+
     def __init__(self, contest_descr, user):
-        super(ACMUserResult, self).__init__(user, [ACMProblemResult() for _ in contest_descr.labeled_problems])
+        super(ACMUserResult, self).__init__(user, [self.problem_result_class() for _ in contest_descr.labeled_problems])
 
         self._solved_problem_count = None
         self._penalty_time = None
@@ -540,7 +818,7 @@ class ACMContestService(IContestService):
         return True
 
     def make_contest_results(self, contest, frozen, user_regex=None):
-        return _make_contest_results(contest, frozen, ACMUserResult, ColumnPresence(True, True, False), user_regex)
+        return _make_cached_contest_results(contest, frozen, ACMUserResult, ColumnPresence(True, True, False), user_regex)
 
 
 class IOIContestService(IContestService):
@@ -578,7 +856,7 @@ class IOIContestService(IContestService):
             user_result_cls = IOIUserResultMax
         else:
             user_result_cls = IOIUserResultLast if not self._own_solutions_access else IOIUserResultMax
-        return _make_contest_results(contest, False, user_result_cls, ColumnPresence(False, False, True), user_regex)
+        return _make_cached_contest_results(contest, False, user_result_cls, ColumnPresence(False, False, True), user_regex)
 
 
 class ContestAttemptLimitPolicy(ILimitPolicy):
@@ -1,6 +1,35 @@
+import random
+import re
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from common.outcome import Outcome
+from problems.models import Problem
+from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from solutions.models import Judgement, Solution
+from solutions.permissions import SolutionAccessLevel
+from storage.models import FileMetadata
+from storage.resource_id import ResourceId
 
-from contests.services import make_letter
+from contests.models import Contest, ContestProblem, ContestScoringPolicy, ContestSolution, Membership
+from contests.exporting import export_to_ejudge_xml, export_to_s4ris_json, stream_ejudge_xml, stream_s4ris_json
+from contests.models import register_solution_changes
+from contests.services import (
+    ACMUserResult,
+    ColumnPresence,
+    IOIUserResultMax,
+    _make_cached_contest_results,
+    _make_contest_results,
+    create_contest_service,
+    make_letter,
+)
 
 
 class ContestTests(TestCase):
@@ -21,3 +50,212 @@ class ContestTests(TestCase):
 
         self.assertEqual(make_letter(701), 'ZZ')
         self.assertEqual(make_letter(702), 'AAA')
+
+
+def _describe_results(results):
+    rows = []
+    for user_result in results.user_results:
+        rows.append((
+            user_result.user.id,
+            user_result.get_place(),
+            user_result.get_row_tag(),
+            user_result.get_key(),
+            user_result.has_any_submissions,
+            user_result.has_valid_submissions,
+            tuple((pr.as_html(), pr.is_recently_updated()) for pr in user_result.problem_results),
+        ))
+
+    def describe_run(run):
+        return None if run is None else (run.user.id, run.labeled_problem.letter, run.when, run.kind, run.solution_id)
+
+    return {
+        'rows': rows,
+        'stats': [lp.stats.as_html() for lp in results.contest_descr.labeled_problems],
+        'last_run': describe_run(results.last_run),
+        'last_success': describe_run(results.last_success),
+        'all_runs': [describe_run(run) for run in results.all_runs],
+    }
+
+
+class StandingsTests(TestCase):
+    OUTCOMES = [Outcome.ACCEPTED, Outcome.WRONG_ANSWER, Outcome.COMPILATION_ERROR, Outcome.CHECK_FAILED]
+
+    def setUp(self):
+        cache.clear()
+        self.rng = random.Random(42)
+        self.start_time = timezone.now() - timezone.timedelta(hours=3)
+        self.contest = Contest.objects.create(name='Contest', start_time=self.start_time,
+                                              duration=timezone.timedelta(hours=5), freeze_time=timezone.timedelta(hours=2))
+
+        self.problems = []
+        for i in range(3):
+            problem = Problem.objects.create(number=i + 1, full_name='Problem')
+            ContestProblem.objects.create(contest=self.contest, problem=problem, ordinal_number=i)
+            self.problems.append(problem)
+
+        self.users = []
+        for i in range(6):
+            user = get_user_model().objects.create(username='user{}'.format(i))
+            Membership.objects.create(user=user, contest=self.contest, role=Membership.CONTESTANT)
+            self.users.append(user)
+        # submissions of a juror are not shown
+        juror = get_user_model().objects.create(username='juror')
+        Membership.objects.create(user=juror, contest=self.contest, role=Membership.JUROR)
+        self.users.append(juror)
+
+        self.compiler = Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP)
+        self.source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+
+        self.solutions = [self._submit() for _ in range(60)]
+
+    def _submit(self, minute=None, done=True):
+        if minute is None:
+            minute = self.rng.randrange(0, 180)
+        solution = Solution.objects.create(problem=self.rng.choice(self.problems), author=self.rng.choice(self.users),
+                                           reception_time=self.start_time + timezone.timedelta(minutes=minute, seconds=self.rng.randrange(60)),
+                                           source_code=self.source_code, compiler=self.compiler)
+        judgement = Judgement.objects.create(solution=solution, status=Judgement.WAITING)
+        if done:
+            self._finish(judgement)
+        solution.best_judgement = judgement
+        solution.save()
+        ContestSolution.objects.create(contest=self.contest, solution=solution)
+        register_solution_changes([solution.id])
+        return solution
+
+    def _finish(self, judgement):
+        judgement.status = Judgement.DONE
+        judgement.outcome = self.rng.choice(self.OUTCOMES)
+        judgement.score = self.rng.randrange(0, 11)
+        judgement.max_score = 10
+        judgement.sample_tests_passed = self.rng.choice([None, True, True, False])
+        judgement.save()
+
+    def _check(self, frozen=False, user_result_class=ACMUserResult, user_regex=None):
+        column_presence = ColumnPresence(True, True, False)
+        expected = _make_contest_results(self.contest, frozen, user_result_class, column_presence, user_regex)
+        actual = _make_cached_contest_results(self.contest, frozen, user_result_class, column_presence, user_regex)
+        self.assertEqual(_describe_results(actual), _describe_results(expected))
+
+    def _check_all(self):
+        self._check()
+        self._check(frozen=True)
+        self._check(user_result_class=IOIUserResultMax)
+        self._check(user_regex=re.compile(r'user[0-2]'))
+
+    def test_matches_full_recomputation(self):
+        self._check_all()
+        # served from the cache
+        self._check_all()
+
+    def test_incremental_changes(self):
+        self._check_all()
+
+        # new submissions, the last one is in testing
+        for _ in range(5):
+            self._submit(minute=170)
+        pending = self._submit(minute=175, done=False)
+        self._check_all()
+
+        # testing has finished
+        self._finish(pending.best_judgement)
+        register_solution_changes([pending.id])
+        self._check_all()
+
+        # disqualification
+        ContestSolution.objects.filter(solution__in=self.solutions[:10]).update(is_disqualified=True)
+        register_solution_changes([solution.id for solution in self.solutions[:10]])
+        self._check_all()
+
+        # deletion
+        admin = get_user_model().objects.create(username='admin', is_staff=True)
+        self.client.force_login(admin)
+        self.client.post(reverse('solutions:delete'), {'id': [solution.id for solution in self.solutions[10:15]]})
+        self.assertFalse(Solution.objects.filter(pk__in=[solution.id for solution in self.solutions[10:15]]).exists())
+        self._check_all()
+
+        # changes of the contest settings and membership do not need to be registered
+        self.contest.show_pending_runs = False
+        self.contest.freeze_time = timezone.timedelta(hours=1)
+        self.contest.save()
+        Membership.objects.filter(user=self.users[0]).delete()
+        ContestProblem.objects.filter(problem=self.problems[1]).delete()
+        self._check_all()
+
+    def test_ioi_scoring_policy(self):
+        self.contest.rules = Contest.IOI
+        self.contest.scoring_policy = ContestScoringPolicy.BEST_SOLUTION
+        self.contest.save()
+        self._check(user_result_class=IOIUserResultMax)
+
+    def test_standings_view(self):
+        url = reverse('contests:standings_raw', kwargs={'contest_id': self.contest.id})
+        me = self.users[0]
+        self.client.force_login(me)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<tr class="ir-me" data-user-id="{}">'.format(me.id), count=1)
+        etag = response['ETag']
+
+        # nothing has changed
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # the cached table is shared, but the highlighted row is not
+        other = self.users[1]
+        self.client.force_login(other)
+        response = self.client.get(url)
+        self.assertContains(response, '<tr class="ir-me" data-user-id="{}">'.format(other.id), count=1)
+        self.assertNotContains(response, '<tr class="ir-me" data-user-id="{}">'.format(me.id))
+
+        self.client.force_login(me)
+        self._submit(minute=170)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        for name in ('contests:standings', 'contests:standings_wide'):
+            response = self.client.get(reverse(name, kwargs={'contest_id': self.contest.id}))
+            self.assertContains(response, '<tr class="ir-me" data-user-id="{}">'.format(me.id), count=1)
+
+    def test_hidden_standings_view(self):
+        url = reverse('contests:standings', kwargs={'contest_id': self.contest.id})
+        self.client.force_login(self.users[0])
+        response = self.client.get(url)
+        self.assertContains(response, '<tr class="ir-me" data-user-id="{}">'.format(self.users[0].id), count=1)
+
+        # IOI standings are hidden while they are frozen
+        self.contest.rules = Contest.IOI
+        self.contest.contestant_own_solutions_access = SolutionAccessLevel.TESTING_DETAILS
+        self.contest.save()
+        response = self.client.get(url)
+        self.assertContains(response, '<div class="ir-absence">')
+        self.assertNotContains(response, 'data-user-id=')
+
+    @mock.patch('contests.exporting.EXPORT_JSON_BATCH_SIZE', 7)
+    @mock.patch('contests.exporting.EXPORT_CHUNK_SIZE', 1000)
+    def test_streaming_export(self):
+        self.contest.name = 'Contest <&"\'> №\t1'
+        self.contest.save()
+        get_user_model().objects.filter(pk=self.users[0].pk).update(first_name='Name "&<', last_name='Ж')
+        Judgement.objects.filter(solution__in=self.solutions[5:20]).update(test_number=3)
+        ContestSolution.objects.filter(solution__in=self.solutions[:5]).update(is_disqualified=True)
+        register_solution_changes([solution.id for solution in self.solutions[:5]])
+
+        def strip_current_time(xml):
+            return re.sub(r' current_time="[^"]*"', '', xml)
+
+        service = create_contest_service(self.contest)
+        for freeze_time in (None, timezone.timedelta(hours=2)):
+            self.contest.freeze_time = freeze_time
+            results = service.make_contest_results(self.contest, frozen=False)
+
+            expected = JsonResponse(export_to_s4ris_json(self.contest, results), json_dumps_params={'ensure_ascii': False})
+            actual = StreamingHttpResponse(stream_s4ris_json(self.contest, results), content_type='application/json')
+            self.assertEqual(b''.join(actual.streaming_content), expected.content)
+
+            expected = export_to_ejudge_xml(self.contest, results)
+            actual = ''.join(stream_ejudge_xml(self.contest, results))
+            self.assertIn('<run ', actual)
+            self.assertEqual(strip_current_time(actual), strip_current_time(expected))
@@ -1,14 +1,21 @@
+import hashlib
 import re
+import time
 
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.urls import reverse
 from django.db import transaction, IntegrityError
 from django.db.models import F, Q
-from django.http import HttpResponse, JsonResponse, Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.utils import timezone
-from django.utils.translation import ugettext, pgettext
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.safestring import mark_safe
+from django.utils.translation import ugettext, pgettext, get_language
 from django.views import generic
 
 from common.cast import make_int_list_quiet
@@ -26,13 +33,15 @@ from storage.utils import serve_resource_metadata
 from users.models import UserProfile
 
 from .calcpermissions import ContestMemberFlags, calculate_contest_permissions
-from .exporting import export_to_s4ris_json, export_to_ejudge_xml
+from .exporting import stream_s4ris_json, stream_ejudge_xml
 from .forms import SolutionListUserForm, SolutionListProblemForm, ContestSolutionForm, MessageForm, AnswerForm, QuestionForm
 from .forms import PrintoutForm, EditPrintoutForm
 from .models import Contest, ContestSolution, Message, MessageUser, Printout, ContestUserRoom, ContestProblem
+from .models import register_solution_changes
 from .services import make_contestant_choices, make_problem_choices, make_letter
 from .services import ProblemResolver, ContestTiming, ContestAttemptLimitPolicy
-from .services import create_contest_service
+from .services import create_contest_service, get_standings_version
+from .templatetags.irunner_contests import irunner_contests_standings
 
 
 class BaseContestView(generic.View):
@@ -114,6 +123,27 @@ AUTOREFRESH = 'autorefresh'
 FILTER = 'filter'
 USERNAMES = 'usernames'
 
+# The standings pages are rendered anew when a run of the contest changes or the period passes:
+# the latter refreshes the time and the things that are not tracked (e.g. names or members of teams).
+STANDINGS_REFRESH_PERIOD = 60
+
+
+def _make_digest(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _highlight_user_row(html, user_id):
+    '''
+    The cached table is shared by all the users, so the row of the current user is marked afterwards.
+    '''
+    if user_id is None:
+        return html
+    for row_class in ('ir-row-odd', 'ir-row-even'):
+        row = '<tr class="{}" data-user-id="{}">'.format(row_class, user_id)
+        if row in html:
+            return html.replace(row, '<tr class="ir-me" data-user-id="{}">'.format(user_id), 1)
+    return html
+
 
 class StandingsView(BaseContestView):
     tab = 'standings'
@@ -159,10 +189,30 @@ class StandingsView(BaseContestView):
                     return (fid, re.compile(f.regex))
         return (None, None)
 
+    def _render_standings(self, contest, frozen, user_regex, user_url, show_usernames, key):
+        '''
+        The table is cached per contest state, view (frozen, filter, columns) and language.
+        Returns None if there are no results to show (e.g. IOI standings are hidden while frozen).
+        '''
+        digest = _make_digest(key, frozen, user_regex and user_regex.pattern, user_url, show_usernames,
+                              self.permissions.problems, get_language())
+        cache_key = 'contests:standings_html:{}'.format(digest)
+        html = cache.get(cache_key)
+        if html is None:
+            contest_results = self.service.make_contest_results(contest, frozen=frozen, user_regex=user_regex)
+            if contest_results is None:
+                # an empty string is cached for the absent results
+                html = ''
+            else:
+                html = render_to_string('contests/irunner_contests_standings_tag.html', irunner_contests_standings(
+                    contest_results, user_url=user_url, show_problem_names=self.permissions.problems, show_usernames=show_usernames))
+            cache.set(cache_key, html, STANDINGS_REFRESH_PERIOD)
+        return html or None
+
     def get(self, request, contest):
         autorefresh = self._parse_autorefresh(request)
 
-        filters = contest.userfilter_set.order_by('name')
+        filters = list(contest.userfilter_set.order_by('name'))
         cur_filter_id, user_regex = self._parse_filter(request, filters)
 
         # privileged users may click on contestants to see their solutions
@@ -171,21 +221,41 @@ class StandingsView(BaseContestView):
             user_url = reverse('contests:all_solutions', kwargs={'contest_id': contest.id})
 
         my_id = request.user.id if request.user.is_authenticated else None
-        contest_results = None
-
-        if self.service.are_standings_available(self.permissions, self.timing):
-            # Do not show standings before the contest because they contain names of problems!
-            frozen = (self.timing.is_freeze_applicable()) and (not self.permissions.always_unfrozen_standings)
-            contest_results = self.service.make_contest_results(contest, frozen=frozen, user_regex=user_regex)
-
         show_usernames = request.GET.get(USERNAMES) == '1'
 
-        context = self.get_context_data(results=contest_results, my_id=my_id, user_url=user_url,
-                                        autorefresh=autorefresh, filters=filters, cur_filter_id=cur_filter_id,
-                                        show_usernames=show_usernames)
-
-        template_name = self.get_template_name()
-        return render(request, template_name, context)
+        # Do not show standings before the contest because they contain names of problems!
+        available = self.service.are_standings_available(self.permissions, self.timing)
+        frozen = (self.timing.is_freeze_applicable()) and (not self.permissions.always_unfrozen_standings)
+
+        context = self.get_context_data(my_id=my_id, user_url=user_url, autorefresh=autorefresh, filters=filters,
+                                        cur_filter_id=cur_filter_id, show_usernames=show_usernames)
+
+        # the standings state: it does not depend on the user
+        key = (contest.id, contest.rules, contest.scoring_policy, contest.contestant_own_solutions_access,
+               contest.start_time, contest.duration, contest.freeze_time,
+               contest.unfreeze_standings, contest.show_pending_runs, get_standings_version(contest),
+               int(time.time() // STANDINGS_REFRESH_PERIOD))
+
+        etag = quote_etag(_make_digest(
+            key, self.get_template_name(), get_language(), my_id, available, frozen, cur_filter_id, user_url, show_usernames,
+            autorefresh, [(f.id, f.name) for f in filters], self.timing.get(),
+            [(name, context.get(name)) for name in ('unread_messages', 'unanswered_questions', 'unread_answers')],
+            len(messages.get_messages(request)),
+        ))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            standings = None
+            if available:
+                html = self._render_standings(contest, frozen, user_regex, user_url, show_usernames, key)
+                if html is not None:
+                    standings = mark_safe(_highlight_user_row(html, my_id))
+            context['standings'] = standings
+            response = render(request, self.get_template_name(), context)
+
+        response['ETag'] = etag
+        # autorefresh revalidates the page every time
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class ContestProblemsetMixin(object):
@@ -287,10 +357,12 @@ class AllSolutionsView(ProblemResolverMixin, BaseContestView):
             .filter(contest=contest)\
             .filter(solution_id__in=solution_ids)
 
-        if 'disqualify' in request.POST:
-            qs.update(is_disqualified=True)
-        if 'qualify' in request.POST:
-            qs.update(is_disqualified=False)
+        with transaction.atomic():
+            if 'disqualify' in request.POST:
+                qs.update(is_disqualified=True)
+            if 'qualify' in request.POST:
+                qs.update(is_disqualified=False)
+            register_solution_changes(qs.values_list('solution_id', flat=True))
 
         return redirect_with_query_string(request, 'contests:all_solutions', contest.id)
 
@@ -321,7 +393,7 @@ class AllSolutionsView(ProblemResolverMixin, BaseContestView):
             if state is not None:
                 solutions = apply_state_filter(solutions, state)
 
-        context = paginate(request, solutions, self.paginate_by)
+        context = paginate(request, solutions, self.paginate_by, keyset=True)
 
         context['user_form'] = user_form
         context['problem_form'] = problem_form
@@ -359,7 +431,7 @@ class MySolutionsView(ProblemResolverMixin, BaseContestView):
             if problem is not None:
                 solutions = solutions.filter(problem_id=problem)
 
-        context = paginate(request, solutions, self.paginate_by)
+        context = paginate(request, solutions, self.paginate_by, keyset=True)
 
         context['problem_form'] = problem_form
         complete = self.service.should_show_my_solutions_completely(self.timing)
@@ -440,6 +512,7 @@ class SubmitView(SubmitAPIMixin, BaseContestView):
             solution = new_solution(self.request, form, problem_id=form.cleaned_data['problem'], stop_on_fail=self.service.should_stop_on_fail())
             ContestSolution.objects.create(solution=solution, contest=self.contest)
             notifier = judge(solution)
+            register_solution_changes([solution.id])
         notifier.notify()
         return solution
 
@@ -862,15 +935,13 @@ class ExportView(BaseContestView):
 class S4RiSExportView(ExportView):
     def get(self, request, contest):
         results = self.service.make_contest_results(contest, frozen=False)
-        json = export_to_s4ris_json(contest, results)
-        return JsonResponse(json, json_dumps_params={'ensure_ascii': False})
+        return StreamingHttpResponse(stream_s4ris_json(contest, results), content_type='application/json')
 
 
 class EjudgeExportView(ExportView):
     def get(self, request, contest):
         results = self.service.make_contest_results(contest, frozen=False)
-        xml = export_to_ejudge_xml(contest, results)
-        return HttpResponse(xml, content_type='application/xml; charset=utf-8')
+        return StreamingHttpResponse(stream_ejudge_xml(contest, results), content_type='application/xml; charset=utf-8')
 
 
 '''
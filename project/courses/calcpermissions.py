@@ -1,7 +1,7 @@
 from users.modelfields import is_instance_owned
 from solutions.permissions import SolutionAccessLevel, SolutionPermissions
 
-from .models import Membership, Course, CourseStatus
+from .models import Membership, Course, CourseStatus, member_roles
 from .permissions import CoursePermissions, InCourseAccessPermissions
 
 
@@ -19,18 +19,29 @@ class CourseMemberFlags(object):
 
     @staticmethod
     def load(course, user):
-        flags = CourseMemberFlags()
+        return CourseMemberFlags.load_many([course], user)[course.id]
 
-        for role in Membership.objects.filter(course=course, user=user).values_list('role', flat=True):
-            if role == Membership.STUDENT:
-                flags.is_student = True
-            elif role == Membership.TEACHER:
-                flags.is_teacher = True
+    @staticmethod
+    def load_many(courses, user):
+        '''
+        Returns a dict {course_id: CourseMemberFlags}.
+        '''
+        roles = member_roles.get_many([course.id for course in courses], user)
+        result = {}
+        for course in courses:
+            flags = CourseMemberFlags()
+
+            for role in roles[course.id]:
+                if role == Membership.STUDENT:
+                    flags.is_student = True
+                elif role == Membership.TEACHER:
+                    flags.is_teacher = True
 
-        if is_instance_owned(course, user):
-            flags.is_admin = True
+            if is_instance_owned(course, user):
+                flags.is_admin = True
 
-        return flags
+            result[course.id] = flags
+        return result
 
 
 def calculate_course_permissions(course, member_flags):
@@ -99,12 +110,16 @@ def _calculate_course_solution_permissions(course, member_flags, i_am_author):
     return permissions
 
 
-def calculate_course_solution_permissions_ex(solution, user):
-    course = Course.objects.filter(coursesolution__solution_id=solution.id).order_by().first()
+def make_course_solution_permissions(course, member_flags, solution, user):
     if course is None:
         # the solution does not belong to any course
         return InCourseAccessPermissions(None, False, SolutionPermissions())
 
-    member_flags = CourseMemberFlags.load(course, user)
     permissions = _calculate_course_solution_permissions(course, member_flags, solution.author_id == user.id)
     return InCourseAccessPermissions(course, bool(member_flags), permissions)
+
+
+def calculate_course_solution_permissions_ex(solution, user):
+    course = Course.objects.filter(coursesolution__solution_id=solution.id).order_by().first()
+    member_flags = CourseMemberFlags.load(course, user) if course is not None else None
+    return make_course_solution_permissions(course, member_flags, solution, user)
@@ -15,6 +15,7 @@ from solutions.models import Solution
 from solutions.permissions import SolutionAccessLevel
 from storage.models import FileMetadata
 
+from common.dbutils import MemberRoles
 from common.education.year import (
     make_year_of_study_string,
     make_group_string,
@@ -179,6 +180,10 @@ class Membership(models.Model):
     subgroup = models.ForeignKey(Subgroup, verbose_name=_('subgroup'), null=True, blank=True, on_delete=models.SET_NULL)
 
 
+# roles of users, see courses.calcpermissions.CourseMemberFlags
+member_roles = MemberRoles(Membership, 'course')
+
+
 class Assignment(models.Model):
     slot = models.ForeignKey(Slot, null=True, on_delete=models.CASCADE)
     topic = models.ForeignKey(Topic, null=True, on_delete=models.CASCADE)
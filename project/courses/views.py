@@ -478,7 +478,7 @@ class CourseAllSolutionsView(BaseCourseView):
         if state is not None:
             solutions = apply_state_filter(solutions, state)
 
-        context = paginate(request, solutions, self.paginate_by)
+        context = paginate(request, solutions, self.paginate_by, keyset=True)
 
         context['solution_permissions'] = self.permissions.all_solutions_permissions
         context['user_form'] = user_form
@@ -524,7 +524,7 @@ class CourseMySolutionsView(BaseCourseView):
         if problem_id is not None:
             solutions = solutions.filter(problem_id=problem_id)
 
-        context = paginate(request, solutions, self.paginate_by)
+        context = paginate(request, solutions, self.paginate_by, keyset=True)
         context['solution_permissions'] = self.permissions.my_solutions_permissions
         context['problem_form'] = problem_form
         context['page_title'] = _('My solutions')
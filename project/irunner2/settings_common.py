@@ -199,6 +199,36 @@ LOGGING = {
 EXTERNAL_LINKS = []
 
 SEMAPHORE = 'http://127.0.0.1:17083/'
+# give new jobs to idle workers in the wake-up response of the semaphore
+SEMAPHORE_PUSH = True
+# seconds to wait for the semaphore before the notification is dropped
+SEMAPHORE_TIMEOUT = 2.0
+
+# number of resource ids known to be present in the file system storage that are kept in memory
+# by each process; enable only if files are not removed from the storage while the site is running
+STORAGE_INDEX_SIZE = 0
+# compression of the files written to the file system storage: None, 'deflate' or 'zstd' (requires zstandard);
+# the files are read regardless of this setting
+STORAGE_COMPRESSION = None
+# files smaller than this number of bytes are not compressed
+STORAGE_COMPRESSION_THRESHOLD = 2**13
+# cache of the artifacts derived from the stored files (representations, highlighted source code):
+# 'memory' (separate in each process), 'filesystem' (shared by the processes on the host),
+# 'django' (the default Django cache) or None
+STORAGE_DERIVED_CACHE = 'memory'
+# the size limit in bytes for 'memory' and 'filesystem'
+STORAGE_DERIVED_CACHE_SIZE = 2**26
+# directory for 'filesystem', next to STORAGE_DIR by default
+STORAGE_DERIVED_CACHE_DIR = None
+
+# seconds a request for the status of a solution waits for it to change (long polling), 0 makes the clients poll;
+# each waiting request occupies a worker thread, so enable it only with spare threads (see uwsgi.ini)
+# and a cache shared by the processes (CACHES), otherwise the changes are noticed every RECHECK_INTERVAL only
+SOLUTION_STATUS_WAIT_TIMEOUT = 0
+
+# seconds a request for the progress of a rejudge waits for it to change, 0 makes the clients poll;
+# the same as SOLUTION_STATUS_WAIT_TIMEOUT, enable it only with spare threads and a shared cache
+REJUDGE_PROGRESS_WAIT_TIMEOUT = 0
 
 DEALER_TYPE = 'git'
 DEALER_PATH = BASE_DIR
@@ -0,0 +1,81 @@
+'''
+Winnowing fingerprints of source code (Schleimer, Wilkerson, Aiken, 2003).
+
+The source code is split into tokens; identifiers except keywords, numbers and string literals
+are replaced by placeholders, so renaming of variables does not change the fingerprints.
+Each k-gram of tokens is hashed, and the minimal hash of every window of consecutive k-grams
+is selected. Two sources that share a fragment of at least KGRAM_SIZE + WINDOW_SIZE - 1 tokens
+are guaranteed to share a fingerprint.
+'''
+
+import re
+import zlib
+
+from proglangs.langlist import ProgrammingLanguage
+
+KGRAM_SIZE = 10
+WINDOW_SIZE = 8
+
+_STRING = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+_WORD = r'[^\W\d]\w*'
+_NUMBER = r'\d[\w.]*'
+
+_C_COMMENTS = r'//[^\n]*|/\*.*?\*/|#[^\n]*'
+_PASCAL_COMMENTS = r'//[^\n]*|\{.*?\}|\(\*.*?\*\)'
+_PYTHON_COMMENTS = r'#[^\n]*'
+
+
+def _make_token_re(comments):
+    return re.compile(r'(?P<comment>{})|(?P<string>{})|(?P<word>{})|(?P<number>{})|(?P<other>\S)'.format(
+        comments, _STRING, _WORD, _NUMBER), re.DOTALL)
+
+
+_C_TOKEN_RE = _make_token_re(_C_COMMENTS)
+_TOKEN_RES = {
+    ProgrammingLanguage.PASCAL: _make_token_re(_PASCAL_COMMENTS),
+    ProgrammingLanguage.DELPHI: _make_token_re(_PASCAL_COMMENTS),
+    ProgrammingLanguage.PYTHON: _make_token_re(_PYTHON_COMMENTS),
+    ProgrammingLanguage.SHELL: _make_token_re(_PYTHON_COMMENTS),
+}
+
+# common keywords and names of the languages, in lower case
+KEYWORDS = frozenset('''
+    and array as assert begin bool boolean break byte case catch char class const continue def default del
+    delete do double downto elif else end enum except extends false final finally float for foreach from
+    function fun global goto if implements import in include int integer interface is lambda let long
+    main map new nil none not null object of or pass private procedure program protected public raise
+    real record repeat return self set short signed sizeof static string struct super switch then this
+    throw throws to true try type typedef unsigned until uses using val var vector void while with yield
+'''.split())
+
+
+def tokenize(text, language):
+    '''
+    Yields normalized tokens of the source code.
+    '''
+    token_re = _TOKEN_RES.get(language, _C_TOKEN_RE)
+    for match in token_re.finditer(text):
+        kind = match.lastgroup
+        if kind == 'word':
+            word = match.group().lower()
+            yield word if word in KEYWORDS else 'I'
+        elif kind == 'number':
+            yield 'N'
+        elif kind == 'string':
+            yield 'S'
+        elif kind == 'other':
+            yield match.group()
+
+
+def make_fingerprints(text, language):
+    '''
+    Returns a set of 32-bit fingerprints of the source code.
+    '''
+    tokens = list(tokenize(text, language))
+    hashes = [
+        zlib.crc32(' '.join(tokens[i:i + KGRAM_SIZE]).encode('utf-8'))
+        for i in range(len(tokens) - KGRAM_SIZE + 1)
+    ]
+    if len(hashes) <= WINDOW_SIZE:
+        return set(hashes)
+    return set(min(hashes[i:i + WINDOW_SIZE]) for i in range(len(hashes) - WINDOW_SIZE + 1))
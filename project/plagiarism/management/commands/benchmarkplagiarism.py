@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from common.outcome import Outcome
+from problems.models import Problem
+from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from solutions.models import Judgement, Solution
+from storage.models import FileMetadata
+from storage.storage import create_storage
+
+from plagiarism.plagiarism_api import find_candidates, index_solution
+
+USERNAME_PREFIX = 'plagiarism-benchmark-'
+
+OPERATORS = ['+', '-', '*', '/', '%', '^', '&', '|', '<<', '>>', '<', '>', '==', '!=', '&&', '||']
+FUNCTIONS = ['std::min', 'std::max', 'std::abs', 'std::gcd', 'std::sqrt', 'std::pow', 'solve', 'get', 'find']
+STATEMENTS = [
+    '{a} = {e};',
+    '{a} += {e};',
+    'long long {a} = {e};',
+    '{c}[{e}] = {e};',
+    '{c}.push_back({e});',
+    'if ({e}) {{ {a} = {e}; }}',
+    'if ({e}) {{ {c}[{a}] += {e}; }} else {{ --{b}; }}',
+    'while ({e}) {{ {a} = {e}; }}',
+    'for (int {a} = {e}; {a} < {e}; ++{a}) {{ {b} = {e}; }}',
+    'std::cout << {e} << std::endl;',
+    'std::cin >> {a} >> {b};',
+    'std::sort({c}.begin(), {c}.end());',
+]
+
+
+def _make_name(rng):
+    return rng.choice('abcdefghijklmnopqrstuvwxyz') + str(rng.randrange(100))
+
+
+def _make_expression(rng, depth=3):
+    '''
+    Random expressions make the normalized token sequences of the sources different.
+    '''
+    kind = rng.randrange(5) if depth > 0 else rng.randrange(2)
+    if kind == 0:
+        return _make_name(rng)
+    if kind == 1:
+        return str(rng.randrange(1000))
+    if kind == 2:
+        return '{}({}, {})'.format(rng.choice(FUNCTIONS), _make_expression(rng, depth - 1), _make_expression(rng, depth - 1))
+    if kind == 3:
+        return '{}[{}]'.format(_make_name(rng), _make_expression(rng, depth - 1))
+    return '({} {} {})'.format(_make_expression(rng, depth - 1), rng.choice(OPERATORS), _make_expression(rng, depth - 1))
+
+
+def _make_statement(rng):
+    template = rng.choice(STATEMENTS)
+    while '{e}' in template:
+        template = template.replace('{e}', _make_expression(rng).replace('{', '{{').replace('}', '}}'), 1)
+    return template.format(a=_make_name(rng), b=_make_name(rng), c=_make_name(rng))
+
+
+def _make_source(rng, lines=40):
+    body = '\n'.join('    ' + _make_statement(rng) for _ in range(lines))
+    return '#include <bits/stdc++.h>\n\nint main() {{\n{}\n    return 0;\n}}\n'.format(body)
+
+
+def _plagiarize(rng, source):
+    '''
+    Renames the identifiers and inserts some new lines.
+    '''
+    lines = source.split('\n')
+    for _ in range(5):
+        lines.insert(rng.randrange(3, len(lines) - 2), '    ' + _make_statement(rng))
+    return '\n'.join(lines).replace('a', 'q').replace('x', 'z')
+
+
+def _fill_problem(num_solutions, num_authors, plagiarism_share, rng):
+    problem = Problem.objects.create(number=100600, full_name='Plagiarism benchmark')
+    compiler = Compiler.objects.create(handle='plagiarism-benchmark', language=ProgrammingLanguage.CPP)
+
+    get_user_model().objects.bulk_create(get_user_model()(username='{}{}'.format(USERNAME_PREFIX, i)) for i in range(num_authors))
+    author_ids = list(get_user_model().objects.filter(username__startswith=USERNAME_PREFIX).values_list('pk', flat=True))
+
+    storage = create_storage()
+    start_time = timezone.now() - timezone.timedelta(days=100)
+    sources = []
+    planted = {}
+    solutions = []
+    for i in range(num_solutions):
+        if sources and rng.random() < plagiarism_share:
+            original = rng.randrange(len(sources))
+            source = _plagiarize(rng, sources[original])
+            planted[i] = original
+        else:
+            source = _make_source(rng)
+        sources.append(source)
+
+        data = source.encode('utf-8')
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=len(data), resource_id=storage.save(ContentFile(data)))
+        solutions.append(Solution(problem=problem, author_id=rng.choice(author_ids), source_code=source_code, compiler=compiler,
+                                  reception_time=start_time + timezone.timedelta(minutes=i)))
+
+    Solution.objects.bulk_create(solutions, batch_size=1000)
+    solutions = list(Solution.objects.filter(problem=problem).order_by('reception_time'))
+    Judgement.objects.bulk_create((Judgement(solution=solution, status=Judgement.DONE, outcome=Outcome.ACCEPTED)
+                                   for solution in solutions), batch_size=1000)
+
+    planted = {solutions[i].id: solutions[original] for i, original in planted.items()}
+    return problem, solutions, planted
+
+
+def _make_comparison_list(solution):
+    '''
+    The job as it used to be: all the earlier accepted solutions by other authors.
+    '''
+    solutions_to_compare = Solution.objects.filter(
+        judgement__outcome=Outcome.ACCEPTED,
+        problem_id=solution.problem_id,
+        reception_time__lt=solution.reception_time
+    ).exclude(author_id=solution.author_id).distinct()
+
+    return [
+        {'id': sol.id,
+         'language': sol.compiler.language,
+         'resource': sol.source_code.resource_id}
+        for sol in solutions_to_compare
+    ]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measures the fingerprint index of the plagiarism checker on a problem with many accepted solutions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--solutions', type=int, default=10000)
+        parser.add_argument('-a', '--authors', type=int, default=500)
+        parser.add_argument('--plagiarism', type=float, default=0.05, help='share of plagiarized solutions')
+        parser.add_argument('--jobs', type=int, default=20, help='number of jobs to plan')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        rng = random.Random(1)
+
+        try:
+            with transaction.atomic():
+                t1 = time.time()
+                problem, solutions, planted = _fill_problem(options['solutions'], options['authors'], options['plagiarism'], rng)
+                logger.info('%d solutions have been created in %.1f s', len(solutions), time.time() - t1)
+
+                t1 = time.time()
+                for solution in solutions:
+                    index_solution(solution.id, problem.id, ProgrammingLanguage.CPP, solution.source_code.resource_id)
+                elapsed = time.time() - t1
+                print('indexing\t{:.1f} solutions/s'.format(len(solutions) / elapsed))
+
+                # the latest solutions have the longest comparison lists
+                latest = solutions[-options['jobs']:]
+                print('planner\tseconds per job\tsolutions per job')
+
+                t1 = time.time()
+                sizes = [len(_make_comparison_list(solution)) for solution in latest]
+                print('all earlier solutions\t{:.4f}\t{:.0f}'.format((time.time() - t1) / len(latest), sum(sizes) / len(sizes)))
+
+                t1 = time.time()
+                sizes = [len(find_candidates(solution.id, solution.author_id, solution.reception_time)) for solution in latest]
+                print('top candidates\t{:.4f}\t{:.0f}'.format((time.time() - t1) / len(latest), sum(sizes) / len(sizes)))
+
+                # the plagiarized solutions must be found among the candidates
+                found = 0
+                total = 0
+                for solution in solutions:
+                    original = planted.get(solution.id)
+                    if original is not None and original.author_id != solution.author_id:
+                        total += 1
+                        found += original.id in find_candidates(solution.id, solution.author_id, solution.reception_time)
+                print('planted copies found\t{} of {}'.format(found, total))
+
+                raise Rollback()
+        except Rollback:
+            pass
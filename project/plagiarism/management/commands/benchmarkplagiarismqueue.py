@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from common.outcome import Outcome
+from problems.models import ProblemExtraInfo
+from proglangs.langlist import ProgrammingLanguage
+from solutions.models import Solution
+
+from plagiarism.models import AggregatedResult, Algorithm, JudgementResult, PendingSolution
+from plagiarism.plagiarism_api import _create_judgementresult_insert, dump_plagiarism_reports, get_testing_jobs, index_solution
+
+from .benchmarkplagiarism import Rollback, _fill_problem
+
+
+def _take_as_before():
+    '''
+    The backlog query of the planner as it used to be.
+    '''
+    excluded_problems = set(ProblemExtraInfo.objects.filter(check_plagiarism=False).values_list('problem_id', flat=True))
+    last_solution_id = AggregatedResult.objects.values_list('id', flat=True).order_by('-id').first()
+
+    qs = Solution.objects.\
+        filter(judgement__outcome=Outcome.ACCEPTED).\
+        filter(aggregatedresult__isnull=True).\
+        exclude(problem_id__in=excluded_problems)
+    if last_solution_id is not None:
+        qs = qs.filter(id__gt=last_solution_id)
+    return qs.order_by('id').first()
+
+
+def _dump_as_before(data):
+    with transaction.atomic():
+        results = _create_judgementresult_insert(data)
+        [item.save() for item in results]
+
+
+def _make_report(job, algorithm, rng):
+    return {
+        'id': job.solution.id,
+        'plagiarism_level': rng.random(),
+        'comparasion': [
+            {'id': subjob.id, 'result': {'results': [{'algo_id': algorithm.id, 'similarity': rng.random(), 'verdict': 'verdict'}]}}
+            for subjob in job.solutions
+        ],
+    }
+
+
+def _fill_backlog(problem, backlog):
+    now = timezone.now()
+    PendingSolution.objects.bulk_create((
+        PendingSolution(solution_id=solution_id, problem=problem, available_time=now) for solution_id in backlog
+    ), batch_size=1000)
+
+
+class Command(BaseCommand):
+    help = 'Measures how fast the plagiarism checker works off the backlog with single and batched requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--solutions', type=int, default=3000)
+        parser.add_argument('-a', '--authors', type=int, default=300)
+        parser.add_argument('-b', '--backlog', type=int, default=1000, help='number of solutions that have not been checked')
+        parser.add_argument('-l', '--limit', type=int, default=100, help='batch size')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        rng = random.Random(1)
+        limit = options['limit']
+
+        try:
+            with transaction.atomic():
+                t1 = time.time()
+                problem, solutions, _ = _fill_problem(options['solutions'], options['authors'], 0.05, rng)
+                for solution in solutions:
+                    index_solution(solution.id, problem.id, ProgrammingLanguage.CPP, solution.source_code.resource_id)
+                algorithm = Algorithm.objects.create(name='benchmark', enabled=True)
+
+                checked = solutions[:-options['backlog']]
+                backlog = [solution.id for solution in solutions[-options['backlog']:]]
+                AggregatedResult.objects.bulk_create((AggregatedResult(id=solution, relevance=0.) for solution in checked), batch_size=1000)
+                _fill_backlog(problem, backlog)
+                logger.info('%d solutions have been created and indexed in %.1f s', len(solutions), time.time() - t1)
+
+                print('backlog query\tms')
+                for name, func in [
+                    ('aggregatedresult__isnull', _take_as_before),
+                    ('pending solutions', lambda: PendingSolution.objects.filter(available_time__lte=timezone.now()).order_by('solution_id').first()),
+                ]:
+                    t1 = time.time()
+                    for _ in range(100):
+                        func()
+                    print('{}\t{:.2f}'.format(name, (time.time() - t1) * 10.))
+
+                print('mode\tsolutions/s\trequests')
+                t1 = time.time()
+                requests = 0
+                while True:
+                    jobs = get_testing_jobs('w', 1)
+                    requests += 1
+                    if not jobs:
+                        break
+                    _dump_as_before(_make_report(jobs[0], algorithm, rng))
+                    PendingSolution.objects.filter(solution_id=jobs[0].solution.id).delete()
+                    requests += 1
+                print('one per request, save()\t{:.1f}\t{}'.format(len(backlog) / (time.time() - t1), requests))
+
+                JudgementResult.objects.filter(solution_to_judge_id__in=backlog).delete()
+                AggregatedResult.objects.filter(id__in=backlog).delete()
+                _fill_backlog(problem, backlog)
+                t1 = time.time()
+                requests = 0
+                while True:
+                    jobs = get_testing_jobs('w', limit)
+                    requests += 1
+                    if not jobs:
+                        break
+                    dump_plagiarism_reports([_make_report(job, algorithm, rng) for job in jobs])
+                    requests += 1
+                print('batches of {}, bulk_create\t{:.1f}\t{}'.format(limit, len(backlog) / (time.time() - t1), requests))
+
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from common.outcome import Outcome
+from solutions.models import Solution
+
+from plagiarism.plagiarism_api import index_solution
+
+
+class Command(BaseCommand):
+    help = 'Adds the accepted solutions that have not been indexed yet to the fingerprint index of the plagiarism checker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-p', '--problem', type=int, help='index solutions to the problem only')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+
+        qs = Solution.objects.\
+            filter(judgement__outcome=Outcome.ACCEPTED).\
+            filter(fingerprintedsolution__isnull=True)
+        if options['problem'] is not None:
+            qs = qs.filter(problem_id=options['problem'])
+
+        count = 0
+        for solution_id, problem_id, language, resource_id in qs.\
+                values_list('id', 'problem_id', 'compiler__language', 'source_code__resource_id').\
+                distinct().\
+                order_by('id').\
+                iterator():
+            if index_solution(solution_id, problem_id, language, resource_id):
+                count += 1
+                if count % 1000 == 0:
+                    logger.info('%d solutions have been indexed', count)
+
+        logger.info('Done: %d solutions have been indexed', count)
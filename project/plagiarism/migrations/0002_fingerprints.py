@@ -0,0 +1,47 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('solutions', '0014_auto_20200627_1640'),
+        ('problems', '0020_auto_20210706_0236'),
+        ('plagiarism', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Fingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=8)),
+                ('value', models.PositiveIntegerField()),
+                ('solution_count', models.PositiveIntegerField(default=0)),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='problems.problem')),
+            ],
+            options={
+                'unique_together': {('problem', 'language', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FingerprintedSolution',
+            fields=[
+                ('solution', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='solutions.solution')),
+                ('fingerprint_count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FingerprintOccurrence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='plagiarism.fingerprint')),
+                ('solution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='solutions.solution')),
+            ],
+            options={
+                'unique_together': {('fingerprint', 'solution')},
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.1.2 on 2026-10-18 13:23
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+from common.outcome import Outcome
+
+
+def fill_pending_solutions(apps, schema_editor):
+    '''
+    Puts the backlog the old planner would have gone through into the queue.
+    '''
+    Solution = apps.get_model('solutions', 'Solution')
+    AggregatedResult = apps.get_model('plagiarism', 'AggregatedResult')
+    PendingSolution = apps.get_model('plagiarism', 'PendingSolution')
+
+    qs = Solution.objects.\
+        filter(judgement__outcome=Outcome.ACCEPTED).\
+        filter(aggregatedresult__isnull=True)
+    last_solution_id = AggregatedResult.objects.values_list('id', flat=True).order_by('-id').first()
+    if last_solution_id is not None:
+        qs = qs.filter(id__gt=last_solution_id)
+
+    now = timezone.now()
+    PendingSolution.objects.bulk_create((
+        PendingSolution(solution_id=solution_id, problem_id=problem_id, available_time=now)
+        for solution_id, problem_id in qs.values_list('id', 'problem_id').distinct().order_by('id').iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('solutions', '0014_auto_20200627_1640'),
+        ('problems', '0020_auto_20210706_0236'),
+        ('plagiarism', '0002_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSolution',
+            fields=[
+                ('solution', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='solutions.solution')),
+                ('available_time', models.DateTimeField()),
+                ('worker', models.CharField(blank=True, max_length=64)),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='problems.problem')),
+            ],
+        ),
+        migrations.RunPython(fill_pending_solutions, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
+from problems.models import Problem
 from solutions.models import Solution
 
 class Algorithm(models.Model):
@@ -17,3 +18,37 @@ class JudgementResult(models.Model):
 class AggregatedResult(models.Model):
     id = models.OneToOneField(Solution, on_delete=models.CASCADE, primary_key=True)
     relevance = models.FloatField()
+
+class Fingerprint(models.Model):
+    '''
+    A winnowing fingerprint of accepted solutions to a problem in a language (see plagiarism.fingerprints).
+    '''
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE)
+    language = models.CharField(max_length=8)
+    value = models.PositiveIntegerField()
+    solution_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('problem', 'language', 'value')
+
+class FingerprintOccurrence(models.Model):
+    fingerprint = models.ForeignKey(Fingerprint, on_delete=models.CASCADE)
+    solution = models.ForeignKey(Solution, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('fingerprint', 'solution')
+
+class FingerprintedSolution(models.Model):
+    solution = models.OneToOneField(Solution, on_delete=models.CASCADE, primary_key=True)
+    fingerprint_count = models.PositiveIntegerField()
+
+class PendingSolution(models.Model):
+    '''
+    An accepted solution waiting to be checked for plagiarism.
+    The solution is leased to a worker until `available_time`, after that it is given out again.
+    The row is deleted when the report comes.
+    '''
+    solution = models.OneToOneField(Solution, on_delete=models.CASCADE, primary_key=True)
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE)
+    available_time = models.DateTimeField()
+    worker = models.CharField(max_length=64, blank=True)
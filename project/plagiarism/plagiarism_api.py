@@ -1,10 +1,25 @@
-from common.outcome import Outcome
-from solutions.models import Solution
+from solutions.models import Solution, update_solution_list
 from problems.models import ProblemExtraInfo
+from storage.storage import create_storage
 
+from plagiarism.fingerprints import make_fingerprints
 from plagiarism.models import JudgementResult, AggregatedResult
+from plagiarism.models import Fingerprint, FingerprintOccurrence, FingerprintedSolution, PendingSolution
 from plagiarism.plagiarismstructs import PlagiarismSubJob, PlagiarismTestingJob
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+# the job contains at most this number of earlier solutions that share the most fingerprints with the solution
+CANDIDATE_COUNT = 50
+# the fingerprints shared by more solutions are common code (e.g. reading of input), they are not looked at
+MAX_FINGERPRINT_SOLUTIONS = 100
+# only the beginning of larger sources is fingerprinted
+MAX_SOURCE_SIZE = 2**16
+# a solution that has not been reported within this time is given to another worker
+LEASE_DURATION = timezone.timedelta(minutes=10)
+# keeps the number of query parameters small enough
+QUERY_CHUNK_SIZE = 500
 
 
 def _make_job_field(id, lang, res):
@@ -17,42 +32,166 @@ def _make_job(solution, solutions):
         [_make_job_field(_['id'], str(_['language']), str(_['resource'])) for _ in solutions])
 
 
-def get_testing_job():
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), QUERY_CHUNK_SIZE):
+        yield values[i:i + QUERY_CHUNK_SIZE]
+
+
+def index_solution(solution_id, problem_id, language, resource_id):
+    '''
+    Adds the source code of an accepted solution to the fingerprint index.
+    Returns False if the solution has already been indexed.
+    '''
+    representation = create_storage().represent(resource_id, limit=MAX_SOURCE_SIZE)
+    values = set()
+    if representation is not None and representation.text is not None and not representation.is_binary():
+        values = make_fingerprints(representation.text, language)
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                FingerprintedSolution.objects.create(solution_id=solution_id, fingerprint_count=len(values))
+        except IntegrityError:
+            return False
+
+        fingerprint_ids = {}
+        for chunk in _chunks(values):
+            fingerprint_ids.update(Fingerprint.objects.
+                                   filter(problem_id=problem_id, language=language, value__in=chunk).
+                                   values_list('value', 'id'))
+
+        missing = values.difference(fingerprint_ids)
+        if missing:
+            Fingerprint.objects.bulk_create([
+                Fingerprint(problem_id=problem_id, language=language, value=value) for value in missing
+            ], ignore_conflicts=True)
+            for chunk in _chunks(missing):
+                fingerprint_ids.update(Fingerprint.objects.
+                                       filter(problem_id=problem_id, language=language, value__in=chunk).
+                                       values_list('value', 'id'))
+        fingerprint_ids = list(fingerprint_ids.values())
+
+        FingerprintOccurrence.objects.bulk_create([
+            FingerprintOccurrence(fingerprint_id=fingerprint_id, solution_id=solution_id) for fingerprint_id in fingerprint_ids
+        ])
+        for chunk in _chunks(fingerprint_ids):
+            Fingerprint.objects.filter(id__in=chunk).update(solution_count=F('solution_count') + 1)
+    return True
+
+
+def register_accepted_solution(solution_id):
+    '''
+    Puts the solution that has been accepted into the queue of the plagiarism checker
+    unless it has already been checked. It is called while the report of the worker is saved,
+    so the source code is indexed later, when the solution is leased (see get_testing_jobs()).
+    '''
+    for problem_id in Solution.objects.filter(pk=solution_id).values_list('problem_id', flat=True):
+        if not AggregatedResult.objects.filter(pk=solution_id).exists():
+            PendingSolution.objects.bulk_create([
+                PendingSolution(solution_id=solution_id, problem_id=problem_id, available_time=timezone.now())
+            ], ignore_conflicts=True)
+
+
+def find_candidates(solution_id, author_id, reception_time, count=CANDIDATE_COUNT):
+    '''
+    Returns ids of the solutions received before by other authors that share the most rare fingerprints
+    with the given one, the most similar first.
+    '''
+    fingerprint_ids = list(Fingerprint.objects.
+                           filter(fingerprintoccurrence__solution_id=solution_id).
+                           filter(solution_count__lte=MAX_FINGERPRINT_SOLUTIONS).
+                           values_list('id', flat=True))
+    if not fingerprint_ids:
+        return []
+
+    shared = {}
+    for chunk in _chunks(fingerprint_ids):
+        for candidate_id, shared_count in FingerprintOccurrence.objects.\
+                filter(fingerprint_id__in=chunk).\
+                filter(solution__reception_time__lt=reception_time).\
+                exclude(solution__author_id=author_id).\
+                values_list('solution_id').\
+                annotate(shared=Count('id')).\
+                order_by():
+            shared[candidate_id] = shared.get(candidate_id, 0) + shared_count
+
+    return sorted(shared, key=lambda candidate_id: (-shared[candidate_id], candidate_id))[:count]
+
+
+def _lease(worker_name, limit):
+    '''
+    Leases up to `limit` first pending solutions, returns their ids.
+
+    The queue is walked in the order of the primary key, and the leased solutions are skipped.
+    The solutions are claimed with a conditional UPDATE, as api.queue.claim_many() does,
+    so a solution is never given to two workers at the same time.
+    '''
     excluded_problems = set(ProblemExtraInfo.objects.filter(check_plagiarism=False).values_list('problem_id', flat=True))
-    last_solution_id = AggregatedResult.objects.values_list('id', flat=True).order_by('-id').first()
-
-    qs = Solution.objects.\
-        filter(judgement__outcome=Outcome.ACCEPTED).\
-        filter(aggregatedresult__isnull=True).\
-        exclude(problem_id__in=excluded_problems)
-    if last_solution_id is not None:
-        qs = qs.filter(id__gt=last_solution_id)
-
-    solution_to_test = qs.order_by('id').first()
-
-    if not solution_to_test:
-        return None
-
-    solution = {
-        'id': solution_to_test.id,
-        'language': solution_to_test.compiler.language,
-        'resource': solution_to_test.source_code.resource_id
-    }
-
-    solutions_to_compare = Solution.objects.filter(
-        judgement__outcome=Outcome.ACCEPTED,
-        problem_id=solution_to_test.problem_id,
-        reception_time__lt=solution_to_test.reception_time
-    ).exclude(author_id=solution_to_test.author_id).distinct()
-
-    solutions = [
-        {'id': sol.id,
-         'language': sol.compiler.language,
-         'resource': sol.source_code.resource_id}
-        for sol in solutions_to_compare
-    ]
 
-    return _make_job(solution, solutions)
+    while True:
+        now = timezone.now()
+        ids = list(PendingSolution.objects.
+                   filter(available_time__lte=now).
+                   exclude(problem_id__in=excluded_problems).
+                   order_by('solution_id').
+                   values_list('solution_id', flat=True)[:limit])
+        if not ids:
+            return []
+
+        available_time = now + LEASE_DURATION
+        rows_updated = PendingSolution.objects.\
+            filter(solution_id__in=ids, available_time__lte=now).\
+            update(available_time=available_time, worker=worker_name)
+        if rows_updated == 0:
+            continue
+
+        if rows_updated < len(ids):
+            # some solutions have been taken by other workers in the meantime
+            ids = list(PendingSolution.objects.
+                       filter(solution_id__in=ids, available_time=available_time, worker=worker_name).
+                       order_by('solution_id').
+                       values_list('solution_id', flat=True))
+        return ids
+
+
+def get_testing_jobs(worker_name='', limit=1):
+    '''
+    Leases up to `limit` solutions to the worker for LEASE_DURATION and returns the jobs for them.
+    '''
+    ids = _lease(worker_name, limit)
+    if not ids:
+        return []
+
+    solutions = list(Solution.objects.
+                     filter(id__in=ids).
+                     order_by('id').
+                     values_list('id', 'problem_id', 'author_id', 'reception_time', 'compiler__language', 'source_code__resource_id'))
+
+    # the solutions are indexed when they are leased for the first time
+    # (the solutions accepted before the index was introduced: see manage.py indexplagiarism),
+    # all of them before the candidates are looked for, so they may be the candidates of each other
+    indexed = set(FingerprintedSolution.objects.filter(pk__in=ids).values_list('pk', flat=True))
+    for id, problem_id, _, _, language, resource_id in solutions:
+        if id not in indexed:
+            index_solution(id, problem_id, language, resource_id)
+
+    candidate_ids = {}
+    for id, _, author_id, reception_time, _, _ in solutions:
+        candidate_ids[id] = find_candidates(id, author_id, reception_time)
+
+    candidates = {}
+    for chunk in _chunks(set(id for ids in candidate_ids.values() for id in ids)):
+        for id, language, resource_id in Solution.objects.\
+                filter(id__in=chunk).\
+                values_list('id', 'compiler__language', 'source_code__resource_id'):
+            candidates[id] = {'id': id, 'language': language, 'resource': resource_id}
+
+    jobs = []
+    for id, _, _, _, language, resource_id in solutions:
+        solution = {'id': id, 'language': language, 'resource': resource_id}
+        jobs.append(_make_job(solution, [candidates[cid] for cid in candidate_ids[id] if cid in candidates]))
+    return jobs
 
 
 def _create_judgementresult_insert(data):
@@ -82,7 +221,29 @@ def _create_judgementresult_insert(data):
     return vals
 
 
-def dump_plagiarism_report(data):
+def dump_plagiarism_reports(reports):
+    '''
+    Saves the reports on many solutions at once and removes the solutions from the queue.
+    A repeated report on a solution (e.g. after the lease has expired) is ignored.
+    '''
     with transaction.atomic():
-        results = _create_judgementresult_insert(data)
-        [item.save() for item in results]
+        ids = [data['id'] for data in reports]
+        done = set()
+        for chunk in _chunks(ids):
+            done.update(AggregatedResult.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+
+        aggregated_results = []
+        judgement_results = []
+        for data in reports:
+            if data['id'] in done:
+                continue
+            done.add(data['id'])
+            results = _create_judgementresult_insert(data)
+            aggregated_results.append(results[0])
+            judgement_results.extend(results[1:])
+
+        AggregatedResult.objects.bulk_create(aggregated_results, batch_size=QUERY_CHUNK_SIZE)
+        JudgementResult.objects.bulk_create(judgement_results, batch_size=QUERY_CHUNK_SIZE)
+        update_solution_list(result.id_id for result in aggregated_results)
+        for chunk in _chunks(ids):
+            PendingSolution.objects.filter(solution_id__in=chunk).delete()
@@ -0,0 +1,200 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.utils import timezone
+
+from common.outcome import Outcome
+from problems.models import Problem, ProblemExtraInfo
+from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from solutions.models import Judgement, Solution
+from storage.models import FileMetadata
+from storage.storage_fs import FileSystemStorage
+
+from plagiarism.fingerprints import make_fingerprints
+from plagiarism.models import AggregatedResult, Algorithm, Fingerprint, FingerprintedSolution, JudgementResult, PendingSolution
+from plagiarism.plagiarism_api import dump_plagiarism_reports, get_testing_jobs, index_solution, register_accepted_solution
+
+ORIGINAL = '''
+#include <iostream>
+#include <vector>
+
+int main() {
+    int n;
+    std::cin >> n;
+    std::vector<long long> a(n);
+    for (int i = 0; i < n; ++i) {
+        std::cin >> a[i];
+    }
+    long long best = a[0], current = 0;
+    for (int i = 0; i < n; ++i) {
+        current = std::max(current + a[i], a[i]);
+        best = std::max(best, current);
+    }
+    std::cout << best << std::endl;
+    return 0;
+}
+'''
+
+COPY = '''
+#include <iostream>
+#include <vector>
+// my own solution
+
+int main() {
+    int count;
+    std::cin >> count;
+    std::vector<long long> values(count);
+    for (int k = 0; k < count; ++k) {
+        std::cin >> values[k];
+    }
+    long long answer = values[0], sum = 0;
+    for (int k = 0; k < count; ++k) {
+        sum = std::max(sum + values[k], values[k]);  /* Kadane */
+        answer = std::max(answer, sum);
+    }
+    std::cout << answer << std::endl;
+    return 0;
+}
+'''
+
+OTHER = '''
+n = int(input())
+print(sum(range(1, n + 1)) % 1000000007)
+'''
+
+
+class FingerprintTests(TestCase):
+    def test_renaming(self):
+        original = make_fingerprints(ORIGINAL, ProgrammingLanguage.CPP)
+        self.assertTrue(original)
+        self.assertEqual(make_fingerprints(COPY, ProgrammingLanguage.CPP), original)
+
+    def test_different(self):
+        original = make_fingerprints(ORIGINAL, ProgrammingLanguage.CPP)
+        other = make_fingerprints(OTHER, ProgrammingLanguage.PYTHON)
+        self.assertFalse(original & other)
+
+    def test_short(self):
+        self.assertEqual(make_fingerprints('', ProgrammingLanguage.CPP), set())
+        self.assertEqual(make_fingerprints('a = b + c;', ProgrammingLanguage.CPP), set())
+        self.assertEqual(len(make_fingerprints('a = b + c; d = e * f;', ProgrammingLanguage.CPP)), 3)
+
+
+class TestingJobTests(TestCase):
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(os.path.join(self.dirpath, 'filestorage'))
+        patcher = mock.patch('plagiarism.plagiarism_api.create_storage', return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.problem = Problem.objects.create(number=1, full_name='Problem')
+        self.compilers = {
+            ProgrammingLanguage.CPP: Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP),
+            ProgrammingLanguage.PYTHON: Compiler.objects.create(handle='python', language=ProgrammingLanguage.PYTHON),
+        }
+        self.start_time = timezone.now() - timezone.timedelta(hours=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def _submit(self, username, text, language=ProgrammingLanguage.CPP, minutes=0, outcome=Outcome.ACCEPTED):
+        author, _ = get_user_model().objects.get_or_create(username=username)
+        data = text.encode('utf-8')
+        source_code = FileMetadata.objects.create(filename='solution', size=len(data), resource_id=self.storage.save(ContentFile(data)))
+        solution = Solution.objects.create(problem=self.problem, author=author, source_code=source_code,
+                                           compiler=self.compilers[language],
+                                           reception_time=self.start_time + timezone.timedelta(minutes=minutes))
+        Judgement.objects.create(solution=solution, status=Judgement.DONE, outcome=outcome)
+        return solution
+
+    def _index(self, solution):
+        return index_solution(solution.id, solution.problem_id, solution.compiler.language, solution.source_code.resource_id)
+
+    def test_index(self):
+        solution = self._submit('alice', ORIGINAL)
+        self.assertTrue(self._index(solution))
+        self.assertFalse(self._index(solution))
+
+        fingerprints = Fingerprint.objects.filter(problem=self.problem, language=ProgrammingLanguage.CPP)
+        self.assertEqual(fingerprints.count(), len(make_fingerprints(ORIGINAL, ProgrammingLanguage.CPP)))
+        self.assertEqual(set(fingerprints.values_list('solution_count', flat=True)), {1})
+
+    def _report(self, solution, similar=None):
+        comparasion = []
+        if similar is not None:
+            comparasion.append({'id': similar.id, 'result': {'results': [
+                {'algo_id': self.algorithm.id, 'similarity': 0.9, 'verdict': 'similar'},
+                {'algo_id': self.algorithm.id, 'similarity': 0., 'verdict': ''},
+            ]}})
+        return {'id': solution.id, 'plagiarism_level': 0.9 if similar else 0., 'comparasion': comparasion}
+
+    def test_candidates(self):
+        self.algorithm = Algorithm.objects.create(name='algo', enabled=True)
+        original = self._submit('alice', ORIGINAL, minutes=1)
+        self._submit('bob', OTHER, ProgrammingLanguage.PYTHON, minutes=2)
+        self._submit('carol', ORIGINAL, minutes=3, outcome=Outcome.WRONG_ANSWER)
+        own = self._submit('dave', ORIGINAL, minutes=4)
+        copy = self._submit('dave', COPY, minutes=5)
+        later = self._submit('eve', ORIGINAL, minutes=6)
+        solutions = [original, own, copy, later]
+
+        for solution in [original, own, copy]:
+            register_accepted_solution(solution.id)
+        # the solutions are indexed when they are leased, not when they are accepted
+        self.assertFalse(FingerprintedSolution.objects.exists())
+        # the solutions accepted before the index was introduced are queued by the migration
+        PendingSolution.objects.create(solution=later, problem=self.problem, available_time=timezone.now())
+
+        jobs = get_testing_jobs('w', 2)
+        self.assertEqual([job.solution.id for job in jobs], [original.id, own.id])
+        self.assertEqual([subjob.id for subjob in jobs[1].solutions], [original.id])
+        dump_plagiarism_reports([self._report(original), self._report(own)])
+        self.assertEqual(AggregatedResult.objects.count(), 2)
+
+        jobs = get_testing_jobs('w', 10)
+        self.assertEqual([job.solution.id for job in jobs], [copy.id, later.id])
+        self.assertEqual([subjob.id for subjob in jobs[0].solutions], [original.id])
+        self.assertEqual(jobs[0].solutions[0].language, ProgrammingLanguage.CPP)
+        self.assertEqual(jobs[0].solutions[0].resource_id, str(original.source_code.resource_id))
+        self.assertEqual([subjob.id for subjob in jobs[1].solutions], [original.id, own.id, copy.id])
+        self.assertEqual(Fingerprint.objects.filter(solution_count=len(solutions)).count(),
+                         len(make_fingerprints(ORIGINAL, ProgrammingLanguage.CPP)))
+
+        # the solutions are leased
+        self.assertEqual(get_testing_jobs('w2', 10), [])
+
+        dump_plagiarism_reports([self._report(copy, original)])
+        # a repeated report is ignored
+        dump_plagiarism_reports([self._report(copy, original)])
+        self.assertEqual(list(JudgementResult.objects.values_list('solution_to_judge_id', 'solution_to_compare_id')),
+                         [(copy.id, original.id)])
+        self.assertEqual(list(PendingSolution.objects.values_list('solution_id', flat=True)), [later.id])
+
+        # the lease of the crashed worker expires
+        PendingSolution.objects.update(available_time=timezone.now() - timezone.timedelta(seconds=1))
+        jobs = get_testing_jobs('w2', 10)
+        self.assertEqual([job.solution.id for job in jobs], [later.id])
+        self.assertEqual(PendingSolution.objects.get().worker, 'w2')
+
+        dump_plagiarism_reports([self._report(later)])
+        self.assertEqual(get_testing_jobs('w2', 10), [])
+
+        # the checked solution is not queued again when it is rejudged
+        register_accepted_solution(later.id)
+        self.assertFalse(PendingSolution.objects.exists())
+
+    def test_excluded_problem(self):
+        ProblemExtraInfo.objects.create(problem=self.problem, check_plagiarism=False)
+        solution = self._submit('alice', ORIGINAL)
+        register_accepted_solution(solution.id)
+
+        # the solutions of the problem are neither leased nor indexed
+        self.assertEqual(get_testing_jobs('w', 10), [])
+        self.assertFalse(FingerprintedSolution.objects.exists())
@@ -47,19 +47,26 @@ def get_problem_ids_queryset(user):
     return set(get_problems_queryset(user).values_list('id', flat=True))
 
 
-def calculate_problem_solution_permissions(solution, user):
+def make_problem_solution_permissions(problem_permissions):
+    '''
+    problem_permissions: SingleProblemPermissions or None if the user has no access to the problem.
+    '''
     permissions = SolutionPermissions()
 
-    if solution.problem_id is not None:
-        pp = ProblemPermissionCalcer(user).calc(solution.problem_id)
-        if pp is not None:
-            permissions.update(SolutionAccessLevel.FULL)
-            permissions.allow_refer_to_problem()
-            permissions.allow_view_plagiarism_score()
-            permissions.allow_view_plagiarism_details()
-            permissions.allow_view_judgements()
+    if problem_permissions is not None:
+        permissions.update(SolutionAccessLevel.FULL)
+        permissions.allow_refer_to_problem()
+        permissions.allow_view_plagiarism_score()
+        permissions.allow_view_plagiarism_details()
+        permissions.allow_view_judgements()
 
-            if pp.can_rejudge:
-                permissions.allow_rejudge()
+        if problem_permissions.can_rejudge:
+            permissions.allow_rejudge()
 
     return permissions
+
+
+def calculate_problem_solution_permissions(solution, user):
+    if solution.problem_id is None:
+        return SolutionPermissions()
+    return make_problem_solution_permissions(ProblemPermissionCalcer(user).calc(solution.problem_id))
@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils.encoding import force_text
 
+from api.problemcache import invalidate_worker_problem
 from common.memory_string import parse_memory
 from common.irunner_import import connect_irunner_db
 from problems.models import Problem, ProblemExtraInfo, ProblemRelatedFile, ProblemRelatedSourceFile, ProblemFolder
@@ -192,3 +193,6 @@ class Command(BaseCommand):
                         ProblemRelatedSourceFile.objects.update_or_create(id=task_file_id, defaults=defaults)
                     else:
                         ProblemRelatedFile.objects.update_or_create(id=task_file_id, defaults=defaults)
+
+                # the tests, limits and files of the problem have been replaced
+                invalidate_worker_problem(problem.id)
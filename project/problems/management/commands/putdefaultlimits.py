@@ -5,6 +5,7 @@ from collections import Counter
 
 from django.core.management.base import BaseCommand
 
+from api.problemcache import invalidate_worker_problem
 from problems.models import Problem, ProblemExtraInfo, TestCase
 
 
@@ -31,6 +32,7 @@ class Command(BaseCommand):
             ml, _ = memory_limits.most_common(1)[0]
             logger.debug('= setting TL = %d, ML = %d', tl, ml)
             ProblemExtraInfo.objects.update_or_create(pk=problem_id, defaults={'default_time_limit': tl, 'default_memory_limit': ml})
+            invalidate_worker_problem(problem_id)
 
     def handle(self, *args, **options):
         logger = logging.getLogger('irunner_import')
@@ -1,8 +1,16 @@
 import re
 
+from concurrent.futures import ThreadPoolExecutor
+
 from django import forms
+from django.core.files.base import File
 from django.utils.translation import ugettext_lazy as _
 
+# the files of a test archive are stored by this number of threads
+IMPORT_THREADS = 4
+# zipfile decompresses small chunks noticeably slower
+IMPORT_CHUNK_SIZE = 2**20
+
 
 class FileNamingScheme(object):
     def guess_base_name(self, filename):
@@ -86,3 +94,26 @@ def extract_tests(filenames, input_ext, output_ext):
         _check(output_name)
         tests.append((input_name, output_name))
     return tests
+
+
+def _save_member(storage, myzip, info):
+    with myzip.open(info) as member:
+        f = File(member, info.filename)
+        # prevents Django from seeking to the end of the compressed stream to learn the size
+        f.size = info.file_size
+        f.DEFAULT_CHUNK_SIZE = IMPORT_CHUNK_SIZE
+        return (storage.save(f), info.file_size)
+
+
+def save_archive_members(storage, myzip, names, max_workers=IMPORT_THREADS):
+    '''
+    Stores the files from the ZIP archive.
+    Returns a list of tuples (resource id, size) in the order of names.
+
+    The files are not loaded into memory, they are decompressed by chunks while being stored.
+    Decompression, hashing and writing release the GIL, so the files are stored by a pool of threads
+    (zipfile allows reading several members of the archive at the same time).
+    '''
+    infos = [myzip.getinfo(name) for name in names]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda info: _save_member(storage, myzip, info), infos))
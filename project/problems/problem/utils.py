@@ -2,6 +2,7 @@ from django.contrib import messages
 from django.utils import timezone
 from django.utils.translation import ugettext
 
+from api.problemcache import invalidate_worker_problem
 from problems.problem.validation import revalidate_testset
 
 
@@ -12,6 +13,7 @@ def register_new_test(test_case, problem, request):
         test_case.author_id = request.user.id
     test_case.creation_time = timezone.now()
     test_case.save()
+    invalidate_worker_problem(problem.id)
     revalidate_testset(problem.id)
 
     msg = ugettext('Test %(no)d has been added.') % {'no': test_case.ordinal_number}
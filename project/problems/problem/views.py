@@ -22,6 +22,7 @@ from django.utils.translation import ungettext
 
 from api.queue import enqueue, bulk_enqueue
 from api.objectinqueue import ValidationInQueue, ChallengedSolutionInQueue
+from api.problemcache import invalidate_worker_problem
 from cauth.mixins import LoginRequiredMixin
 from cauth.acl.mixins import ShareWithUserMixin
 from common.access import PermissionCheckMixin
@@ -63,6 +64,7 @@ from problems.problem.forms import (
     TestUploadOrTextForm,
     ValidatorForm,
 )
+from problems.problem.importing import save_archive_members
 from problems.problem.permissions import SingleProblemPermissions, ProblemPermissionCalcer
 from problems.problem.utils import register_new_test
 from problems.problem.tabs import PROBLEM_TABS, TabManager
@@ -180,8 +182,6 @@ class ProblemSolutionsView(BaseProblemView):
 
 class ProblemSolutionsProcessView(BaseProblemView):
     def _pack_zip(self, problem, solution_ids):
-        max_size = 1 * 1024 * 1024
-
         solutions = problem.solution_set.\
             filter(pk__in=solution_ids).\
             select_related('source_code')
@@ -190,7 +190,7 @@ class ProblemSolutionsProcessView(BaseProblemView):
         with zs.writer() as wr:
             for solution in solutions:
                 fn = '{0}/{1}'.format(solution.id, solution.source_code.filename)
-                wr.add(solution.source_code.resource_id, fn, max_size)
+                wr.add(solution.source_code.resource_id, fn)
         return zs.serve()
 
     def _rejudge(self, problem, solutions):
@@ -348,14 +348,18 @@ class ProblemBrowseTestsView(BaseProblemView):
     def get(self, request, problem_id):
         problem = self._load(problem_id)
 
-        fetched_test_cases = []
-        test_cases = problem.testcase_set.all().order_by('ordinal_number')
+        test_cases = list(problem.testcase_set.all().order_by('ordinal_number'))
         storage = create_storage()
 
+        resource_ids = []
         for test_case in test_cases:
-            input_repr = storage.represent(test_case.input_resource_id, max_lines=self.max_lines, max_line_length=self.max_line_length)
-            answer_repr = storage.represent(test_case.answer_resource_id, max_lines=self.max_lines, max_line_length=self.max_line_length)
-            fetched_test_cases.append(FetchedTestCase(test_case, input_repr, answer_repr))
+            resource_ids.append(test_case.input_resource_id)
+            resource_ids.append(test_case.answer_resource_id)
+        reprs = storage.represent_many(resource_ids, max_lines=self.max_lines, max_line_length=self.max_line_length)
+
+        fetched_test_cases = []
+        for i, test_case in enumerate(test_cases):
+            fetched_test_cases.append(FetchedTestCase(test_case, reprs[2 * i], reprs[2 * i + 1]))
 
         context = self._make_context(problem, {'fetched_test_cases': fetched_test_cases})
         return render(request, self.template_name, context)
@@ -419,6 +423,7 @@ class ProblemReorderTestsView(BaseProblemView):
         with transaction.atomic():
             TestCase.objects.filter(problem_id=problem_id).update(ordinal_number=Case(*stmt1, default=F('ordinal_number')))
             TestCase.objects.filter(problem_id=problem_id).update(ordinal_number=Case(*stmt2, default=F('ordinal_number')))
+            invalidate_worker_problem(problem_id)
         return True
 
     def post(self, request, problem_id):
@@ -604,6 +609,7 @@ class ProblemTestsTestEditView(BaseProblemView):
                 messages.add_message(request, messages.INFO, self._notify_about_changes(test_number, changed))
 
             test_case.save()
+            invalidate_worker_problem(problem.id)
             return redirect_with_query_string(request, 'problems:show_test', problem.id, test_number)
 
         context = self._make_context(problem, {
@@ -669,6 +675,7 @@ class ProblemTestsDeleteView(BaseProblemView):
             problem.testcase_set.filter(ordinal_number=test_number).delete()
             # TODO: in Django 1.9: assert rows_deleted in (0, 1)
             problem.testcase_set.filter(ordinal_number__gt=test_number).update(ordinal_number=F('ordinal_number') - 1)
+            invalidate_worker_problem(problem.id)
         return redirect_with_query_string(request, 'problems:tests', problem.id)
 
 
@@ -709,7 +716,9 @@ class ProblemTestsBatchSetView(BaseProblemView):
 
         if ok:
             queryset = problem.testcase_set.filter(ordinal_number__in=ids)
-            self.apply(problem, queryset, form)
+            with transaction.atomic():
+                self.apply(problem, queryset, form)
+                invalidate_worker_problem(problem.id)
             return redirect_with_query_string(request, 'problems:tests', problem.id)
 
         context = self._make_context(problem, {
@@ -762,8 +771,6 @@ class ProblemTestsBatchDeleteView(ProblemTestsBatchSetView):
 
 class ProblemTestsDownloadArchiveView(BaseProblemView):
     def get(self, request, problem_id):
-        max_size = 32 * 1024 * 1024
-
         problem = self._load(problem_id)
         test_numbers = make_int_list_quiet(request.GET.getlist('id'))
         tests = problem.testcase_set.filter(ordinal_number__in=test_numbers)
@@ -771,8 +778,8 @@ class ProblemTestsDownloadArchiveView(BaseProblemView):
         zs = ZipSaver('tests-{}.zip'.format(problem.id))
         with zs.writer() as wr:
             for test in tests:
-                wr.add(test.input_resource_id, '{:02}'.format(test.ordinal_number), max_size)
-                wr.add(test.answer_resource_id, '{:02}.a'.format(test.ordinal_number), max_size)
+                wr.add(test.input_resource_id, '{:02}'.format(test.ordinal_number))
+                wr.add(test.answer_resource_id, '{:02}.a'.format(test.ordinal_number))
         return zs.serve()
 
 
@@ -801,19 +808,23 @@ class ProblemTestsUploadArchiveView(BaseProblemView):
             canonical_test_case = description_form.save(commit=False)
 
             with zipfile.ZipFile(form.cleaned_data['upload'], 'r', allowZip64=True) as myzip:
-                for input_name, answer_name in form.cleaned_data['tests']:
-                    test_case = TestCase(
-                        problem=problem,
-                        time_limit=canonical_test_case.time_limit,
-                        memory_limit=canonical_test_case.memory_limit,
-                        points=canonical_test_case.points,
-                        description=canonical_test_case.description,
-                        creation_time=ts,
-                        author=request.user,
-                    )
-                    test_case.set_input(storage, ContentFile(myzip.read(input_name)))
-                    test_case.set_answer(storage, ContentFile(myzip.read(answer_name)))
-                    test_cases.append(test_case)
+                names = [name for test in form.cleaned_data['tests'] for name in test]
+                files = save_archive_members(storage, myzip, names)
+
+            for (input_resource_id, input_size), (answer_resource_id, answer_size) in zip(files[::2], files[1::2]):
+                test_cases.append(TestCase(
+                    problem=problem,
+                    time_limit=canonical_test_case.time_limit,
+                    memory_limit=canonical_test_case.memory_limit,
+                    points=canonical_test_case.points,
+                    description=canonical_test_case.description,
+                    creation_time=ts,
+                    author=request.user,
+                    input_resource_id=input_resource_id,
+                    input_size=input_size,
+                    answer_resource_id=answer_resource_id,
+                    answer_size=answer_size,
+                ))
 
             with transaction.atomic():
                 num_tests = problem.testcase_set.count()
@@ -821,6 +832,7 @@ class ProblemTestsUploadArchiveView(BaseProblemView):
                     num_tests += 1
                     test_case.ordinal_number = num_tests
                 TestCase.objects.bulk_create(test_cases)
+                invalidate_worker_problem(problem.id)
 
             msg = ungettext('%(count)d test has been added.', '%(count)d tests have been added.', len(test_cases)) % {'count': len(test_cases)}
             messages.add_message(request, messages.INFO, msg)
@@ -898,6 +910,7 @@ class ProblemFilesBaseFileEditView(BaseProblemView):
             store_and_fill_metadata(form.cleaned_data['upload'], related_file)
             related_file.filename = filename
             related_file.save()
+            invalidate_worker_problem(problem.id)
 
             if related_file.file_type == ProblemRelatedSourceFile.VALIDATOR:
                 revalidate_testset(problem.id, clear=True)
@@ -946,6 +959,7 @@ class ProblemFilesBaseFileNewView(BaseProblemView):
             store_and_fill_metadata(form.cleaned_data['upload'], related_file)
             related_file.filename = filename
             related_file.save()
+            invalidate_worker_problem(problem.id)
             return redirect_with_query_string(request, 'problems:files', problem.id)
 
         context = self._make_context(problem, {'form': form, 'propagate_filename': True})
@@ -979,6 +993,7 @@ class ProblemFilesBaseFileDeleteView(BaseProblemView):
     def post(self, request, problem_id, file_id):
         problem = self._load(problem_id)
         self.get_queryset(problem, file_id).delete()
+        invalidate_worker_problem(problem.id)
         return redirect_with_query_string(request, 'problems:files', problem.id)
 
 
@@ -1235,6 +1250,7 @@ class ProblemPropertiesView(BaseProblemView):
                 extra = extra_form.save(commit=False)
                 extra.pk = problem.id
                 extra.save()
+                invalidate_worker_problem(problem.id)
 
             if form.has_changed() or extra_form.has_changed():
                 messages.add_message(request, messages.INFO, CHANGES_HAVE_BEEN_SAVED)
@@ -1270,6 +1286,7 @@ class ProblemNameView(BaseProblemView):
         form = ProblemNameForm(request.POST, instance=problem)
         if form.is_valid():
             form.save()
+            invalidate_worker_problem(problem.id)
             if form.has_changed():
                 messages.add_message(request, messages.INFO, CHANGES_HAVE_BEEN_SAVED)
             return redirect_with_query_string(request, 'problems:name', problem.id)
@@ -1,24 +1,94 @@
 from __future__ import unicode_literals
 
-import six
+import time
 import zipfile
 
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 from storage.storage import create_storage
 
+# the archive is passed to the web server in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer(object):
+    '''
+    An unseekable output file for zipfile: the written data is taken away by chunks.
+    '''
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def __len__(self):
+        return self._size
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+
+def generate_zip(entries, storage=None):
+    '''
+    Yields the ZIP archive of the files given as (resource_id, name_in_archive, max_size) tuples.
+
+    The files are read by chunks from storage.serve(), so the memory used does not depend
+    on the size of the files. ZIP64 extensions are written for the files larger than 2 GiB
+    and for archives that need them. Missing files and the files larger than max_size are skipped.
+    '''
+    storage = storage or create_storage()
+    buffer = _ChunkBuffer()
+    date_time = time.localtime(time.time())[:6]
+
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for resource_id, name_in_archive, max_size in entries:
+            data = storage.serve(resource_id)
+            if data is None:
+                continue
+            try:
+                if max_size is not None and data.size > max_size:
+                    continue
+
+                info = zipfile.ZipInfo(name_in_archive, date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.file_size = data.size
+                with zf.open(info, 'w') as dst:
+                    for chunk in data.generator:
+                        dst.write(chunk)
+                        if len(buffer) >= CHUNK_SIZE:
+                            yield buffer.take()
+            finally:
+                if hasattr(data.generator, 'close'):
+                    data.generator.close()
+
+            if len(buffer) >= CHUNK_SIZE:
+                yield buffer.take()
+
+    yield buffer.take()
+
 
 class ZipSaver(object):
+    '''
+    Collects the files with ZipWriter and serves the archive as it is being compressed.
+    '''
     def __init__(self, name):
         self._zip_file_name = name
-        self._zip_blob = b''
+        self._entries = []
 
     def writer(self):
         return ZipWriter(self)
 
     def serve(self):
-        # Grab ZIP file from in-memory, make response with correct MIME-type
-        response = HttpResponse(self._zip_blob, content_type='application/x-zip-compressed')
+        response = StreamingHttpResponse(generate_zip(self._entries), content_type='application/x-zip-compressed')
         response['Content-Disposition'] = 'attachment; filename="{}"'.format(self._zip_file_name)
         return response
 
@@ -26,24 +96,16 @@ class ZipSaver(object):
 class ZipWriter(object):
     def __init__(self, parent):
         self._parent = parent
+        self._entries = []
 
-        # Open BytesIO to grab in-memory ZIP contents
-        self._stream = six.BytesIO()
-        self._zipfile = zipfile.ZipFile(self._stream, 'w', zipfile.ZIP_DEFLATED)
-        self._storage = create_storage()
-
-    def add(self, resource_id, name_in_archive, max_size):
+    def add(self, resource_id, name_in_archive, max_size=None):
         if resource_id is None:
             return
-
-        blob, is_complete = self._storage.read_blob(resource_id, max_size=max_size)
-        if is_complete:
-            self._zipfile.writestr(name_in_archive, blob)
+        self._entries.append((resource_id, name_in_archive, max_size))
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self._zipfile.close()
-        self._parent._zip_blob = self._stream.getvalue()
+        self._parent._entries = self._entries
         return False
@@ -1,18 +1,30 @@
 from __future__ import unicode_literals
 
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
 from django import forms
+from django.core.files.base import ContentFile
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.test.client import RequestFactory
 
 from common.tree.fields import FOLDER_ID_PLACEHOLDER
 from cauth.acl.accessmode import AccessMode
+from storage.resource_id import ResourceId
+from storage.storage_fs import FileSystemStorage
 from users.models import AdminGroup
 
 from problems.description import IDescriptionImageLoader, render_description
 from problems.models import Problem, ProblemAccess, ProblemFolder, ProblemFolderAccess
 from problems.fields import ThreePanelGenericProblemMultipleChoiceField
+from problems.problem.importing import save_archive_members
 from problems.problem.permissions import ProblemPermissionCalcer
+from problems.problem.zipsaver import ZipSaver
 
 
 class SimpleDescriptionImageLoader(IDescriptionImageLoader):
@@ -146,3 +158,69 @@ class ProblemFoldersTests(TestCase):
 
         f = run(admin, {'problems': orphan.id})
         self.assertTrue(f.is_valid())
+
+
+class ZipSaverTests(TestCase):
+    def _download(self, files):
+        zs = ZipSaver('tests.zip')
+        with zs.writer() as wr:
+            for resource_id, name in files:
+                wr.add(resource_id, name)
+        response = zs.serve()
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="tests.zip"')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_streaming(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage'))
+            big = os.urandom(300 * 1024)
+            files = {
+                '01': b'1 2\n',
+                '01.a': b'3\n' * 1000,
+                '02': big,
+            }
+            resource_ids = [(fs.save(ContentFile(data)), name) for name, data in files.items()]
+            missing = ResourceId.parse('59db6ba4a6aff5ed3d980542daf41be65624a1e8')
+
+            with mock.patch('problems.problem.zipsaver.create_storage', return_value=fs):
+                zf = self._download(resource_ids + [(missing, '03')])
+                self.assertEqual({name: zf.read(name) for name in zf.namelist()}, files)
+
+                # a file larger than the limit gets the ZIP64 extra field
+                with mock.patch('zipfile.ZIP64_LIMIT', 100 * 1024):
+                    zf = self._download(resource_ids)
+                self.assertEqual(zf.getinfo('02').extract_version, zipfile.ZIP64_VERSION)
+                self.assertEqual(zf.read('02'), big)
+                self.assertEqual(zf.testzip(), None)
+        finally:
+            shutil.rmtree(dirpath)
+
+
+class ArchiveImportTests(TestCase):
+    def test_save_archive_members(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage'))
+            files = [
+                ('1', b'1 2\n'),
+                ('1.a', b'3\n'),
+                ('2', b'100 200\n' * 100000),
+                ('2.a', os.urandom(200 * 1024)),
+                ('3', b'100 200\n' * 100000),
+                ('3.a', b''),
+            ]
+            stream = io.BytesIO()
+            with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for name, data in files:
+                    zf.writestr(name, data, zipfile.ZIP_STORED if name == '2.a' else zipfile.ZIP_DEFLATED)
+
+            with zipfile.ZipFile(stream, 'r') as zf:
+                result = save_archive_members(fs, zf, [name for name, _ in reversed(files)], max_workers=3)
+
+            expected = [(fs.save(ContentFile(data)), len(data)) for _, data in reversed(files)]
+            self.assertEqual(result, expected)
+            for resource_id, (_, data) in zip(reversed([r for r, _ in result]), files):
+                self.assertEqual(fs.read_blob(resource_id, None), (data, True))
+        finally:
+            shutil.rmtree(dirpath)
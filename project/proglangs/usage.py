@@ -1,7 +1,7 @@
 from contests.models import Contest
 from courses.models import Course
 from problems.models import ProblemRelatedSourceFile
-from solutions.models import Solution
+from solutions.models import Solution, SolutionListEntry
 from users.models import UserProfile
 
 
@@ -16,4 +16,5 @@ def replace_compiler(old, new):
 
     ProblemRelatedSourceFile.objects.filter(compiler_id=old).update(compiler_id=new)
     Solution.objects.filter(compiler_id=old).update(compiler_id=new)
+    SolutionListEntry.objects.filter(compiler_id=old).update(compiler_id=new)
     UserProfile.objects.filter(last_used_compiler=old).update(last_used_compiler=new)
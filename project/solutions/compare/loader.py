@@ -3,31 +3,27 @@ from django.utils.translation import ugettext_lazy as _
 from storage.storage import create_storage
 
 from solutions.models import Solution
-from solutions.solution.calcpermissions import calculate_permissions
 
 
 class SourceCodeToCompare(object):
-    def __init__(self, solution_id, user):
+    def __init__(self, solution_id, solution, permissions, environment):
         self.solution_id = solution_id
 
-        self.solution = None
-        self.permissions = None
-        self.environment = None
+        self.solution = solution
+        self.permissions = permissions
+        self.environment = environment
         self.text = None
         self.error = None
 
-        self._load(user)
+        self._load()
 
         assert (self.text is not None) or (self.error is not None)
 
-    def _load(self, user):
-        self.solution = Solution.objects.filter(pk=self.solution_id).first()
+    def _load(self):
         if self.solution is None:
             self.error = _('not found')
             return
 
-        self.permissions, self.environment = calculate_permissions(self.solution, user)
-
         if not self.permissions.can_view_source_code:
             self.error = _('access denied')
             return
@@ -53,5 +49,16 @@ class SourceCodeToCompare(object):
             return
 
 
-def fetch_solution(solution, user):
-    return SourceCodeToCompare(solution, user)
+def fetch_solutions(solution_ids, resolver):
+    '''
+    Returns a list of SourceCodeToCompare in the order of solution_ids.
+    '''
+    solutions = Solution.objects.select_related('source_code').in_bulk(solution_ids)
+    resolved = dict(zip(solutions, resolver.resolve_many(solutions.values())))
+
+    result = []
+    for solution_id in solution_ids:
+        solution = solutions.get(solution_id)
+        permissions, environment = resolved[solution_id] if solution is not None else (None, None)
+        result.append(SourceCodeToCompare(solution_id, solution, permissions, environment))
+    return result
@@ -6,7 +6,8 @@ from django.shortcuts import render
 from cauth.mixins import LoginRequiredMixin
 
 from solutions.compare.forms import CompareSolutionsForm
-from solutions.compare.loader import fetch_solution
+from solutions.compare.loader import fetch_solutions
+from solutions.solution.calcpermissions import SolutionPermissionResolver
 
 '''
 Compare two solutions
@@ -17,8 +18,7 @@ class CompareSolutionsView(LoginRequiredMixin, generic.View):
     template_name = 'solutions/compare.html'
 
     def _get_compare_context(self, first_id, second_id, contextual_diff):
-        first = fetch_solution(first_id, self.request.user)
-        second = fetch_solution(second_id, self.request.user)
+        first, second = fetch_solutions([first_id, second_id], SolutionPermissionResolver.for_request(self.request))
         ok = (first.text is not None) and (second.text is not None)
         context = {}
         context['first'] = first
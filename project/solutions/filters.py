@@ -1,42 +1,60 @@
+'''
+The filters are applied both to solutions and to SolutionListEntry objects:
+the problems and the compilers are filtered by with a subquery.
+'''
+
 from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from problems.models import Problem
 
 from common.outcome import Outcome
 from .models import Judgement
 
+# (status, outcome) of the best judgement, outcome is None if any
 STATE_FILTERS = {
-    'waiting': lambda q: q.filter(best_judgement__status=Judgement.WAITING),
-    'preparing': lambda q: q.filter(best_judgement__status=Judgement.PREPARING),
-    'compiling': lambda q: q.filter(best_judgement__status=Judgement.COMPILING),
-    'testing': lambda q: q.filter(best_judgement__status=Judgement.TESTING),
-    'finishing': lambda q: q.filter(best_judgement__status=Judgement.FINISHING),
-    'done': lambda q: q.filter(best_judgement__status=Judgement.DONE),
-    'not-done': lambda q: q.exclude(best_judgement__status=Judgement.DONE),
-    'ok': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.ACCEPTED),
-    'ce': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.COMPILATION_ERROR),
-    'wa': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.WRONG_ANSWER),
-    'tle': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.TIME_LIMIT_EXCEEDED),
-    'mle': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.MEMORY_LIMIT_EXCEEDED),
-    'ile': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.IDLENESS_LIMIT_EXCEEDED),
-    'rte': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.RUNTIME_ERROR),
-    'pe': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.PRESENTATION_ERROR),
-    'sv': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.SECURITY_VIOLATION),
-    'cf': lambda q: q.filter(best_judgement__status=Judgement.DONE, best_judgement__outcome=Outcome.CHECK_FAILED),
+    'waiting': (Judgement.WAITING, None),
+    'preparing': (Judgement.PREPARING, None),
+    'compiling': (Judgement.COMPILING, None),
+    'testing': (Judgement.TESTING, None),
+    'finishing': (Judgement.FINISHING, None),
+    'done': (Judgement.DONE, None),
+    'ok': (Judgement.DONE, Outcome.ACCEPTED),
+    'ce': (Judgement.DONE, Outcome.COMPILATION_ERROR),
+    'wa': (Judgement.DONE, Outcome.WRONG_ANSWER),
+    'tle': (Judgement.DONE, Outcome.TIME_LIMIT_EXCEEDED),
+    'mle': (Judgement.DONE, Outcome.MEMORY_LIMIT_EXCEEDED),
+    'ile': (Judgement.DONE, Outcome.IDLENESS_LIMIT_EXCEEDED),
+    'rte': (Judgement.DONE, Outcome.RUNTIME_ERROR),
+    'pe': (Judgement.DONE, Outcome.PRESENTATION_ERROR),
+    'sv': (Judgement.DONE, Outcome.SECURITY_VIOLATION),
+    'cf': (Judgement.DONE, Outcome.CHECK_FAILED),
 }
+NOT_DONE = 'not-done'
 
 DIFFICULTY_FILTERS = {
-    'no': lambda q: q.filter(problem__difficulty=None),
-    '1-10': lambda q: q.filter(problem__difficulty__gte=1, problem__difficulty__lte=10),
-    '4': lambda q: q.filter(problem__difficulty=4),
-    '5-6': lambda q: q.filter(problem__difficulty__gte=5, problem__difficulty__lte=6),
-    '7-8': lambda q: q.filter(problem__difficulty__gte=7, problem__difficulty__lte=8),
-    '9-10': lambda q: q.filter(problem__difficulty__gte=9, problem__difficulty__lte=10),
+    'no': lambda q: q.filter(difficulty=None),
+    '1-10': lambda q: q.filter(difficulty__gte=1, difficulty__lte=10),
+    '4': lambda q: q.filter(difficulty=4),
+    '5-6': lambda q: q.filter(difficulty__gte=5, difficulty__lte=6),
+    '7-8': lambda q: q.filter(difficulty__gte=7, difficulty__lte=8),
+    '9-10': lambda q: q.filter(difficulty__gte=9, difficulty__lte=10),
 }
 
 
-def apply_state_filter(solution_queryset, value):
-    state_filter = STATE_FILTERS.get(value)
-    if state_filter is not None:
-        solution_queryset = state_filter(solution_queryset)
+def apply_state_filter(solution_queryset, value, prefix='best_judgement__'):
+    '''
+    prefix: the path to the status and the outcome of the best judgement.
+    '''
+    if value == NOT_DONE:
+        return solution_queryset.exclude(**{prefix + 'status': Judgement.DONE})
+
+    state = STATE_FILTERS.get(value)
+    if state is not None:
+        status, outcome = state
+        lookups = {prefix + 'status': status}
+        if outcome is not None:
+            lookups[prefix + 'outcome'] = outcome
+        solution_queryset = solution_queryset.filter(**lookups)
     return solution_queryset
 
 
@@ -45,7 +63,7 @@ def apply_compiler_filter(solution_queryset, value):
         ok = False
         for language, _ in ProgrammingLanguage.CHOICES:
             if language == value:
-                solution_queryset = solution_queryset.filter(compiler__language=language)
+                solution_queryset = solution_queryset.filter(compiler_id__in=Compiler.objects.filter(language=language).values('id'))
                 ok = True
                 break
         if not ok:
@@ -56,5 +74,5 @@ def apply_compiler_filter(solution_queryset, value):
 def apply_difficulty_filter(solution_queryset, value):
     difficulty_filter = DIFFICULTY_FILTERS.get(value)
     if difficulty_filter is not None:
-        solution_queryset = difficulty_filter(solution_queryset)
+        solution_queryset = solution_queryset.filter(problem_id__in=difficulty_filter(Problem.objects.all()).values('id'))
     return solution_queryset
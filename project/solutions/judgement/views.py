@@ -12,7 +12,7 @@ from storage.storage import create_storage
 from solutions.mixins import TestCaseResultMixin
 from solutions.models import Solution, Judgement, TestCaseResult, JudgementLog
 from solutions.permissions import SolutionPermissions
-from solutions.solution.calcpermissions import calculate_permissions
+from solutions.solution.calcpermissions import SolutionPermissionResolver
 
 
 class JudgementListView(ProblemEditorMemberRequiredMixin, generic.View):
@@ -24,7 +24,7 @@ class JudgementListView(ProblemEditorMemberRequiredMixin, generic.View):
         if has_limited_problems_queryset(request.user):
             queryset = queryset.filter(solution__problem_id__in=get_problem_ids_queryset(request.user))
 
-        context = paginate(request, queryset, self.paginate_by, allow_all=True, show_total_count=request.user.is_staff)
+        context = paginate(request, queryset, self.paginate_by, allow_all=True, show_total_count=request.user.is_staff, keyset=True)
         return render(request, self.template_name, context)
 
 
@@ -33,7 +33,7 @@ class JudgementMixin:
         solution = Solution.objects.filter(judgement__id=judgement_id).first()
         if solution is None:
             raise Http404('Judjement not found')
-        permissions, _ = calculate_permissions(solution, self.request.user)
+        permissions, _ = SolutionPermissionResolver.for_request(request).resolve(solution)
         if not permissions.can_view_judgements:
             raise Http404('Access denied')
         return super().dispatch(request, judgement_id, *args, **kwargs)
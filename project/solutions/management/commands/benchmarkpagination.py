@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.test import RequestFactory
+
+from common.pagination import paginate
+from contests.management.commands.benchmarkstandings import Rollback, _fill_contest
+from solutions.models import Solution
+
+
+def _measure(func, repeat):
+    t1 = time.time()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.time() - t1) / repeat
+
+
+class Command(BaseCommand):
+    help = 'Compares OFFSET and keyset pagination of solution lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--runs', type=int, default=100000)
+        parser.add_argument('--size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        factory = RequestFactory()
+        size = options['size']
+        repeat = options['repeat']
+
+        try:
+            with transaction.atomic():
+                t1 = time.time()
+                contest, _, _, _, _ = _fill_contest(100, 10, options['runs'], random.Random(1))
+                logger.info('Test contest has been filled in %.1f s', time.time() - t1)
+
+                lists = [
+                    ('all solutions', Solution.objects.
+                        select_related('best_judgement').
+                        prefetch_related('compiler', 'problem', 'author').
+                        order_by('-id'), False),
+                    ('contest solutions', Solution.objects.
+                        filter(contestsolution__contest=contest).
+                        prefetch_related('compiler').
+                        select_related('source_code', 'best_judgement', 'author').
+                        annotate(is_disqualified=F('contestsolution__is_disqualified')).
+                        order_by('-reception_time', 'id'), True),
+                ]
+
+                print('list\tpage\toffset, s\tkeyset, s')
+                for name, queryset, show_total_count in lists:
+                    last_page = options['runs'] // size
+                    for page in (1, last_page // 2, last_page):
+                        def offset():
+                            context = paginate(factory.get('/', {'page': page, 'size': size}), queryset, size,
+                                               allow_all=False, show_total_count=show_total_count)
+                            return [solution.id for solution in context['object_list']]
+
+                        # the cursor that the previous page links to
+                        if page > 1:
+                            context = paginate(factory.get('/', {'page': page - 1, 'size': size}), queryset, size,
+                                               allow_all=False, show_total_count=False, keyset=True)
+                            params = {'after': context['pagination_context'].page_obj.next_cursor, 'size': size}
+                        else:
+                            params = {'size': size}
+
+                        def keyset():
+                            context = paginate(factory.get('/', params), queryset, size,
+                                               allow_all=False, show_total_count=show_total_count, keyset=True)
+                            return [solution.id for solution in context['object_list']]
+
+                        cache.clear()
+                        expected, offset_elapsed = _measure(offset, repeat)
+                        actual, keyset_elapsed = _measure(keyset, repeat)
+                        print('{}\t{}\t{:.4f}\t{:.4f}'.format(name, page, offset_elapsed, keyset_elapsed))
+                        if actual != expected:
+                            logger.error('Keyset pagination differs from OFFSET: %s, page %d', name, page)
+
+                cache.clear()
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.outcome import Outcome
+from contests.management.commands.benchmarkstandings import Rollback, _fill_contest
+from problems.models import Problem
+from proglangs.langlist import ProgrammingLanguage
+from solutions.filters import apply_compiler_filter, apply_difficulty_filter, apply_state_filter
+from solutions.models import Judgement, Solution, SolutionListEntry, update_solution_list
+
+# the filters of the list of all solutions: (name, filters by joins, form data)
+FILTERS = [
+    ('none', {}, {}),
+    ('accepted', {'best_judgement__status': Judgement.DONE, 'best_judgement__outcome': Outcome.ACCEPTED}, {'state': 'ok'}),
+    ('C++', {'compiler__language': ProgrammingLanguage.CPP}, {'compiler': ProgrammingLanguage.CPP}),
+    ('difficulty 7-8', {'problem__difficulty__gte': 7, 'problem__difficulty__lte': 8}, {'difficulty': '7-8'}),
+    ('accepted, C++, difficulty 7-8',
+     {'best_judgement__status': Judgement.DONE, 'best_judgement__outcome': Outcome.ACCEPTED,
+      'compiler__language': ProgrammingLanguage.CPP, 'problem__difficulty__gte': 7, 'problem__difficulty__lte': 8},
+     {'state': 'ok', 'compiler': ProgrammingLanguage.CPP, 'difficulty': '7-8'}),
+]
+
+
+def _measure(func, repeat):
+    t1 = time.time()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.time() - t1) / repeat
+
+
+class Command(BaseCommand):
+    help = 'Compares filtering of the list of all solutions by joins and by the read model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--runs', type=int, default=2000000)
+        parser.add_argument('--size', type=int, default=25)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        rng = random.Random(1)
+        size = options['size']
+        repeat = options['repeat']
+
+        try:
+            with transaction.atomic():
+                t1 = time.time()
+                _, _, problem_ids, _, _ = _fill_contest(1000, 100, options['runs'], rng)
+                for problem_id in problem_ids:
+                    Problem.objects.filter(pk=problem_id).update(difficulty=rng.choice([None, 4, 5, 6, 7, 8, 9]))
+                logger.info('Test contest has been filled in %.1f s', time.time() - t1)
+
+                t1 = time.time()
+                update_solution_list(Solution.objects.filter(problem_id__in=problem_ids).values_list('id', flat=True))
+                logger.info('Read model has been filled in %.1f s', time.time() - t1)
+
+                print('filter\tcount\tjoins, s\tread model, s')
+                for name, lookups, data in FILTERS:
+                    def by_joins():
+                        queryset = Solution.objects.filter(**lookups).order_by('-id')
+                        return queryset.count(), list(queryset.values_list('id', flat=True)[:size])
+
+                    def by_read_model():
+                        queryset = SolutionListEntry.objects.order_by('-solution')
+                        queryset = apply_state_filter(queryset, data.get('state'), prefix='')
+                        queryset = apply_compiler_filter(queryset, data.get('compiler'))
+                        queryset = apply_difficulty_filter(queryset, data.get('difficulty'))
+                        return queryset.count(), list(queryset.values_list('solution_id', flat=True)[:size])
+
+                    expected, joins_elapsed = _measure(by_joins, repeat)
+                    actual, read_model_elapsed = _measure(by_read_model, repeat)
+                    print('{}\t{}\t{:.4f}\t{:.4f}'.format(name, expected[0], joins_elapsed, read_model_elapsed))
+                    if actual != expected:
+                        logger.error('Read model differs from joins: %s', name)
+
+                raise Rollback()
+        except Rollback:
+            pass
@@ -8,7 +8,7 @@ from django.utils.timezone import make_aware
 from common.outcome import Outcome
 from common.irunner_import import connect_irunner_db, fetch_irunner_file
 from common.memory_string import parse_memory
-from solutions.models import Solution, Judgement, TestCaseResult
+from solutions.models import Solution, Judgement, TestCaseResult, update_solution_list
 from problems.models import Problem, TestCase
 from storage.storage import create_storage
 from storage.models import FileMetadata
@@ -175,5 +175,6 @@ class Command(BaseCommand):
 
                 solution.best_judgement = judgement
                 solution.save()
+                update_solution_list([solution.id])
 
                 _fetch_test_results(db, storage, logger, problem_id, solution_id)
@@ -0,0 +1,68 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_solution_list(apps, schema_editor):
+    Solution = apps.get_model('solutions', 'Solution')
+    SolutionListEntry = apps.get_model('solutions', 'SolutionListEntry')
+
+    SolutionListEntry.objects.bulk_create((
+        SolutionListEntry(solution_id=solution_id, author_id=author_id, problem_id=problem_id, compiler_id=compiler_id,
+                          best_judgement_id=best_judgement_id, status=status, outcome=outcome,
+                          score=score, max_score=max_score, relevance=relevance)
+        for (solution_id, author_id, problem_id, compiler_id, best_judgement_id,
+             status, outcome, score, max_score, relevance) in Solution.objects.values_list(
+            'id', 'author_id', 'problem_id', 'compiler_id', 'best_judgement_id',
+            'best_judgement__status', 'best_judgement__outcome', 'best_judgement__score', 'best_judgement__max_score',
+            'aggregatedresult__relevance').order_by('id').iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('proglangs', '0005_auto_20200627_1743'),
+        ('problems', '0020_auto_20210706_0236'),
+        ('plagiarism', '0003_pendingsolution'),
+        ('solutions', '0014_auto_20200627_1640'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolutionListEntry',
+            fields=[
+                ('solution', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='list_entry', serialize=False, to='solutions.solution')),
+                ('status', models.IntegerField(null=True)),
+                ('outcome', models.IntegerField(null=True)),
+                ('score', models.IntegerField(null=True)),
+                ('max_score', models.IntegerField(null=True)),
+                ('relevance', models.FloatField(null=True)),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('best_judgement', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='solutions.judgement')),
+                ('compiler', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='proglangs.compiler')),
+                ('problem', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='problems.problem')),
+            ],
+        ),
+        # the table is filled in before it is indexed
+        migrations.RunPython(fill_solution_list, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='solutionlistentry',
+            index=models.Index(fields=['author', 'solution'], name='solutions_s_author__efc674_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solutionlistentry',
+            index=models.Index(fields=['problem', 'solution'], name='solutions_s_problem_1c23e3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solutionlistentry',
+            index=models.Index(fields=['compiler', 'solution'], name='solutions_s_compile_9035fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solutionlistentry',
+            index=models.Index(fields=['status', 'outcome', 'solution'], name='solutions_s_status_d836d0_idx'),
+        ),
+    ]
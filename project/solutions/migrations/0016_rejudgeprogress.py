@@ -0,0 +1,71 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+DONE = 0
+ACCEPTED = 1
+
+
+def fill_rejudge_progress(apps, schema_editor):
+    Rejudge = apps.get_model('solutions', 'Rejudge')
+    Judgement = apps.get_model('solutions', 'Judgement')
+    RejudgeProgress = apps.get_model('solutions', 'RejudgeProgress')
+    RejudgeTransition = apps.get_model('solutions', 'RejudgeTransition')
+
+    progress = {rejudge_id: [0, 0, 0, 0] for rejudge_id in Rejudge.objects.values_list('id', flat=True)}
+    transitions = {}
+    for rejudge_id, status, outcome, before_status, before_outcome in Judgement.objects.\
+            filter(rejudge__isnull=False).\
+            values_list('rejudge_id', 'status', 'outcome', 'judgement_before__status', 'judgement_before__outcome').\
+            iterator():
+        counters = progress[rejudge_id]
+        counters[0] += 1
+        if status == DONE:
+            counters[1] += 1
+            counters[2 if outcome == ACCEPTED else 3] += 1
+            key = (rejudge_id, before_outcome if before_status == DONE else None, outcome)
+            transitions[key] = transitions.get(key, 0) + 1
+
+    RejudgeProgress.objects.bulk_create((
+        RejudgeProgress(rejudge_id=rejudge_id, total=total, done=done, accepted=accepted, rejected=rejected)
+        for rejudge_id, (total, done, accepted, rejected) in progress.items()
+    ), batch_size=1000)
+    RejudgeTransition.objects.bulk_create((
+        RejudgeTransition(rejudge_id=rejudge_id, outcome_before=outcome_before, outcome_after=outcome_after, count=count)
+        for (rejudge_id, outcome_before, outcome_after), count in transitions.items()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('solutions', '0015_solutionlistentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RejudgeProgress',
+            fields=[
+                ('rejudge', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='progress', serialize=False, to='solutions.rejudge')),
+                ('total', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('accepted', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RejudgeTransition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome_before', models.IntegerField(choices=[(0, 'N/A'), (1, 'Accepted'), (2, 'Compilation Error'), (3, 'Wrong Answer'), (4, 'Time Limit Exceeded'), (5, 'Memory Limit Exceeded'), (6, 'Idleness Limit Exceeded'), (7, 'Run-time Error'), (8, 'Presentation Error'), (9, 'Security Violation'), (10, 'Check Failed'), (11, 'Failed')], null=True)),
+                ('outcome_after', models.IntegerField(choices=[(0, 'N/A'), (1, 'Accepted'), (2, 'Compilation Error'), (3, 'Wrong Answer'), (4, 'Time Limit Exceeded'), (5, 'Memory Limit Exceeded'), (6, 'Idleness Limit Exceeded'), (7, 'Run-time Error'), (8, 'Presentation Error'), (9, 'Security Violation'), (10, 'Check Failed'), (11, 'Failed')])),
+                ('count', models.IntegerField(default=0)),
+                ('rejudge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='solutions.rejudge')),
+            ],
+            options={
+                'unique_together': {('rejudge', 'outcome_before', 'outcome_after')},
+            },
+        ),
+        migrations.RunPython(fill_rejudge_progress, migrations.RunPython.noop),
+    ]
@@ -25,16 +25,24 @@ class TestCaseResultMixin(object):
         max_line_length = None
         storage = create_storage()
 
+        input_repr, output_repr, answer_repr, stdout_repr, stderr_repr = storage.represent_many([
+            testcaseresult.input_resource_id,
+            testcaseresult.output_resource_id,
+            testcaseresult.answer_resource_id,
+            testcaseresult.stdout_resource_id,
+            testcaseresult.stderr_resource_id,
+        ], limit=limit, max_lines=max_lines, max_line_length=max_line_length)
+
         context = {
             'test_case_result': testcaseresult,
             'data_url_pattern': data_url_pattern,
             'image_url_pattern': image_url_pattern,
             'item_id': item_id,
-            'input_repr': storage.represent(testcaseresult.input_resource_id, limit=limit, max_lines=max_lines, max_line_length=max_line_length),
-            'output_repr': storage.represent(testcaseresult.output_resource_id, limit=limit, max_lines=max_lines, max_line_length=max_line_length),
-            'answer_repr': storage.represent(testcaseresult.answer_resource_id, limit=limit, max_lines=max_lines, max_line_length=max_line_length),
-            'stdout_repr': storage.represent(testcaseresult.stdout_resource_id, limit=limit, max_lines=max_lines, max_line_length=max_line_length),
-            'stderr_repr': storage.represent(testcaseresult.stderr_resource_id, limit=limit, max_lines=max_lines, max_line_length=max_line_length),
+            'input_repr': input_repr,
+            'output_repr': output_repr,
+            'answer_repr': answer_repr,
+            'stdout_repr': stdout_repr,
+            'stderr_repr': stderr_repr,
             'wide': not (self.request.GET.get('c') == '1'),
             'can_refer_to_problem': refer_to_problem,
         }
@@ -37,6 +37,31 @@ class Rejudge(models.Model):
     creation_time = models.DateTimeField(auto_now_add=True)
 
 
+class RejudgeProgress(models.Model):
+    '''
+    The counters of a rejudge that are updated as its judgements finish (see solutions.rejudge.progress).
+    '''
+    rejudge = models.OneToOneField(Rejudge, on_delete=models.CASCADE, primary_key=True, related_name='progress')
+    total = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    accepted = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+
+class RejudgeTransition(models.Model):
+    '''
+    The number of the finished judgements of a rejudge with the given outcomes before and after it.
+    outcome_before is None if the solution had not been judged before.
+    '''
+    rejudge = models.ForeignKey(Rejudge, on_delete=models.CASCADE)
+    outcome_before = models.IntegerField(null=True, choices=Outcome.CHOICES)
+    outcome_after = models.IntegerField(choices=Outcome.CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('rejudge', 'outcome_before', 'outcome_after')
+
+
 class Judgement(models.Model):
     DONE = 0
     WAITING = 1
@@ -167,3 +192,86 @@ class ChallengedSolution(models.Model):
     exit_code = models.IntegerField(null=True)
     time_used = models.IntegerField(null=True)
     memory_used = models.BigIntegerField(null=True)
+
+
+class SolutionListEntry(models.Model):
+    '''
+    The read model of the list of all solutions: a copy of the columns of the solution,
+    its best judgement and its plagiarism report that the list is filtered by,
+    so that the filtered list and its count are served by a single table.
+    The attributes of problems and compilers are not copied: there are few of them,
+    so they are filtered by with a subquery (see solutions.filters).
+    The entries are kept up to date by update_solution_list() and update_solution_list_state().
+    '''
+    solution = models.OneToOneField(Solution, on_delete=models.CASCADE, primary_key=True, related_name='list_entry')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False, related_name='+')
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE, db_index=False, related_name='+')
+    compiler = models.ForeignKey(Compiler, on_delete=models.CASCADE, db_index=False, related_name='+')
+
+    best_judgement = models.ForeignKey(Judgement, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.IntegerField(null=True)
+    outcome = models.IntegerField(null=True)
+    score = models.IntegerField(null=True)
+    max_score = models.IntegerField(null=True)
+
+    relevance = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', 'solution']),
+            models.Index(fields=['problem', 'solution']),
+            models.Index(fields=['compiler', 'solution']),
+            models.Index(fields=['status', 'outcome', 'solution']),
+        ]
+
+
+SOLUTION_LIST_COLUMNS = (
+    'id',
+    'author_id',
+    'problem_id',
+    'compiler_id',
+    'best_judgement_id',
+    'best_judgement__status',
+    'best_judgement__outcome',
+    'best_judgement__score',
+    'best_judgement__max_score',
+    'aggregatedresult__relevance',
+)
+
+SOLUTION_LIST_CHUNK_SIZE = 1000
+
+
+def _make_solution_list_entry(row):
+    (solution_id, author_id, problem_id, compiler_id, best_judgement_id,
+     status, outcome, score, max_score, relevance) = row
+    return SolutionListEntry(solution_id=solution_id, author_id=author_id, problem_id=problem_id, compiler_id=compiler_id,
+                             best_judgement_id=best_judgement_id, status=status, outcome=outcome,
+                             score=score, max_score=max_score, relevance=relevance)
+
+
+def update_solution_list(solution_ids):
+    '''
+    Must be called in the same transaction as (or after) the creation of solutions,
+    a change of their best judgement or of its outcome, or a new plagiarism report on them.
+    '''
+    solution_ids = list(solution_ids)
+    for i in range(0, len(solution_ids), SOLUTION_LIST_CHUNK_SIZE):
+        chunk = solution_ids[i:i + SOLUTION_LIST_CHUNK_SIZE]
+        entries = [
+            _make_solution_list_entry(row)
+            for row in Solution.objects.filter(id__in=chunk).values_list(*SOLUTION_LIST_COLUMNS)
+        ]
+        SolutionListEntry.objects.filter(solution_id__in=chunk).delete()
+        # the entry may have been inserted by a concurrent transaction in the meantime
+        SolutionListEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def update_solution_list_state(judgement_ids, status):
+    '''
+    Copies the status of the judgements that are being tested to the entries of the solutions
+    whose best judgements they are. Finished judgements are updated by update_solution_list().
+    '''
+    SolutionListEntry.objects.\
+        filter(best_judgement_id__in=judgement_ids).\
+        exclude(status=Judgement.DONE).\
+        update(status=status)
@@ -0,0 +1,117 @@
+'''
+The progress of rejudges.
+
+The counters of a rejudge are updated in the same transaction as its judgements finish,
+so watching the progress costs a single-row lookup instead of counting the judgements.
+The clients wait for the changes as they do for the status of a solution (see solutions.status),
+or poll if the waiting is disabled (REJUDGE_PROGRESS_WAIT_TIMEOUT is 0, the default).
+'''
+
+from collections import namedtuple
+
+from django.core import signing
+from django.db.models import F
+
+from common.outcome import Outcome
+
+from solutions.models import Judgement, RejudgeProgress, RejudgeTransition
+from solutions.status import increment_versions_on_commit, wait_for_change
+
+VERSION_KEY_FORMAT = 'solutions:rejudge:{}:version'
+
+SUBSCRIPTION_SALT = 'solutions.rejudge.progress'
+SUBSCRIPTION_MAX_AGE = 24 * 60 * 60
+
+# milliseconds the clients wait before the next request if the server does not wait for the changes
+CLIENT_POLL_DELAY = 2000
+
+RejudgeStats = namedtuple('RejudgeStats', ['total', 'accepted', 'rejected'])
+
+
+def _make_key(rejudge_id):
+    return VERSION_KEY_FORMAT.format(rejudge_id)
+
+
+def _get_deltas(outcome):
+    '''
+    Returns the changes of (accepted, rejected) counters for a finished judgement.
+    '''
+    return (1, 0) if outcome == Outcome.ACCEPTED else (0, 1)
+
+
+def register_rejudge_result(judgement, previous_outcome=None):
+    '''
+    Must be called in the same transaction as the judgement of a rejudge is finished.
+    previous_outcome: the outcome of the judgement if it had already been finished (i.e. the report is repeated).
+    '''
+    if judgement.rejudge_id is None:
+        return
+
+    accepted, rejected = _get_deltas(judgement.outcome)
+    done = 1
+    if previous_outcome is not None:
+        previous_accepted, previous_rejected = _get_deltas(previous_outcome)
+        accepted -= previous_accepted
+        rejected -= previous_rejected
+        done = 0
+
+    # the update locks the row, so the judgements of the same rejudge are registered one by one
+    RejudgeProgress.objects.\
+        filter(pk=judgement.rejudge_id).\
+        update(done=F('done') + done, accepted=F('accepted') + accepted, rejected=F('rejected') + rejected)
+
+    outcome_before = None
+    if judgement.judgement_before_id is not None:
+        outcome_before = Judgement.objects.\
+            filter(pk=judgement.judgement_before_id, status=Judgement.DONE).\
+            values_list('outcome', flat=True).\
+            first()
+
+    if previous_outcome is not None:
+        RejudgeTransition.objects.\
+            filter(rejudge_id=judgement.rejudge_id, outcome_before=outcome_before, outcome_after=previous_outcome).\
+            update(count=F('count') - 1)
+
+    transition, _ = RejudgeTransition.objects.get_or_create(rejudge_id=judgement.rejudge_id, outcome_before=outcome_before,
+                                                            outcome_after=judgement.outcome)
+    RejudgeTransition.objects.filter(pk=transition.pk).update(count=F('count') + 1)
+
+    increment_versions_on_commit([_make_key(judgement.rejudge_id)])
+
+
+def make_stats(progress):
+    return RejudgeStats(progress.total, progress.accepted, progress.rejected)
+
+
+def get_progress_version(progress):
+    return '{}.{}.{}'.format(progress.done, progress.accepted, progress.rejected)
+
+
+def make_subscription(rejudge_id, user_id):
+    return signing.dumps([int(rejudge_id), user_id], salt=SUBSCRIPTION_SALT)
+
+
+def check_subscription(token, rejudge_id, user_id):
+    try:
+        token_rejudge_id, token_user_id = signing.loads(token, salt=SUBSCRIPTION_SALT, max_age=SUBSCRIPTION_MAX_AGE)
+    except (signing.BadSignature, ValueError, TypeError):
+        return False
+    return token_rejudge_id == int(rejudge_id) and token_user_id == user_id
+
+
+def get_poll_delay(timeout):
+    return 0 if timeout > 0 else CLIENT_POLL_DELAY
+
+
+def wait_for_progress_change(rejudge_id, version, timeout):
+    '''
+    Waits until the version of the progress of the rejudge differs from the given one or the timeout expires.
+    Returns the progress.
+    '''
+    return wait_for_change(
+        lambda: RejudgeProgress.objects.get(pk=rejudge_id),
+        get_progress_version,
+        lambda progress: _make_key(rejudge_id),
+        version,
+        timeout
+    )
@@ -1,7 +1,8 @@
 from collections import namedtuple
 
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Count
+from django.db.models import Count, F
 from django.http import JsonResponse, Http404
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
@@ -9,21 +10,31 @@ from django.utils.translation import pgettext_lazy
 from django.views import generic
 
 from cauth.mixins import ProblemEditorMemberRequiredMixin, StaffMemberRequiredMixin
-from common.outcome import Outcome
+from common.pagination import paginate
 from common.pagination.views import IRunnerListView
 from common.views import MassOperationView
+from contests.models import register_solution_changes
 from problems.calcpermissions import get_problem_ids_queryset, has_limited_problems_queryset
 from problems.models import Problem
 from problems.problem.permissions import ProblemPermissionCalcer
 
-from solutions.models import Solution, Judgement, Rejudge
+from solutions.models import Solution, Judgement, Rejudge, RejudgeProgress, RejudgeTransition, update_solution_list
 from solutions.utils import bulk_rejudge
 
 from .permissions import RejudgePermissions
+from .progress import (
+    check_subscription,
+    get_poll_delay,
+    get_progress_version,
+    make_stats,
+    make_subscription,
+    wait_for_progress_change,
+)
 
 
 class RejudgeListView(ProblemEditorMemberRequiredMixin, IRunnerListView):
     template_name = 'solutions/rejudge/rejudge_list.html'
+    keyset = True
 
     def get_queryset(self):
         qs = Rejudge.objects.all()
@@ -52,15 +63,6 @@ class CreateRejudgeView(StaffMemberRequiredMixin, MassOperationView):
 
 
 RejudgeInfo = namedtuple('RejudgeInfo', ['solution', 'before', 'after', 'current', 'is_available'])
-RejudgeStats = namedtuple('RejudgeStats', ['total', 'accepted', 'rejected'])
-
-
-def fetch_rejudge_stats(rejudge_id):
-    queryset = Judgement.objects.filter(rejudge_id=rejudge_id)
-    total = queryset.count()
-    accepted = queryset.filter(status=Judgement.DONE).filter(outcome=Outcome.ACCEPTED).count()
-    rejected = queryset.filter(status=Judgement.DONE).exclude(outcome=Outcome.ACCEPTED).count()
-    return RejudgeStats(total, accepted, rejected)
 
 
 def calc_permissions(user, rejudge, any_problem_available, can_rejudge_all):
@@ -79,19 +81,23 @@ def calc_permissions(user, rejudge, any_problem_available, can_rejudge_all):
 
 class RejudgeMixin(ProblemEditorMemberRequiredMixin):
     def dispatch(self, request, rejudge_id, *args, **kwargs):
+        self.check_access(request, rejudge_id)
+        return super().dispatch(request, rejudge_id, *args, **kwargs)
+
+    def check_access(self, request, rejudge_id):
         self.rejudge = Rejudge.objects.filter(pk=rejudge_id).first()
         if self.rejudge is None:
             raise Http404('Rejudge not found')
 
         self.problems_available = set()
 
-        problem_ids = self.rejudge.judgement_set.all().values_list('solution__problem_id', flat=True).distinct()
-        problem_perms = ProblemPermissionCalcer(request.user).calc_in_bulk(problem_ids)
+        self.problem_ids = set(self.rejudge.judgement_set.all().values_list('solution__problem_id', flat=True).distinct())
+        problem_perms = ProblemPermissionCalcer(request.user).calc_in_bulk(self.problem_ids)
 
         any_problem_available = False
         can_rejudge_all = True
 
-        for problem_id in problem_ids:
+        for problem_id in self.problem_ids:
             perms = problem_perms.get(problem_id)
             if perms is not None:
                 any_problem_available = True
@@ -103,27 +109,35 @@ class RejudgeMixin(ProblemEditorMemberRequiredMixin):
         if self.permissions is None:
             raise Http404('Access denied')
 
-        return super().dispatch(request, rejudge_id, *args, **kwargs)
-
 
 class RejudgeView(RejudgeMixin, generic.View):
     template_name = 'solutions/rejudge/rejudge.html'
+    paginate_by = 100
 
     def get(self, request, rejudge_id):
+        changed = bool(request.GET.get('changed'))
+
+        queryset = self.rejudge.judgement_set.all().\
+            select_related('solution').\
+            select_related('judgement_before').\
+            select_related('solution__best_judgement').\
+            select_related('solution__author').\
+            select_related('solution__source_code').\
+            prefetch_related('solution__compiler').\
+            order_by('id')
+        if changed:
+            # the judgements that have finished with another result
+            queryset = queryset.\
+                filter(status=Judgement.DONE).\
+                exclude(judgement_before__status=Judgement.DONE,
+                        judgement_before__outcome=F('outcome'),
+                        judgement_before__score=F('score'))
+
+        context = paginate(request, queryset, self.paginate_by, allow_all=False, show_total_count=False, keyset=True)
+
         object_list = []
-        problem_ids = set()
-
-        for new_judgement in self.rejudge.judgement_set.all().\
-                select_related('solution').\
-                select_related('judgement_before').\
-                select_related('solution__best_judgement').\
-                select_related('solution__author').\
-                select_related('solution__source_code').\
-                prefetch_related('solution__compiler'):
+        for new_judgement in context['object_list']:
             solution = new_judgement.solution
-
-            problem_ids.add(solution.problem_id)
-
             before = new_judgement.judgement_before
             after = new_judgement
             current = solution.best_judgement
@@ -131,18 +145,25 @@ class RejudgeView(RejudgeMixin, generic.View):
             object_list.append(RejudgeInfo(solution, before, after, current, is_available))
 
         problem = None
-        if len(problem_ids) == 1:
-            problem = Problem.objects.get(pk=next(iter(problem_ids)))
+        if len(self.problem_ids) == 1:
+            problem = Problem.objects.get(pk=next(iter(self.problem_ids)))
 
+        progress = get_object_or_404(RejudgeProgress, pk=rejudge_id)
         progress_url = reverse('solutions:rejudge_status_json', kwargs={'rejudge_id': rejudge_id})
-        context = {
+        transitions = RejudgeTransition.objects.\
+            filter(rejudge_id=rejudge_id, count__gt=0).\
+            order_by('outcome_before', 'outcome_after')
+
+        context.update({
             'rejudge': self.rejudge,
             'permissions': self.permissions,
             'object_list': object_list,
+            'changed': changed,
             'progress_url': progress_url,
-            'stats': fetch_rejudge_stats(rejudge_id),
+            'stats': make_stats(progress),
+            'transitions': transitions,
             'problem': problem,
-        }
+        })
         return render(request, self.template_name, context)
 
     def post(self, request, rejudge_id):
@@ -161,19 +182,42 @@ class RejudgeView(RejudgeMixin, generic.View):
             if num_rows and need_commit:
                 with transaction.atomic():
                     rejudge = get_object_or_404(Rejudge, pk=rejudge_id)
+                    solution_ids = []
                     for new_judgement in rejudge.judgement_set.all().select_related('solution'):
                         solution = new_judgement.solution
                         solution.best_judgement = new_judgement
                         solution.save()
+                        solution_ids.append(solution.id)
+                    register_solution_changes(solution_ids)
+                    update_solution_list(solution_ids)
 
         return redirect('solutions:rejudge', rejudge_id)
 
 
 class RejudgeJsonView(RejudgeMixin, generic.View):
+    '''
+    Long polling: the response is delayed until the progress differs from the version the client has.
+    The first request is checked for permissions and gets a token that is passed back with the next requests.
+    '''
+    def check_access(self, request, rejudge_id):
+        if not check_subscription(request.GET.get('token', ''), rejudge_id, request.user.id):
+            super(RejudgeJsonView, self).check_access(request, rejudge_id)
+
     def get(self, request, rejudge_id):
-        stats = fetch_rejudge_stats(rejudge_id)
+        token = request.GET.get('token', '')
+        timeout = settings.REJUDGE_PROGRESS_WAIT_TIMEOUT
+        if check_subscription(token, rejudge_id, request.user.id):
+            progress = wait_for_progress_change(rejudge_id, request.GET.get('version', ''), timeout)
+        else:
+            token = make_subscription(rejudge_id, request.user.id)
+            progress = get_object_or_404(RejudgeProgress, pk=rejudge_id)
+
+        stats = make_stats(progress)
         return JsonResponse({
             'total': stats.total,
             'valueGood': stats.accepted,
             'valueBad': stats.rejected,
+            'version': get_progress_version(progress),
+            'token': token,
+            'delay': get_poll_delay(timeout),
         })
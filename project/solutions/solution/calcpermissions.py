@@ -1,26 +1,101 @@
-from contests.calcpermissions import calculate_contest_solution_permissions_ex
-from courses.calcpermissions import calculate_course_solution_permissions_ex
-from problems.calcpermissions import calculate_problem_solution_permissions
+from contests.calcpermissions import ContestMemberFlags, make_contest_solution_permissions
+from contests.models import ContestSolution
+from courses.calcpermissions import CourseMemberFlags, make_course_solution_permissions
+from courses.models import CourseSolution
+from problems.calcpermissions import make_problem_solution_permissions
+from problems.problem.permissions import ProblemPermissionCalcer
 
 from solutions.permissions import SolutionPermissions, SolutionEnvironment
 
 
-def calculate_permissions(solution, user):
-    permissions = SolutionPermissions()
+class SolutionPermissionResolver(object):
+    '''
+    Calculates the permissions of the user for solutions. The number of DB queries
+    does not depend on the number of solutions, and the courses, contests and problems
+    that have been looked up once are remembered, so the resolver should be shared
+    by all the code that handles a request (see for_request()).
+    '''
+    def __init__(self, user):
+        self.user = user
+        self._courses = {}
+        self._contests = {}
+        self._course_flags = {}
+        self._contest_flags = {}
+        self._problem_permissions = {}
+
+    @staticmethod
+    def for_request(request):
+        resolver = getattr(request, '_solution_permission_resolver', None)
+        if resolver is None or resolver.user is not request.user:
+            resolver = SolutionPermissionResolver(request.user)
+            request._solution_permission_resolver = resolver
+        return resolver
+
+    def _load(self, solutions):
+        solution_ids = [solution.id for solution in solutions if solution.id not in self._courses]
+        if solution_ids:
+            for solution_id in solution_ids:
+                self._courses[solution_id] = None
+                self._contests[solution_id] = None
+            for link in CourseSolution.objects.filter(solution_id__in=solution_ids).select_related('course'):
+                self._courses[link.solution_id] = link.course
+            for link in ContestSolution.objects.filter(solution_id__in=solution_ids).select_related('contest'):
+                self._contests[link.solution_id] = link.contest
+
+        courses = {}
+        contests = {}
+        problem_ids = set()
+        for solution in solutions:
+            course = self._courses[solution.id]
+            if course is not None and course.id not in self._course_flags:
+                courses[course.id] = course
+            contest = self._contests[solution.id]
+            if contest is not None and contest.id not in self._contest_flags:
+                contests[contest.id] = contest
+            if solution.problem_id is not None and solution.problem_id not in self._problem_permissions:
+                problem_ids.add(solution.problem_id)
+
+        if courses:
+            self._course_flags.update(CourseMemberFlags.load_many(list(courses.values()), self.user))
+        if contests:
+            self._contest_flags.update(ContestMemberFlags.load_many(list(contests.values()), self.user))
+        if problem_ids:
+            self._problem_permissions.update(ProblemPermissionCalcer(self.user).calc_in_bulk(problem_ids))
+
+    def _resolve(self, solution):
+        permissions = SolutionPermissions()
 
-    # course
-    in_course = calculate_course_solution_permissions_ex(solution, user)
-    permissions |= in_course.permissions
+        # course
+        course = self._courses[solution.id]
+        in_course = make_course_solution_permissions(course, self._course_flags.get(course.id) if course is not None else None, solution, self.user)
+        permissions |= in_course.permissions
 
-    # contest
-    in_contest = calculate_contest_solution_permissions_ex(solution, user)
-    permissions |= in_contest.permissions
+        # contest
+        contest = self._contests[solution.id]
+        in_contest = make_contest_solution_permissions(contest, self._contest_flags.get(contest.id) if contest is not None else None, solution, self.user)
+        permissions |= in_contest.permissions
 
-    # problem
-    permissions |= calculate_problem_solution_permissions(solution, user)
+        # problem
+        if solution.problem_id is not None:
+            permissions |= make_problem_solution_permissions(self._problem_permissions[solution.problem_id])
 
-    if user.is_staff:
-        permissions.allow_view_ip_address()
+        if self.user.is_staff:
+            permissions.allow_view_ip_address()
 
-    return (permissions, SolutionEnvironment(in_course.course, in_course.link_to_course,
-                                             in_contest.contest, in_contest.link_to_contest))
+        return (permissions, SolutionEnvironment(in_course.course, in_course.link_to_course,
+                                                 in_contest.contest, in_contest.link_to_contest))
+
+    def resolve_many(self, solutions):
+        '''
+        Returns a list of (SolutionPermissions, SolutionEnvironment) in the order of solutions.
+        '''
+        solutions = list(solutions)
+        self._load(solutions)
+        return [self._resolve(solution) for solution in solutions]
+
+    def resolve(self, solution):
+        return self.resolve_many([solution])[0]
+
+
+def calculate_permissions(solution, user):
+    return SolutionPermissionResolver(user).resolve(solution)
@@ -20,9 +20,10 @@ from storage.utils import serve_resource, serve_resource_metadata
 
 from solutions.mixins import TestCaseResultMixin
 from solutions.models import Solution, Judgement, TestCaseResult, JudgementLog
+from solutions.status import get_poll_delay, get_status_version, load_subscription, make_subscription, wait_for_status_change
 from solutions.utils import bulk_rejudge
 
-from .calcpermissions import calculate_permissions
+from .calcpermissions import SolutionPermissionResolver
 
 
 class BaseSolutionView(LoginRequiredMixin, generic.View):
@@ -64,7 +65,7 @@ class BaseSolutionView(LoginRequiredMixin, generic.View):
 
     def get(self, request, solution_id, *args, **kwargs):
         self.solution = self._load_solution(solution_id)
-        self.permissions, self.environment = calculate_permissions(self.solution, request.user)
+        self.permissions, self.environment = SolutionPermissionResolver.for_request(request).resolve(self.solution)
 
         result = self.do_checked_get(request, self.solution, *args, **kwargs)
         return result
@@ -142,6 +143,26 @@ class SolutionJudgementsView(BaseSolutionView):
         return render(request, self.template_name, context)
 
 
+def _make_status_data(judgement, complete):
+    if judgement is None:
+        return {
+            'text': 'N/A',
+            'final': False
+        }
+
+    final = (judgement.status == Judgement.DONE)
+    data = {
+        'text': force_text(judgement.show_status(complete)),
+        'final': final
+    }
+    if final:
+        if complete or (judgement.sample_tests_passed is False):
+            data['color'] = 'green' if (judgement.outcome == Outcome.ACCEPTED) ^ settings.APRIL_FOOLS_DAY_MODE else 'red'
+        else:
+            data['color'] = 'yellow'
+    return data
+
+
 def _get_compilation_log_repr(judgement):
     if judgement is not None:
         judgementlog = judgement.judgementlog_set.filter(kind=JudgementLog.SOLUTION_COMPILATION).first()
@@ -276,31 +297,46 @@ class SolutionStatusJsonView(BaseSolutionView):
             context = self.get_context_data(mode='test_results', test_results=_get_plain_testcaseresults(judgement))
         return render_to_string(self.template_name, context, request)
 
-    def do_get(self, request, solution):
+    def get_data(self, request, solution):
         judgement = solution.best_judgement
+        data = _make_status_data(judgement, self.permissions.can_view_state)
+        if data['final'] and request.GET.get('table') == '1':
+            data['report'] = self._render_report(request, judgement)
+            data['box'] = render_to_string(self.box_template_name, self.get_context_data(), request)
+        return data
 
-        if judgement is not None:
-            final = (judgement.status == Judgement.DONE)
-            complete = self.permissions.can_view_state
-            data = {
-                'text': force_text(judgement.show_status(complete)),
-                'final': final
-            }
-            if final:
-                if complete or (judgement.sample_tests_passed is False):
-                    data['color'] = 'green' if (judgement.outcome == Outcome.ACCEPTED) ^ settings.APRIL_FOOLS_DAY_MODE else 'red'
-                else:
-                    data['color'] = 'yellow'
-                if request.GET.get('table') == '1':
-                    data['report'] = self._render_report(request, judgement)
-                    data['box'] = render_to_string(self.box_template_name, self.get_context_data(), request)
-        else:
-            data = {
-                'text': 'N/A',
-                'final': False
-            }
+    def do_get(self, request, solution):
+        return JsonResponse(self.get_data(request, solution), json_dumps_params={'ensure_ascii': False})
+
+
+class SolutionStatusWaitView(SolutionStatusJsonView):
+    '''
+    Long polling: the response is delayed until the status differs from the version the client has.
+    The first request is checked for permissions and gets a token that is passed back with the next requests.
+    '''
+    def get(self, request, solution_id, *args, **kwargs):
+        complete = load_subscription(request.GET.get('token', ''), solution_id, request.user.id)
+        if complete is None:
+            return super(SolutionStatusWaitView, self).get(request, solution_id, *args, **kwargs)
+
+        judgement = wait_for_status_change(solution_id, request.GET.get('version', ''), settings.SOLUTION_STATUS_WAIT_TIMEOUT)
+        if judgement is not None and judgement.status == Judgement.DONE:
+            # the final status is rendered with the templates that require the whole context
+            return super(SolutionStatusWaitView, self).get(request, solution_id, *args, **kwargs)
+
+        data = _make_status_data(judgement, complete)
+        data['version'] = get_status_version(judgement)
+        data['token'] = request.GET['token']
+        data['delay'] = get_poll_delay()
         return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
 
+    def get_data(self, request, solution):
+        data = super(SolutionStatusWaitView, self).get_data(request, solution)
+        data['version'] = get_status_version(solution.best_judgement)
+        data['token'] = make_subscription(solution.id, request.user.id, self.permissions.can_view_state)
+        data['delay'] = get_poll_delay()
+        return data
+
 
 class BaseSolutionSourceCodeView(BaseSolutionView):
     '''
@@ -398,7 +434,7 @@ class SolutionPlagiarismView(BaseSolutionView):
 class SolutionRejudgeView(LoginRequiredMixin, generic.View):
     def post(self, request, solution_id):
         solution = get_object_or_404(Solution, pk=solution_id)
-        permissions, _ = calculate_permissions(solution, request.user)
+        permissions, _ = SolutionPermissionResolver.for_request(request).resolve(solution)
 
         if not permissions.can_rejudge:
             raise Http404('Not allowed to rejudge')
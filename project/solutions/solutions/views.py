@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.shortcuts import render
 from django.utils.translation import ugettext_lazy
 from django.views import generic
@@ -5,11 +6,12 @@ from django.views import generic
 from cauth.mixins import StaffMemberRequiredMixin, ProblemEditorMemberRequiredMixin
 from common.pagination import paginate
 from common.views import MassOperationView
+from contests.models import register_solution_changes
 from problems.calcpermissions import get_problem_ids_queryset, has_limited_problems_queryset
 
 from solutions.filters import apply_state_filter, apply_compiler_filter, apply_difficulty_filter
 from solutions.forms import AllSolutionsFilterForm
-from solutions.models import Solution
+from solutions.models import Solution, SolutionListEntry
 
 
 '''
@@ -24,21 +26,14 @@ class SolutionListView(ProblemEditorMemberRequiredMixin, generic.View):
     def get(self, request):
         form = AllSolutionsFilterForm(request.GET)
 
-        queryset = Solution.objects.\
-            prefetch_related('compiler').\
-            prefetch_related('problem').\
-            prefetch_related('author').\
-            select_related('best_judgement').\
-            prefetch_related('source_code').\
-            prefetch_related('aggregatedresult').\
-            defer('ip_address', 'stop_on_fail', 'source_code__resource_id', 'best_judgement__rejudge_id', 'best_judgement__judgement_before_id').\
-            order_by('-id')
+        # the list is filtered, counted and paginated by the read model, then the solutions of the page are fetched
+        queryset = SolutionListEntry.objects.order_by('-solution')
 
         if has_limited_problems_queryset(request.user):
             queryset = queryset.filter(problem_id__in=get_problem_ids_queryset(request.user))
 
         if form.is_valid():
-            queryset = apply_state_filter(queryset, form.cleaned_data['state'])
+            queryset = apply_state_filter(queryset, form.cleaned_data['state'], prefix='')
             queryset = apply_compiler_filter(queryset, form.cleaned_data['compiler'])
 
             user_id = form.cleaned_data.get('user')
@@ -53,10 +48,25 @@ class SolutionListView(ProblemEditorMemberRequiredMixin, generic.View):
             if difficulty is not None:
                 queryset = apply_difficulty_filter(queryset, difficulty)
 
-        context = paginate(request, queryset, self.paginate_by, allow_all=False, show_total_count=request.user.is_staff)
+        context = paginate(request, queryset, self.paginate_by, allow_all=False, show_total_count=request.user.is_staff, keyset=True)
+        context['object_list'] = self._fetch_solutions([entry.solution_id for entry in context['object_list']])
         context['form'] = form
         return render(request, self.template_name, context)
 
+    @staticmethod
+    def _fetch_solutions(solution_ids):
+        queryset = Solution.objects.\
+            filter(id__in=solution_ids).\
+            prefetch_related('compiler').\
+            prefetch_related('problem').\
+            prefetch_related('author').\
+            select_related('best_judgement').\
+            prefetch_related('source_code').\
+            prefetch_related('aggregatedresult').\
+            defer('ip_address', 'stop_on_fail', 'source_code__resource_id', 'best_judgement__rejudge_id', 'best_judgement__judgement_before_id')
+        solutions = {solution.id: solution for solution in queryset}
+        return [solutions[solution_id] for solution_id in solution_ids if solution_id in solutions]
+
 
 '''
 Mass delete
@@ -75,7 +85,10 @@ class DeleteSolutionsView(StaffMemberRequiredMixin, MassOperationView):
         return context
 
     def perform(self, filtered_queryset, form):
-        filtered_queryset.delete()
+        with transaction.atomic():
+            # the deleted runs are removed from the cached standings
+            register_solution_changes(filtered_queryset.values_list('id', flat=True))
+            filtered_queryset.delete()
 
     def get_queryset(self):
         return Solution.objects.order_by('id')
@@ -0,0 +1,136 @@
+'''
+Waiting for the changes of the judgement status.
+
+The worker API increments the version of a judgement in the cache whenever the state of the judgement changes.
+The version only wakes up the requests that are waiting: the status is always read from DB, and DB is re-read
+every RECHECK_INTERVAL seconds anyway. With a cache that is not shared by the processes the waiting still works,
+but the changes made in other processes are only noticed by the recheck.
+
+The waiting is disabled by default (SOLUTION_STATUS_WAIT_TIMEOUT is 0): a waiting request holds a thread
+of a synchronous worker, so the clients poll instead.
+
+The permissions are checked once per subscription: the client gets a signed token that lets it
+wait for the status of the solution without the permission checks.
+'''
+
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+
+from solutions.models import Judgement, Solution
+
+VERSION_KEY_FORMAT = 'solutions:judgement:{}:version'
+VERSION_TIMEOUT = 60 * 60
+
+SUBSCRIPTION_SALT = 'solutions.status'
+SUBSCRIPTION_MAX_AGE = 24 * 60 * 60
+
+# seconds between the checks of the cache and of DB while waiting
+POLL_INTERVAL = 0.25
+RECHECK_INTERVAL = 2.0
+
+# milliseconds the clients wait before the next request if the server does not wait for the changes
+CLIENT_POLL_DELAY = 1000
+
+
+def _make_key(judgement_id):
+    return VERSION_KEY_FORMAT.format(judgement_id)
+
+
+def _increment_keys(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, VERSION_TIMEOUT)
+
+
+def _increment_versions(judgement_ids):
+    _increment_keys(_make_key(judgement_id) for judgement_id in judgement_ids)
+
+
+def increment_versions_on_commit(keys):
+    '''
+    Increments the versions stored in the cache by the keys after the transaction is committed.
+    '''
+    keys = list(keys)
+    transaction.on_commit(lambda: _increment_keys(keys))
+
+
+def notify_judgements_changed(judgement_ids):
+    '''
+    Wakes up the clients waiting for the status of the judgements after the transaction is committed.
+    '''
+    increment_versions_on_commit(_make_key(judgement_id) for judgement_id in judgement_ids)
+
+
+def make_subscription(solution_id, user_id, complete):
+    return signing.dumps([int(solution_id), user_id, complete], salt=SUBSCRIPTION_SALT)
+
+
+def load_subscription(token, solution_id, user_id):
+    '''
+    Returns the 'complete' flag of the subscription, or None if the token is not valid for the solution and the user.
+    '''
+    try:
+        token_solution_id, token_user_id, complete = signing.loads(token, salt=SUBSCRIPTION_SALT, max_age=SUBSCRIPTION_MAX_AGE)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if token_solution_id != int(solution_id) or token_user_id != user_id:
+        return None
+    return complete
+
+
+def get_poll_delay():
+    return 0 if settings.SOLUTION_STATUS_WAIT_TIMEOUT > 0 else CLIENT_POLL_DELAY
+
+
+def get_status_version(judgement):
+    if judgement is None:
+        return ''
+    return '{}.{}.{}.{}.{}'.format(judgement.id, judgement.status, judgement.outcome, judgement.test_number, judgement.sample_tests_passed)
+
+
+def load_best_judgement(solution_id):
+    best_judgement_id = Solution.objects.filter(pk=solution_id).values_list('best_judgement_id', flat=True).first()
+    if best_judgement_id is None:
+        return None
+    return Judgement.objects.filter(pk=best_judgement_id).first()
+
+
+def wait_for_change(load, get_version, get_key, version, timeout):
+    '''
+    Waits until the version of the object returned by load() differs from the given one or the timeout expires.
+    The waiting is woken up by the increment of the version in the cache by the key returned by get_key(obj),
+    the object is reloaded every RECHECK_INTERVAL seconds anyway. Returns the object.
+    '''
+    deadline = time.monotonic() + timeout
+    obj = load()
+    while get_version(obj) == version and time.monotonic() < deadline:
+        recheck_time = min(deadline, time.monotonic() + RECHECK_INTERVAL)
+        key = get_key(obj)
+        if key is not None:
+            cache_version = cache.get(key)
+            while time.monotonic() < recheck_time and cache.get(key) == cache_version:
+                time.sleep(POLL_INTERVAL)
+        else:
+            time.sleep(max(0., recheck_time - time.monotonic()))
+        obj = load()
+    return obj
+
+
+def wait_for_status_change(solution_id, version, timeout):
+    '''
+    Waits until the version of the status of the best judgement differs from the given one or the timeout expires.
+    Returns the best judgement.
+    '''
+    return wait_for_change(
+        lambda: load_best_judgement(solution_id),
+        get_status_version,
+        lambda judgement: _make_key(judgement.id) if judgement is not None else None,
+        version,
+        timeout
+    )
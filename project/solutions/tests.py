@@ -1,3 +1,327 @@
-from django.test import TestCase
+import json
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from api.objectinqueue import JudgementInQueue
+from api.workerstructs import WorkerState, WorkerTestingReport
+from cauth.acl.accessmode import AccessMode
+from common.outcome import Outcome
+from contests.calcpermissions import calculate_contest_solution_permissions_ex
+from contests.models import Contest, ContestSolution, Membership as ContestMembership
+from plagiarism.models import AggregatedResult
+from courses.calcpermissions import calculate_course_solution_permissions_ex
+from courses.models import Course, CourseSolution, Membership as CourseMembership
+from problems.calcpermissions import calculate_problem_solution_permissions
+from problems.models import Problem, ProblemAccess
+from proglangs.langlist import ProgrammingLanguage
+from proglangs.models import Compiler
+from storage.models import FileMetadata
+from storage.resource_id import ResourceId
+
+from solutions.filters import apply_compiler_filter, apply_difficulty_filter, apply_state_filter
+from solutions.models import Judgement, RejudgeProgress, Solution, SolutionListEntry, update_solution_list
+from solutions.solution.calcpermissions import SolutionPermissionResolver
+from solutions.status import _increment_versions, wait_for_status_change
+from solutions.utils import bulk_rejudge
+
+
+@override_settings(SOLUTION_STATUS_WAIT_TIMEOUT=0)
+class SolutionStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.other = get_user_model().objects.create(username='other')
+        problem = Problem.objects.create(number=1, full_name='Problem')
+        compiler = Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP)
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+        self.solution = Solution.objects.create(problem=problem, author=self.other, source_code=source_code, compiler=compiler,
+                                                reception_time=timezone.now())
+        self.judgement = Judgement.objects.create(solution=self.solution, status=Judgement.WAITING)
+        self.solution.best_judgement = self.judgement
+        self.solution.save()
+        self.url = reverse('solutions:status_wait', kwargs={'solution_id': self.solution.id})
+
+    def _get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode())
+
+    def test_subscription(self):
+        self.client.force_login(self.admin)
+        data = self._get()
+        self.assertFalse(data['final'])
+        self.assertEqual(data['delay'], 1000)
+
+        # the permissions are not checked once the token has been issued
+        with mock.patch('solutions.solution.views.SolutionPermissionResolver.resolve_many') as resolve_many:
+            same = self._get(token=data['token'], version=data['version'])
+            self.assertEqual(same, data)
+
+            self.judgement.status = Judgement.TESTING
+            self.judgement.test_number = 3
+            self.judgement.save()
+            changed = self._get(token=data['token'], version=data['version'])
+            self.assertNotEqual(changed['version'], data['version'])
+            self.assertEqual(changed['text'], self.judgement.show_status())
+            self.assertFalse(resolve_many.called)
+
+        self.judgement.status = Judgement.DONE
+        self.judgement.outcome = Outcome.ACCEPTED
+        self.judgement.save()
+        final = self._get(token=data['token'], version=changed['version'], table=1)
+        self.assertTrue(final['final'])
+        self.assertEqual(final['color'], 'green')
+        self.assertIn('report', final)
+
+        # the token is bound to the user
+        self.client.force_login(self.other)
+        response = self.client.get(self.url, {'token': data['token'], 'version': data['version']})
+        self.assertEqual(response.status_code, 403)
+
+    @mock.patch('solutions.status.POLL_INTERVAL', 0.01)
+    @mock.patch('solutions.status.RECHECK_INTERVAL', 10.)
+    def test_wait(self):
+        judgement = wait_for_status_change(self.solution.id, '', 0.1)
+        version = '{}.{}.{}.{}.{}'.format(judgement.id, Judgement.WAITING, judgement.outcome, 0, None)
+        self.assertEqual(wait_for_status_change(self.solution.id, version, 0.1), self.judgement)
+
+        # the notification wakes the request up before DB is checked again
+        def change(_):
+            Judgement.objects.filter(pk=self.judgement.id).update(status=Judgement.TESTING)
+            _increment_versions([self.judgement.id])
+
+        with mock.patch('solutions.status.time.sleep', side_effect=change) as sleep:
+            judgement = wait_for_status_change(self.solution.id, version, 5.)
+            self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(judgement.status, Judgement.TESTING)
+
+
+class SolutionPermissionResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        rng = random.Random(1)
+        self.users = [get_user_model().objects.create(username='user{}'.format(i)) for i in range(4)]
+        for user in self.users:
+            user.is_admin = False
+            user.admingroup_ids = set()
+        problems = [Problem.objects.create(number=i + 1, full_name='Problem') for i in range(3)]
+        ProblemAccess.objects.create(problem=problems[0], user=self.users[0], mode=AccessMode.WRITE)
+        ProblemAccess.objects.create(problem=problems[1], user=self.users[1], mode=AccessMode.READ)
+
+        courses = [Course.objects.create(name='Course {}'.format(i)) for i in range(2)]
+        self.contests = contests = [Contest.objects.create(name='Contest {}'.format(i), start_time=timezone.now()) for i in range(2)]
+        CourseMembership.objects.create(course=courses[0], user=self.users[0], role=CourseMembership.STUDENT)
+        CourseMembership.objects.create(course=courses[0], user=self.users[1], role=CourseMembership.TEACHER)
+        ContestMembership.objects.create(contest=contests[1], user=self.users[2], role=ContestMembership.CONTESTANT)
+        ContestMembership.objects.create(contest=contests[0], user=self.users[3], role=ContestMembership.JUROR)
+
+        compiler = Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP)
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+        self.solutions = []
+        for i in range(30):
+            solution = Solution.objects.create(problem=rng.choice(problems), author=rng.choice(self.users),
+                                               source_code=source_code, compiler=compiler, reception_time=timezone.now())
+            if i % 3 == 0:
+                CourseSolution.objects.create(course=rng.choice(courses), solution=solution)
+            elif i % 3 == 1:
+                ContestSolution.objects.create(contest=rng.choice(contests), solution=solution)
+            self.solutions.append(solution)
+
+    def _calculate_one_by_one(self, solution, user):
+        in_course = calculate_course_solution_permissions_ex(solution, user)
+        in_contest = calculate_contest_solution_permissions_ex(solution, user)
+        permissions = in_course.permissions
+        permissions |= in_contest.permissions
+        permissions |= calculate_problem_solution_permissions(solution, user)
+        return (permissions.mask, in_course.course, in_course.link_to_course, in_contest.contest, in_contest.link_to_contest)
+
+    def test_same_as_one_by_one(self):
+        for user in self.users:
+            expected = [self._calculate_one_by_one(solution, user) for solution in self.solutions]
+            actual = [
+                (permissions.mask, env.course, env.link_to_course, env.contest, env.link_to_contest)
+                for permissions, env in SolutionPermissionResolver(user).resolve_many(self.solutions)
+            ]
+            self.assertEqual(actual, expected)
+
+    def test_queries(self):
+        user = self.users[0]
+        with self.assertNumQueries(5):
+            SolutionPermissionResolver(user).resolve_many(self.solutions)
+        # the roles are not cached across requests
+        with self.assertNumQueries(5):
+            resolver = SolutionPermissionResolver(user)
+            resolver.resolve_many(self.solutions)
+        # the resolver remembers everything it has loaded
+        with self.assertNumQueries(0):
+            resolver.resolve(self.solutions[0])
+
+    def test_membership_changes(self):
+        user = self.users[2]
+        solution = self.solutions[1]
+        Solution.objects.filter(pk=solution.id).update(author=user)
+        solution.author = user
+        ContestSolution.objects.filter(solution=solution).update(contest=self.contests[1])
+
+        permissions, _ = SolutionPermissionResolver(user).resolve(solution)
+        self.assertTrue(permissions.can_view_source_code)
+        self.assertFalse(permissions.can_view_ip_address)
+
+        ContestMembership.objects.filter(user=user).delete()
+        permissions, _ = SolutionPermissionResolver(user).resolve(solution)
+        self.assertFalse(permissions.can_view_source_code)
+
+        # the memberships are also created in bulk (see common.bulk)
+        ContestMembership.objects.bulk_create([ContestMembership(contest=self.contests[1], user=user, role=ContestMembership.JUROR)])
+        permissions, _ = SolutionPermissionResolver(user).resolve(solution)
+        self.assertTrue(permissions.can_view_ip_address)
+
+
+class SolutionListEntryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        rng = random.Random(1)
+        self.admin = get_user_model().objects.create(username='admin', is_staff=True, is_superuser=True)
+        users = [get_user_model().objects.create(username='user{}'.format(i)) for i in range(3)]
+        problems = [Problem.objects.create(number=i + 1, full_name='Problem', difficulty=difficulty) for i, difficulty in enumerate([None, 4, 8])]
+        compilers = [
+            Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP),
+            Compiler.objects.create(handle='python', language=ProgrammingLanguage.PYTHON),
+        ]
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+        self.solutions = []
+        for _ in range(40):
+            solution = Solution.objects.create(problem=rng.choice(problems), author=rng.choice(users), source_code=source_code,
+                                               compiler=rng.choice(compilers), reception_time=timezone.now())
+            status = rng.choice([Judgement.DONE, Judgement.DONE, Judgement.TESTING, Judgement.WAITING])
+            outcome = rng.choice([Outcome.ACCEPTED, Outcome.WRONG_ANSWER]) if status == Judgement.DONE else Outcome.NOT_AVAILABLE
+            solution.best_judgement = Judgement.objects.create(solution=solution, status=status, outcome=outcome)
+            solution.save()
+            self.solutions.append(solution)
+        update_solution_list(solution.id for solution in self.solutions)
+
+    def test_filters(self):
+        self.client.force_login(self.admin)
+        url = reverse('solutions:list')
+        for params in [
+            {},
+            {'state': 'ok'},
+            {'state': 'not-done'},
+            {'state': 'testing', 'compiler': ProgrammingLanguage.PYTHON},
+            {'difficulty': 'no'},
+            {'difficulty': '7-8', 'state': 'wa'},
+            {'user': self.solutions[0].author_id, 'problem': self.solutions[0].problem_id},
+        ]:
+            expected = Solution.objects.order_by('-id')
+            expected = apply_state_filter(expected, params.get('state'))
+            expected = apply_compiler_filter(expected, params.get('compiler'))
+            expected = apply_difficulty_filter(expected, params.get('difficulty'))
+            if 'user' in params:
+                expected = expected.filter(author_id=params['user'], problem_id=params['problem'])
+
+            response = self.client.get(url, dict(params, size=100))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([solution.id for solution in response.context['object_list']], [solution.id for solution in expected])
+            self.assertEqual(response.context['pagination_context'].object_count, expected.count())
+
+    def test_maintenance(self):
+        solution = self.solutions[1]
+        entry = SolutionListEntry.objects.get(pk=solution.id)
+        self.assertEqual((entry.status, entry.outcome, entry.relevance),
+                         (solution.best_judgement.status, solution.best_judgement.outcome, None))
+
+        judgement = Judgement.objects.create(solution=solution)
+        solution.best_judgement = judgement
+        solution.save()
+        AggregatedResult.objects.create(id=solution, relevance=0.5)
+        update_solution_list([solution.id])
+        entry = SolutionListEntry.objects.get(pk=solution.id)
+        self.assertEqual((entry.best_judgement_id, entry.status, entry.relevance), (judgement.id, Judgement.WAITING, 0.5))
+
+        JudgementInQueue.bulk_update_state([JudgementInQueue(judgement.id)], WorkerState(Judgement.TESTING, 2))
+        self.assertEqual(SolutionListEntry.objects.get(pk=solution.id).status, Judgement.TESTING)
+
+        solution.delete()
+        self.assertFalse(SolutionListEntry.objects.filter(pk=solution.id).exists())
+
+
+@override_settings(REJUDGE_PROGRESS_WAIT_TIMEOUT=0)
+class RejudgeProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create(username='admin', is_staff=True, is_superuser=True)
+        problem = Problem.objects.create(number=1, full_name='Problem')
+        compiler = Compiler.objects.create(handle='gcc', language=ProgrammingLanguage.CPP)
+        source_code = FileMetadata.objects.create(filename='a.cpp', size=0, resource_id=ResourceId(b''))
+        for outcome in [Outcome.ACCEPTED, Outcome.ACCEPTED, Outcome.WRONG_ANSWER, None]:
+            solution = Solution.objects.create(problem=problem, author=self.admin, source_code=source_code, compiler=compiler,
+                                               reception_time=timezone.now())
+            if outcome is not None:
+                solution.best_judgement = Judgement.objects.create(solution=solution, status=Judgement.DONE, outcome=outcome)
+                solution.save()
+        _, self.rejudge = bulk_rejudge(Solution.objects.order_by('id'), self.admin)
+        self.judgements = list(self.rejudge.judgement_set.order_by('id'))
+
+    def _finish(self, judgement, outcome):
+        report = WorkerTestingReport(outcome, 0, [], 0, 0, [], None, None, None)
+        with mock.patch('api.objectinqueue.register_accepted_solution'):
+            JudgementInQueue(judgement.id).put_report(report)
+
+    def _get_progress(self):
+        progress = RejudgeProgress.objects.get(pk=self.rejudge.id)
+        transitions = {
+            (transition.outcome_before, transition.outcome_after): transition.count
+            for transition in self.rejudge.rejudgetransition_set.filter(count__gt=0)
+        }
+        return (progress.total, progress.done, progress.accepted, progress.rejected), transitions
+
+    def test_progress(self):
+        self.assertEqual(self._get_progress(), ((4, 0, 0, 0), {}))
+
+        self._finish(self.judgements[0], Outcome.ACCEPTED)
+        self._finish(self.judgements[1], Outcome.WRONG_ANSWER)
+        self._finish(self.judgements[3], Outcome.COMPILATION_ERROR)
+        self.assertEqual(self._get_progress(), ((4, 3, 1, 2), {
+            (Outcome.ACCEPTED, Outcome.ACCEPTED): 1,
+            (Outcome.ACCEPTED, Outcome.WRONG_ANSWER): 1,
+            (None, Outcome.COMPILATION_ERROR): 1,
+        }))
+
+        # a repeated report replaces the result
+        self._finish(self.judgements[1], Outcome.ACCEPTED)
+        self._finish(self.judgements[2], Outcome.WRONG_ANSWER)
+        self.assertEqual(self._get_progress(), ((4, 4, 2, 2), {
+            (Outcome.ACCEPTED, Outcome.ACCEPTED): 2,
+            (Outcome.WRONG_ANSWER, Outcome.WRONG_ANSWER): 1,
+            (None, Outcome.COMPILATION_ERROR): 1,
+        }))
+
+    def test_json(self):
+        self.client.force_login(self.admin)
+        url = reverse('solutions:rejudge_status_json', kwargs={'rejudge_id': self.rejudge.id})
+        data = json.loads(self.client.get(url).content.decode())
+        self.assertEqual((data['total'], data['valueGood'], data['valueBad'], data['delay']), (4, 0, 0, 2000))
+
+        self._finish(self.judgements[0], Outcome.ACCEPTED)
+        # the session, the user and the progress
+        with self.assertNumQueries(3):
+            changed = json.loads(self.client.get(url, {'token': data['token'], 'version': data['version']}).content.decode())
+        self.assertEqual((changed['total'], changed['valueGood'], changed['valueBad']), (4, 1, 0))
+        self.assertNotEqual(changed['version'], data['version'])
+
+    def test_changed(self):
+        self.client.force_login(self.admin)
+        for judgement, outcome in zip(self.judgements, [Outcome.ACCEPTED, Outcome.WRONG_ANSWER, Outcome.WRONG_ANSWER]):
+            self._finish(judgement, outcome)
+
+        url = reverse('solutions:rejudge', kwargs={'rejudge_id': self.rejudge.id})
+        response = self.client.get(url)
+        self.assertEqual([info.after.id for info in response.context['object_list']], [j.id for j in self.judgements])
+        response = self.client.get(url, {'changed': 1})
+        self.assertEqual([info.after.id for info in response.context['object_list']], [self.judgements[1].id])
@@ -4,7 +4,7 @@ from django.utils import timezone
 from api.queue import enqueue, bulk_enqueue
 from api.objectinqueue import JudgementInQueue
 from common.networkutils import get_request_ip
-from solutions.models import Solution, Judgement, JudgementExtraInfo, Rejudge
+from solutions.models import Solution, Judgement, JudgementExtraInfo, Rejudge, RejudgeProgress, update_solution_list
 from storage.utils import store_with_metadata
 
 
@@ -24,6 +24,7 @@ def new_solution(request, form, problem_id=None, stop_on_fail=False):
                         source_code=source_code, compiler=form.cleaned_data['compiler'], problem_id=problem_id, stop_on_fail=stop_on_fail)
 
     solution.save()
+    update_solution_list([solution.id])
     return solution
 
 
@@ -39,6 +40,7 @@ def judge(solution, rejudge=None, set_best=True):
     if set_best and solution.best_judgement_id is None:
         solution.best_judgement = judgement
         solution.save()
+        update_solution_list([solution.id])
 
     return notifier
 
@@ -57,6 +59,7 @@ def bulk_rejudge(solutions, author):
         judgements.append(judgement)
 
     Judgement.objects.bulk_create(judgements)
+    RejudgeProgress.objects.create(rejudge=rejudge, total=len(judgements))
 
     # get back pk's of newly created objects
     judgement_ids = Judgement.objects.filter(rejudge=rejudge).values_list('pk', flat=True)
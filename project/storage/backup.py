@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+'''
+Incremental backup of the storage.
+
+The backup directory contains ZIP volumes fs.NNNN.zip and the manifest: a text file
+with a line "volume<TAB>resource_id<TAB>size" for each file backed up. A volume is listed
+in the manifest after it has got its permanent name, so the manifest is read instead of the volumes.
+Volumes that are missing from the manifest (those written by older versions or by a run
+that was interrupted) are listed once and added to it.
+
+The files are read through the IDataStorage interface, so any storage backend may be backed up.
+'''
+
+import collections
+import concurrent.futures
+import hashlib
+import os
+import re
+import time
+import zipfile
+
+from django.core.files.base import File
+from django.db import connections
+
+from .resource_id import ResourceId
+from .storage import create_storage
+
+ARCHIVE_NAME_FORMAT = 'fs.{:04}.zip'
+ARCHIVE_TMP_NAME_FORMAT = 'fs.{:04}.tmp'
+ARCHIVE_NAME_RE = re.compile(r'^fs\.(\d{4,})\.zip$')
+MANIFEST_NAME = 'manifest.txt'
+
+# a volume is closed when it has got this number of files or this number of bytes
+MAX_VOLUME_FILES = 100000
+MAX_VOLUME_SIZE = 2**28
+
+# the files are read from the storage and from the volumes by chunks of this size
+CHUNK_SIZE = 2**20
+
+BackupEntry = collections.namedtuple('BackupEntry', 'volume size')
+
+
+def _archive_path(backup_dir, volume):
+    return os.path.join(backup_dir, ARCHIVE_NAME_FORMAT.format(volume))
+
+
+def _list_volumes(backup_dir):
+    volumes = []
+    for name in os.listdir(backup_dir):
+        m = ARCHIVE_NAME_RE.match(name)
+        if m is not None:
+            volumes.append(int(m.group(1)))
+    return sorted(volumes)
+
+
+def _format_manifest_lines(volume, files):
+    return ''.join('{}\t{}\t{}\n'.format(volume, resource_id, size) for resource_id, size in files)
+
+
+class Manifest(object):
+    '''
+    The index of the backup: resource id -> BackupEntry.
+    '''
+    def __init__(self, backup_dir):
+        self._backup_dir = backup_dir
+        self._path = os.path.join(backup_dir, MANIFEST_NAME)
+        self.entries = {}
+        self.volumes = set()
+
+    def load(self):
+        if os.path.exists(self._path):
+            with open(self._path) as fd:
+                for line in fd:
+                    volume, resource_id, size = line.rstrip('\n').split('\t')
+                    self._add(int(volume), ResourceId.parse(resource_id), int(size))
+
+        # the volumes that have not been indexed yet
+        for volume in _list_volumes(self._backup_dir):
+            if volume not in self.volumes:
+                with zipfile.ZipFile(_archive_path(self._backup_dir, volume)) as zf:
+                    files = [(ResourceId.parse(info.filename), info.file_size) for info in zf.infolist()]
+                self.append(volume, files)
+        return self
+
+    def _add(self, volume, resource_id, size):
+        self.volumes.add(volume)
+        self.entries[resource_id] = BackupEntry(volume, size)
+
+    def append(self, volume, files):
+        with open(self._path, 'a') as fd:
+            fd.write(_format_manifest_lines(volume, files))
+            fd.flush()
+            os.fsync(fd.fileno())
+        self.volumes.add(volume)
+        for resource_id, size in files:
+            self._add(volume, resource_id, size)
+
+    def next_volume(self):
+        return max(self.volumes, default=-1) + 1
+
+    def __contains__(self, resource_id):
+        return resource_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _copy_hashed(src, dst):
+    h = hashlib.sha1()
+    size = 0
+    for chunk in src:
+        h.update(chunk)
+        dst.write(chunk)
+        size += len(chunk)
+    return h.digest(), size
+
+
+def write_volume(backup_dir, volume, resource_ids):
+    '''
+    Writes the files to a new volume. Returns a tuple (files, errors), where files is a list
+    of (resource_id, size) for the files written, and errors is a list of (resource_id, message).
+    Files that are missing or damaged in the storage are not written.
+    Runs in a worker process.
+    '''
+    storage = create_storage()
+    files = []
+    errors = []
+    tmp_path = os.path.join(backup_dir, ARCHIVE_TMP_NAME_FORMAT.format(volume))
+    date_time = time.localtime(time.time())[:6]
+
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for resource_id in resource_ids:
+            data = storage.serve(resource_id)
+            if data is None:
+                errors.append((resource_id, 'missing in the storage'))
+                continue
+            info = zipfile.ZipInfo(str(resource_id), date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = data.size
+            try:
+                with zf.open(info, 'w') as dst:
+                    digest, size = _copy_hashed(data.generator, dst)
+            finally:
+                if hasattr(data.generator, 'close'):
+                    data.generator.close()
+            if digest != resource_id.get_binary():
+                # the member cannot be removed from the archive, it is left out of the manifest
+                errors.append((resource_id, 'damaged in the storage'))
+                continue
+            files.append((resource_id, size))
+
+    if files:
+        os.rename(tmp_path, _archive_path(backup_dir, volume))
+    else:
+        os.remove(tmp_path)
+    return (files, errors)
+
+
+def _init_worker():
+    import django
+    django.setup()
+    # each process has its own connection to the storage
+    from . import storage
+    storage._storage = None
+
+
+def _make_executor(jobs):
+    if jobs > 1:
+        # the connections must not be shared with the forked processes
+        connections.close_all()
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+
+def _split(items, max_files, max_size):
+    batch = []
+    batch_size = 0
+    for resource_id, size in items:
+        if batch and (len(batch) >= max_files or batch_size + size > max_size):
+            yield batch
+            batch = []
+            batch_size = 0
+        batch.append(resource_id)
+        batch_size += size
+    if batch:
+        yield batch
+
+
+def backup(backup_dir, logger, jobs=1, max_files=MAX_VOLUME_FILES, max_size=MAX_VOLUME_SIZE):
+    '''
+    Adds the files that are not in the backup yet. Each volume is compressed by one of the jobs processes.
+    Returns a tuple (number of files added, list of errors).
+    '''
+    if not os.path.isdir(backup_dir):
+        os.makedirs(backup_dir)
+    manifest = Manifest(backup_dir).load()
+    logger.info('Volumes present: %d, resources: %d', len(manifest.volumes), len(manifest))
+
+    new_files = []
+    for resource_id, size in create_storage().list_all():
+        if resource_id not in manifest:
+            new_files.append((resource_id, size))
+    logger.info('New resources: %d', len(new_files))
+
+    added = 0
+    all_errors = []
+    volume = manifest.next_volume()
+    with _make_executor(jobs) as executor:
+        futures = {}
+        for batch in _split(new_files, max_files, max_size):
+            futures[executor.submit(write_volume, backup_dir, volume, batch)] = volume
+            volume += 1
+
+        for future in concurrent.futures.as_completed(futures):
+            files, errors = future.result()
+            if files:
+                manifest.append(futures[future], files)
+            added += len(files)
+            all_errors.extend(errors)
+            logger.info('Volume #%04d: %d files added', futures[future], len(files))
+
+    for resource_id, message in all_errors:
+        logger.error('%s: %s', resource_id, message)
+    return (added, all_errors)
+
+
+def _group_by_volume(manifest, resource_ids):
+    volumes = collections.defaultdict(list)
+    missing = []
+    for resource_id in resource_ids:
+        entry = manifest.entries.get(resource_id)
+        if entry is None:
+            missing.append(resource_id)
+        else:
+            volumes[entry.volume].append(resource_id)
+    return volumes, missing
+
+
+def verify_volume(backup_dir, volume, resource_ids):
+    '''
+    Checks that the files can be extracted from the volume and have the right hashes.
+    Returns a list of (resource_id, message) for the damaged files.
+    '''
+    errors = []
+    try:
+        zf = zipfile.ZipFile(_archive_path(backup_dir, volume))
+    except (OSError, zipfile.BadZipFile) as e:
+        return [(resource_id, 'volume #{:04}: {}'.format(volume, e)) for resource_id in resource_ids]
+
+    with zf:
+        for resource_id in resource_ids:
+            try:
+                with zf.open(str(resource_id)) as src:
+                    h = hashlib.sha1()
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        h.update(chunk)
+            except (KeyError, OSError, zipfile.BadZipFile) as e:
+                errors.append((resource_id, 'volume #{:04}: {}'.format(volume, e)))
+                continue
+            if h.digest() != resource_id.get_binary():
+                errors.append((resource_id, 'volume #{:04}: hash mismatch'.format(volume)))
+    return errors
+
+
+def verify(backup_dir, resource_ids=None, jobs=1):
+    '''
+    Verifies the given files (all the files in the backup by default).
+    Returns a list of (resource_id, message) for the files that are damaged or missing in the backup.
+    '''
+    manifest = Manifest(backup_dir).load()
+    if resource_ids is None:
+        resource_ids = list(manifest.entries)
+    volumes, missing = _group_by_volume(manifest, resource_ids)
+
+    errors = [(resource_id, 'not in the backup') for resource_id in missing]
+    with _make_executor(jobs) as executor:
+        futures = [executor.submit(verify_volume, backup_dir, volume, ids) for volume, ids in sorted(volumes.items())]
+        for future in concurrent.futures.as_completed(futures):
+            errors.extend(future.result())
+    return errors
+
+
+def restore(backup_dir, resource_ids):
+    '''
+    Saves the given files from the backup to the storage.
+    Returns a tuple (number of files restored, list of (resource_id, message) for the failed ones).
+    '''
+    manifest = Manifest(backup_dir).load()
+    volumes, missing = _group_by_volume(manifest, resource_ids)
+    storage = create_storage()
+
+    restored = 0
+    errors = [(resource_id, 'not in the backup') for resource_id in missing]
+    for volume, ids in sorted(volumes.items()):
+        with zipfile.ZipFile(_archive_path(backup_dir, volume)) as zf:
+            for resource_id in ids:
+                info = zf.getinfo(str(resource_id))
+                with zf.open(info) as src:
+                    f = File(src)
+                    f.size = info.file_size
+                    f.DEFAULT_CHUNK_SIZE = CHUNK_SIZE
+                    saved_id = storage.save(f)
+                if saved_id != resource_id:
+                    errors.append((resource_id, 'volume #{:04}: hash mismatch'.format(volume)))
+                else:
+                    restored += 1
+    return (restored, errors)
+
+
+def find_missing(backup_dir):
+    '''
+    Returns the ids of the files that are in the backup but not in the storage.
+    '''
+    manifest = Manifest(backup_dir).load()
+    resource_ids = list(manifest.entries)
+    available = create_storage().check_availability(resource_ids)
+    return [resource_id for resource_id, ok in zip(resource_ids, available) if not ok]
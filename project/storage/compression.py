@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import struct
+import zlib
+
+# A compressed blob starts with a header: the signature, the compression method and the size of the original data.
+# Blobs without the signature are stored as they are (all the blobs written before compression was introduced).
+# Stored data that happens to start with the signature gets a header with METHOD_NONE, so it is never misread.
+SIGNATURE = b'\x89IRZ\r\n\x1a\n'
+_HEADER = struct.Struct('<8sBQ')
+HEADER_SIZE = _HEADER.size
+
+METHOD_NONE = 0
+METHOD_DEFLATE = 1
+METHOD_ZSTD = 2
+
+DEFLATE_LEVEL = 1
+ZSTD_LEVEL = 3
+
+# Compression is given up and the data is stored as it is if the compressed data is larger
+# than this share of the original data. The decision is made as soon as PROBE_SIZE bytes are compressed.
+MAX_RATIO = 0.9
+PROBE_SIZE = 2**18
+
+# decompressed data is yielded by chunks of about this size
+CHUNK_SIZE = 2**16
+
+
+class _IdentityCompressor(object):
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class _NoCompression(object):
+    method = METHOD_NONE
+
+    def compressobj(self):
+        return _IdentityCompressor()
+
+    def iter_decompressed(self, fd):
+        return iter(lambda: fd.read(CHUNK_SIZE), b'')
+
+
+class _Deflate(object):
+    method = METHOD_DEFLATE
+
+    def compressobj(self):
+        return zlib.compressobj(DEFLATE_LEVEL)
+
+    def iter_decompressed(self, fd):
+        d = zlib.decompressobj()
+        for data in iter(lambda: fd.read(CHUNK_SIZE), b''):
+            while data:
+                # the output is limited to keep memory bounded for highly compressed data
+                chunk = d.decompress(data, CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                data = d.unconsumed_tail
+        chunk = d.flush()
+        if chunk:
+            yield chunk
+
+
+class _Zstd(object):
+    method = METHOD_ZSTD
+
+    def __init__(self):
+        # optional dependency, required only if zstd is enabled or zstd blobs are read
+        import zstandard
+        self._zstandard = zstandard
+
+    def compressobj(self):
+        return self._zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def iter_decompressed(self, fd):
+        return self._zstandard.ZstdDecompressor().read_to_iter(fd, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+
+_CODEC_CLASSES = {
+    'deflate': _Deflate,
+    'zstd': _Zstd,
+}
+
+_CODEC_CLASSES_BY_METHOD = {
+    METHOD_NONE: _NoCompression,
+    METHOD_DEFLATE: _Deflate,
+    METHOD_ZSTD: _Zstd,
+}
+
+
+def get_codec(name):
+    '''
+    Returns the codec for the compression method name ('deflate' or 'zstd').
+    '''
+    try:
+        codec_class = _CODEC_CLASSES[name]
+    except KeyError:
+        raise ValueError('Unknown compression method: {}'.format(name))
+    return codec_class()
+
+
+def read_header(fd):
+    '''
+    Reads the header of the blob opened at its beginning.
+    Returns a tuple (codec, size), the file is positioned at the data.
+    Returns None for a blob stored without a header, the file is positioned at the beginning.
+    '''
+    header = fd.read(HEADER_SIZE)
+    if len(header) == HEADER_SIZE:
+        signature, method, size = _HEADER.unpack(header)
+        if signature == SIGNATURE:
+            codec_class = _CODEC_CLASSES_BY_METHOD.get(method)
+            if codec_class is None:
+                raise ValueError('Unknown compression method: {}'.format(method))
+            return (codec_class(), size)
+    fd.seek(0)
+    return None
+
+
+def is_compressed(path):
+    with open(path, 'rb') as fd:
+        header = read_header(fd)
+    return header is not None and header[0].method != METHOD_NONE
+
+
+def _write_with_header(fd, chunks, codec, probe):
+    fd.write(bytes(HEADER_SIZE))
+    compressor = codec.compressobj()
+    size = 0
+    written = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        fd.write(data)
+        size += len(chunk)
+        written += len(data)
+        if probe and size >= PROBE_SIZE and written > size * MAX_RATIO:
+            break
+    data = compressor.flush()
+    fd.write(data)
+    written += len(data)
+
+    fd.seek(0)
+    fd.write(_HEADER.pack(SIGNATURE, codec.method, size))
+    fd.seek(0, 2)
+    return written <= size * MAX_RATIO
+
+
+def write_compressed(fd, chunks, codec):
+    '''
+    Writes the header and the compressed chunks to the empty file.
+    Returns False if the data has turned out to be poorly compressible: in this case
+    the rest of the chunks is left unread, and the file contains the compressed part of the data.
+    '''
+    return _write_with_header(fd, chunks, codec, True)
+
+
+def write_plain(fd, chunks):
+    '''
+    Writes the chunks as they are to the empty file (the header is added only if the data starts with the signature).
+    '''
+    chunks = iter(chunks)
+    prefix = b''
+    for chunk in chunks:
+        prefix += chunk
+        if len(prefix) >= len(SIGNATURE):
+            break
+    chunks = itertools.chain((prefix,), chunks)
+
+    if prefix.startswith(SIGNATURE):
+        _write_with_header(fd, chunks, _NoCompression(), False)
+    else:
+        for chunk in chunks:
+            fd.write(chunk)
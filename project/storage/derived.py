@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+
+from django.core.cache import caches
+
+# the artifacts derived from the stored files never become stale: the files are immutable
+DJANGO_CACHE_TIMEOUT = None
+DJANGO_KEY_PREFIX = 'derived:'
+
+# the file system cache is trimmed to this share of its size when it grows too big
+FILESYSTEM_TRIM_RATIO = 0.8
+
+
+def make_key(resource_id, transform, params):
+    return '{}:{}:{}'.format(transform, resource_id, ':'.join(str(param) for param in params))
+
+
+class DerivedCache(object):
+    '''
+    Cache of the artifacts derived from the stored files: representations, highlighted source code, etc.
+    An artifact is identified by the resource id, the name of the transform and its parameters.
+    '''
+    def _do_get_many(self, keys):
+        # returns a dict {key: artifact} for the keys found
+        raise NotImplementedError()
+
+    def _do_set_many(self, artifacts):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def get_or_make_many(self, resource_ids, transform, params, make):
+        '''
+        Returns a list of artifacts for the resources. The missing ones are built by make(resource_id)
+        and cached unless they are None. resource_ids may contain None, the artifact is None then.
+        '''
+        keys = {resource_id: make_key(resource_id, transform, params) for resource_id in resource_ids if resource_id is not None}
+        found = self._do_get_many(set(keys.values())) if keys else {}
+
+        fresh = {}
+        result = []
+        for resource_id in resource_ids:
+            if resource_id is None:
+                result.append(None)
+                continue
+            key = keys[resource_id]
+            if key not in found:
+                artifact = make(resource_id)
+                if artifact is None:
+                    result.append(None)
+                    continue
+                found[key] = fresh[key] = artifact
+            result.append(found[key])
+
+        if fresh:
+            self._do_set_many(fresh)
+        return result
+
+    def get_or_make(self, resource_id, transform, params, make):
+        return self.get_or_make_many([resource_id], transform, params, make)[0]
+
+
+class NullCache(DerivedCache):
+    def _do_get_many(self, keys):
+        return {}
+
+    def _do_set_many(self, artifacts):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LocalMemoryCache(DerivedCache):
+    '''
+    LRU cache in the memory of the process, limited by the total size of the pickled artifacts.
+    The artifacts are kept pickled, so callers never share the objects.
+    '''
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._size = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _do_get_many(self, keys):
+        result = {}
+        with self._lock:
+            for key in keys:
+                blob = self._data.get(key)
+                if blob is not None:
+                    self._data.move_to_end(key)
+                    result[key] = blob
+        return {key: pickle.loads(blob) for key, blob in result.items()}
+
+    def _do_set_many(self, artifacts):
+        blobs = {key: pickle.dumps(artifact, pickle.HIGHEST_PROTOCOL) for key, artifact in artifacts.items()}
+        with self._lock:
+            for key, blob in blobs.items():
+                if len(blob) > self._max_size:
+                    continue
+                old_blob = self._data.pop(key, None)
+                if old_blob is not None:
+                    self._size -= len(old_blob)
+                self._data[key] = blob
+                self._size += len(blob)
+            while self._size > self._max_size:
+                _, blob = self._data.popitem(last=False)
+                self._size -= len(blob)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+class FileSystemCache(DerivedCache):
+    '''
+    Cache shared by the processes on the host: the artifacts are pickled to files.
+    A hit updates the modification time of the file. The least recently used files are removed
+    when the process has written more than a tenth of the size limit since it checked the size last time.
+    '''
+    def __init__(self, directory, max_size):
+        self._directory = directory
+        self._max_size = max_size
+        self._written = 0
+        self._lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, name[:2], name)
+
+    def _do_get_many(self, keys):
+        result = {}
+        for key in keys:
+            path = self._get_path(key)
+            try:
+                with open(path, 'rb') as fd:
+                    result[key] = pickle.load(fd)
+                os.utime(path)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                # the file has been removed by another process or is being replaced
+                pass
+        return result
+
+    def _do_set_many(self, artifacts):
+        written = 0
+        for key, artifact in artifacts.items():
+            path = self._get_path(key)
+            subdir = os.path.dirname(path)
+            if not os.path.exists(subdir):
+                os.makedirs(subdir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self._directory, delete=False) as fd:
+                try:
+                    pickle.dump(artifact, fd, pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    fd.close()
+                    os.remove(fd.name)
+                    raise
+                written += fd.tell()
+            os.replace(fd.name, path)
+
+        with self._lock:
+            self._written += written
+            if self._written * 10 < self._max_size:
+                return
+            self._written = 0
+        self._trim()
+
+    def _list(self):
+        result = []
+        with os.scandir(self._directory) as it:
+            subdirs = [entry.path for entry in it if entry.is_dir()]
+        for subdir in subdirs:
+            with os.scandir(subdir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    result.append((st.st_mtime, st.st_size, entry.path))
+        return result
+
+    def _trim(self):
+        files = self._list()
+        total = sum(size for _, size, _ in files)
+        if total <= self._max_size:
+            return
+        files.sort()
+        target = self._max_size * FILESYSTEM_TRIM_RATIO
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self._list():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class DjangoCache(DerivedCache):
+    '''
+    Stores the artifacts in one of the Django caches, which is responsible for eviction.
+    '''
+    def __init__(self, alias='default'):
+        self._cache = caches[alias]
+
+    def _do_get_many(self, keys):
+        found = self._cache.get_many([DJANGO_KEY_PREFIX + key for key in keys])
+        return {key[len(DJANGO_KEY_PREFIX):]: artifact for key, artifact in found.items()}
+
+    def _do_set_many(self, artifacts):
+        self._cache.set_many({DJANGO_KEY_PREFIX + key: artifact for key, artifact in artifacts.items()}, DJANGO_CACHE_TIMEOUT)
+
+    def clear(self):
+        # the keys of the other users of the cache are removed too
+        self._cache.clear()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+'''
+Online garbage collection of the storage.
+
+Mark: the tables that have ResourceIdFields are scanned in the order of primary keys by small batches,
+the ids found are saved as MarkedResource rows, and the progress is saved after each batch,
+so the phase may be interrupted and resumed.
+
+Sweep: the files that are not marked are deleted if they have not been saved or touched since
+the grace period before the start of the run. The rows inserted since the mark phase are marked
+before each batch of files is deleted. A file that gets referenced while the collector runs
+has been saved once again (an existing file is touched then) or has been reported
+to a worker as existing (check_availability(touch=True)), so the grace period protects it.
+'''
+
+import datetime
+import json
+import time
+
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GarbageCollection, MarkedResource
+from .resource_id import HASH_SIZE, ResourceIdField
+from .storage import create_storage
+
+GRACE_PERIOD = datetime.timedelta(days=1)
+MARK_BATCH_SIZE = 10000
+SWEEP_BATCH_SIZE = 1000
+
+
+def get_resource_fields():
+    '''
+    Returns a list of (model, [names of the ResourceIdField columns]) for all the models that reference files.
+    '''
+    result = []
+    for model in apps.get_models():
+        if model._meta.proxy or not model._meta.managed or model is MarkedResource:
+            continue
+        fields = [field.attname for field in model._meta.concrete_fields if isinstance(field, ResourceIdField)]
+        if fields:
+            result.append((model, fields))
+    return result
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class GarbageCollector(object):
+    def __init__(self, logger, mark_batch_size=MARK_BATCH_SIZE, sweep_batch_size=SWEEP_BATCH_SIZE, pause=0., grace_period=GRACE_PERIOD):
+        self._logger = logger
+        self._mark_batch_size = mark_batch_size
+        self._sweep_batch_size = sweep_batch_size
+        self._pause = pause
+        self._grace_period = grace_period
+        self._storage = create_storage()
+
+    def get_run(self, restart=False):
+        '''
+        Returns the unfinished run or starts a new one.
+        '''
+        runs = GarbageCollection.objects.filter(finish_time__isnull=True)
+        if restart:
+            for run in runs:
+                self._finish(run)
+        run = runs.order_by('-id').first()
+        if run is None:
+            run = GarbageCollection.objects.create()
+        return run
+
+    def _throttle(self):
+        if self._pause > 0:
+            time.sleep(self._pause)
+
+    def _mark_model(self, run, cursors, model, fields):
+        label = model._meta.label
+        while True:
+            qs = model.objects.order_by('pk')
+            if label in cursors:
+                qs = qs.filter(pk__gt=cursors[label])
+            rows = list(qs.values_list('pk', *fields)[:self._mark_batch_size])
+            if not rows:
+                return
+
+            resource_ids = set()
+            for row in rows:
+                for resource_id in row[1:]:
+                    if resource_id is not None and len(resource_id) == HASH_SIZE:
+                        resource_ids.add(resource_id)
+
+            cursors[label] = rows[-1][0]
+            with transaction.atomic():
+                MarkedResource.objects.bulk_create((
+                    MarkedResource(collection=run, resource_id=resource_id) for resource_id in resource_ids
+                ), batch_size=1000, ignore_conflicts=True)
+                GarbageCollection.objects.filter(pk=run.pk).update(cursors=json.dumps(cursors))
+
+            if len(rows) < self._mark_batch_size:
+                return
+            self._throttle()
+
+    def mark(self, run):
+        '''
+        Marks the references from the rows that have not been scanned yet.
+        '''
+        cursors = json.loads(run.cursors)
+        for model, fields in get_resource_fields():
+            self._mark_model(run, cursors, model, fields)
+        run.cursors = json.dumps(cursors)
+        if run.mark_time is None:
+            run.mark_time = timezone.now()
+            run.save(update_fields=['cursors', 'mark_time'])
+            self._logger.info('Marked: %d files', MarkedResource.objects.filter(collection=run).count())
+
+    def _saved_before(self, run):
+        return (run.start_time - self._grace_period).timestamp()
+
+    def _unmarked(self, run, batch):
+        marked = set()
+        for chunk in _chunks([resource_id for resource_id, _ in batch], 500):
+            marked.update(MarkedResource.objects.filter(collection=run, resource_id__in=chunk).values_list('resource_id', flat=True))
+        return [(resource_id, size) for resource_id, size in batch if resource_id not in marked]
+
+    def iterate_garbage(self, run):
+        '''
+        Generates lists of (resource_id, size) for the files that are not referenced and are older than the grace period.
+        '''
+        saved_before = self._saved_before(run)
+        batch = []
+        for resource_id, size, mtime in self._storage.list_all_with_mtime():
+            if mtime < saved_before:
+                batch.append((resource_id, size))
+            if len(batch) >= self._sweep_batch_size:
+                garbage = self._unmarked(run, batch)
+                if garbage:
+                    yield garbage
+                batch = []
+        garbage = self._unmarked(run, batch)
+        if garbage:
+            yield garbage
+
+    def report(self, run):
+        '''
+        Returns a tuple (count, size) for the files that would be deleted.
+        '''
+        count = 0
+        size = 0
+        for garbage in self.iterate_garbage(run):
+            count += len(garbage)
+            size += sum(s for _, s in garbage)
+        return (count, size)
+
+    def sweep(self, run, max_count=None):
+        '''
+        Deletes up to max_count unreferenced files. Returns a tuple (count, size) for the files deleted.
+        The run is finished if all the garbage has been deleted.
+        '''
+        saved_before = self._saved_before(run)
+        count = 0
+        size = 0
+        complete = True
+        for garbage in self.iterate_garbage(run):
+            # the rows inserted while the collector was running
+            self.mark(run)
+            for resource_id, _ in self._unmarked(run, garbage):
+                if max_count is not None and count >= max_count:
+                    complete = False
+                    break
+                freed = self._storage.delete(resource_id, saved_before)
+                if freed is not None:
+                    count += 1
+                    size += freed
+            GarbageCollection.objects.filter(pk=run.pk).update(deleted_count=run.deleted_count + count, deleted_size=run.deleted_size + size)
+            self._logger.info('Deleted: %d files, %d bytes', count, size)
+            if not complete:
+                break
+            self._throttle()
+
+        run.deleted_count += count
+        run.deleted_size += size
+        run.save(update_fields=['deleted_count', 'deleted_size'])
+        if complete:
+            self._finish(run)
+        return (count, size)
+
+    def _finish(self, run):
+        while True:
+            ids = list(MarkedResource.objects.filter(collection=run).values_list('pk', flat=True)[:self._mark_batch_size])
+            if not ids:
+                break
+            MarkedResource.objects.filter(pk__in=ids).delete()
+        run.finish_time = timezone.now()
+        run.save(update_fields=['finish_time'])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from storage import backup
+from storage.storage_fs import FileSystemStorage
+
+from .benchmarkcompression import _make_input
+
+
+def _read_backup_as_before(backup_dir):
+    n = 0
+    present_ids = set()
+    while True:
+        archive_path = os.path.join(backup_dir, backup.ARCHIVE_NAME_FORMAT.format(n))
+        if not os.path.exists(archive_path):
+            break
+        with zipfile.ZipFile(archive_path, mode='r') as zf:
+            for name in zf.namelist():
+                present_ids.add(name)
+        n += 1
+    return n, present_ids
+
+
+def _backup_as_before(storage, backup_dir, max_files):
+    # the files are read directly from the storage directory, one volume after another
+    if not os.path.isdir(backup_dir):
+        os.makedirs(backup_dir)
+    n, present_ids = _read_backup_as_before(backup_dir)
+    zf = None
+    files_added = 0
+    for resource_id, size in storage.list_all():
+        resource_id_str = str(resource_id)
+        if resource_id_str in present_ids:
+            continue
+        if zf is None or files_added >= max_files:
+            if zf is not None:
+                zf.close()
+                n += 1
+            zf = zipfile.ZipFile(os.path.join(backup_dir, backup.ARCHIVE_NAME_FORMAT.format(n)), 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+            files_added = 0
+        zf.write(storage._get_path(resource_id), resource_id_str)
+        files_added += 1
+    if zf is not None:
+        zf.close()
+
+
+class Command(BaseCommand):
+    help = 'Measures full and incremental backups of the file system storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=20000)
+        parser.add_argument('--size', type=int, default=2**14)
+        parser.add_argument('--max-files', type=int, default=2000, help='files in a volume')
+        parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+        rng = random.Random(1)
+        workdir = tempfile.mkdtemp()
+        try:
+            storage = FileSystemStorage(os.path.join(workdir, 'storage'))
+            data = _make_input(options['size'], rng)
+            for i in range(options['files']):
+                storage.save(ContentFile(i.to_bytes(8, 'little') + data[8:]))
+            logger.info('%d files have been saved', options['files'])
+
+            print('mode\tfull, s\tno changes, s')
+            backup_dir = os.path.join(workdir, 'backup')
+            for name, func in [
+                ('volumes listed, one process', lambda: _backup_as_before(storage, backup_dir, options['max_files'])),
+                ('manifest, 1 job', lambda: backup.backup(backup_dir, logger, 1, options['max_files'])),
+                ('manifest, {} jobs'.format(options['jobs']), lambda: backup.backup(backup_dir, logger, options['jobs'], options['max_files'])),
+            ]:
+                with mock.patch('storage.backup.create_storage', return_value=storage):
+                    t1 = time.time()
+                    func()
+                    t2 = time.time()
+                    func()
+                    t3 = time.time()
+                print('{}\t{:.2f}\t{:.2f}'.format(name, t2 - t1, t3 - t2))
+                shutil.rmtree(backup_dir)
+        finally:
+            shutil.rmtree(workdir)
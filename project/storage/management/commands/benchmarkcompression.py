@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from storage.storage_fs import FileSystemStorage
+
+SIZES = [2**14, 2**20, 2**26]
+# the number of files of each size is chosen to save about this number of bytes
+TOTAL_SIZE = 2**28
+MAX_FILES = 2000
+
+
+def _make_input(size, rng):
+    # a typical test: the number of values and the values
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(str(rng.randint(-10**9, 10**9)) for _ in range(10)) + '\n'
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode()[:size]
+
+
+def _make_output(size, rng):
+    # a typical log of a checker or a worker
+    lines = []
+    length = 0
+    while length < size:
+        line = 'Test {}: answer {} is correct, time {} ms\n'.format(len(lines) + 1, rng.randint(0, 10**6), rng.randint(0, 1000))
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode()[:size]
+
+
+def _make_binary(size, rng):
+    return os.urandom(size)
+
+
+def _unique(data, count):
+    for i in range(count):
+        yield i.to_bytes(8, 'little') + data[8:]
+
+
+class Command(BaseCommand):
+    help = 'Measures the disk footprint and the throughput of the file system storage with different compression methods'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='directory for the storage (the system temporary directory by default)')
+        parser.add_argument('--max-size', type=int, default=SIZES[-1])
+        parser.add_argument('--methods', default='none,deflate,zstd')
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        workdir = tempfile.mkdtemp(dir=options['dir'])
+        try:
+            print('data\tsize\tfiles\tmethod\ton disk, %\twrite, MB/s\tserve, MB/s\trepresent, ms')
+            for kind, make in [('input', _make_input), ('output', _make_output), ('binary', _make_binary)]:
+                for size in SIZES:
+                    if size > options['max_size']:
+                        break
+                    count = max(1, min(MAX_FILES, TOTAL_SIZE // size))
+                    data = make(size, rng)
+
+                    for method in options['methods'].split(','):
+                        directory = os.path.join(workdir, 'storage')
+                        try:
+                            storage = FileSystemStorage(directory, compression=None if method == 'none' else method)
+                        except ImportError as e:
+                            print('{}\t{}\t{}\t{}\t{}'.format(kind, size, count, method, e))
+                            continue
+
+                        t1 = time.time()
+                        resource_ids = [storage.save(ContentFile(blob)) for blob in _unique(data, count)]
+                        write_time = time.time() - t1
+
+                        on_disk = sum(storage.get_size_on_disk(resource_id) for resource_id in resource_ids)
+
+                        t1 = time.time()
+                        for resource_id in resource_ids:
+                            for _ in storage.serve(resource_id).generator:
+                                pass
+                        serve_time = time.time() - t1
+
+                        t1 = time.time()
+                        for resource_id in resource_ids:
+                            storage.represent(resource_id)
+                        represent_time = time.time() - t1
+
+                        shutil.rmtree(directory)
+                        print('{}\t{}\t{}\t{}\t{:.1f}\t{:.1f}\t{:.1f}\t{:.3f}'.format(
+                            kind, size, count, method,
+                            on_disk * 100. / (size * count),
+                            size * count / write_time / 2**20,
+                            size * count / serve_time / 2**20,
+                            represent_time * 1000. / count,
+                        ))
+        finally:
+            shutil.rmtree(workdir)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import six
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from common.templatetags.irunner_sourcecode import irunner_sourcecode
+from plagiarism.management.commands.benchmarkplagiarism import _make_source
+from proglangs.langlist import ProgrammingLanguage
+from storage.derived import DjangoCache, FileSystemCache, LocalMemoryCache, NullCache
+from storage.representation import _is_control_char
+from storage.storage_fs import FileSystemStorage
+
+
+def _is_binary_as_before(blob):
+    if isinstance(blob, six.binary_type):
+        return any(_is_control_char(code) for code in six.iterbytes(blob))
+    return any(_is_control_char(ord(c)) for c in blob)
+
+
+def _make_test(size, rng):
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(str(rng.randint(0, 10**9)) for _ in range(10)) + '\n'
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode()
+
+
+def _make_caches(workdir):
+    return [
+        ('no', NullCache()),
+        ('memory', LocalMemoryCache(2**26)),
+        ('filesystem', FileSystemCache(os.path.join(workdir, 'derived'), 2**26)),
+        ('django', DjangoCache()),
+    ]
+
+
+def _measure(func, repeat):
+    func()
+    t1 = time.time()
+    for _ in range(repeat):
+        func()
+    return (time.time() - t1) * 1000. / repeat
+
+
+class Command(BaseCommand):
+    help = 'Measures how long it takes to represent the tests of a problem and to highlight source code with different caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tests', type=int, default=50)
+        parser.add_argument('--size', type=int, default=2**20)
+        parser.add_argument('--sources', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        repeat = options['repeat']
+        workdir = tempfile.mkdtemp()
+        try:
+            storage = FileSystemStorage(os.path.join(workdir, 'storage'))
+            resource_ids = [storage.save(ContentFile(_make_test(options['size'], rng))) for _ in range(2 * options['tests'])]
+            # ProblemBrowseTestsView
+            params = {'max_lines': 10, 'max_line_length': 48}
+
+            print('tests page\tms per page')
+            with mock.patch('storage.representation._is_binary', _is_binary_as_before), \
+                    mock.patch('storage.storage._derived_cache', NullCache()):
+                print('byte loop, no cache\t{:.1f}'.format(_measure(lambda: storage.represent_many(resource_ids, **params), repeat)))
+            for name, derived_cache in _make_caches(workdir):
+                with mock.patch('storage.storage._derived_cache', derived_cache):
+                    derived_cache.clear()
+                    print('translate(), {} cache\t{:.1f}'.format(name, _measure(lambda: storage.represent_many(resource_ids, **params), repeat)))
+                    derived_cache.clear()
+
+            # SolutionSourceView
+            sources = [storage.save(ContentFile(_make_source(rng, 300).encode())) for _ in range(options['sources'])]
+
+            def show_sources():
+                for resource_id in sources:
+                    irunner_sourcecode(storage.represent(resource_id).text, ProgrammingLanguage.CPP, hrefs=True)
+
+            print('source code\tms per file')
+            for name, derived_cache in _make_caches(workdir):
+                with mock.patch('storage.storage._derived_cache', derived_cache):
+                    derived_cache.clear()
+                    print('{} cache\t{:.1f}'.format(name, _measure(show_sources, repeat) / len(sources)))
+                    derived_cache.clear()
+        finally:
+            shutil.rmtree(workdir)
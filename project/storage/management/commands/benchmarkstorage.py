@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.files.base import ContentFile, File
+from django.core.management.base import BaseCommand
+
+from storage.resource_id import ResourceId
+from storage.storage_fs import FileSystemStorage
+
+SIZES = [2**10, 2**16, 2**20, 2**26, 2**30]
+# the number of files of each size is chosen to save about this number of bytes
+TOTAL_SIZE = 2**28
+MAX_FILES = 2000
+
+
+class TwoPassStorage(FileSystemStorage):
+    '''
+    Saves files as it used to be done: the data is read once to be hashed and once more to be written.
+    '''
+    def _do_save(self, f):
+        h = hashlib.sha1()
+        for chunk in f.chunks():
+            h.update(chunk)
+        resource_id = ResourceId(h.digest())
+
+        target_name = self._get_path(resource_id)
+        if not os.path.exists(target_name):
+            with self._get_temp_file() as fd:
+                for chunk in f.chunks():
+                    fd.write(chunk)
+                temp_name = fd.name
+            self._move(temp_name, target_name)
+        return resource_id
+
+
+def _from_memory(data, count):
+    for i in range(count):
+        # every file is unique
+        yield ContentFile(i.to_bytes(8, 'little') + data[8:])
+
+
+def _from_disk(path, count):
+    for i in range(count):
+        with open(path, 'r+b') as fd:
+            fd.write(i.to_bytes(8, 'little'))
+            fd.seek(0)
+            yield File(fd)
+
+
+def _same_file(path, count):
+    for _ in range(count):
+        with open(path, 'rb') as fd:
+            yield File(fd)
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput of saving files of different sizes to the file system storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='directory for the storage and the source files (the system temporary directory by default)')
+        parser.add_argument('--max-size', type=int, default=SIZES[-1])
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(dir=options['dir'])
+        try:
+            print('size\tfiles\ttwo passes, memory\tone pass, memory\ttwo passes, file\tone pass or kernel copy, file\tdedup hit, file')
+            for size in SIZES:
+                if size > options['max_size']:
+                    break
+                count = max(1, min(MAX_FILES, TOTAL_SIZE // size))
+                data = os.urandom(size)
+                path = os.path.join(workdir, 'source')
+                with open(path, 'wb') as fd:
+                    fd.write(data)
+
+                results = []
+                for storage_class, files in [
+                    (TwoPassStorage, _from_memory(data, count)),
+                    (FileSystemStorage, _from_memory(data, count)),
+                    (TwoPassStorage, _from_disk(path, count)),
+                    (FileSystemStorage, _from_disk(path, count)),
+                    (FileSystemStorage, _same_file(path, count)),
+                ]:
+                    directory = os.path.join(workdir, 'storage')
+                    storage = storage_class(directory)
+                    t1 = time.time()
+                    for f in files:
+                        storage.save(f)
+                    results.append(size * count / (time.time() - t1) / 2**20)
+                    shutil.rmtree(directory)
+
+                del data
+                print('{}\t{}\t{}'.format(size, count, '\t'.join('{:.1f} MB/s'.format(r) for r in results)))
+        finally:
+            shutil.rmtree(workdir)
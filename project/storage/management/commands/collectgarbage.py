@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+import logging
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from storage.garbage import GRACE_PERIOD, MARK_BATCH_SIZE, SWEEP_BATCH_SIZE, GarbageCollector
+
+
+class Command(BaseCommand):
+    help = 'Deletes the files that are not referenced from DB while the system is running'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='only report the files that would be deleted')
+        parser.add_argument('--restart', action='store_true', help='abandon the unfinished run and start a new one')
+        parser.add_argument('--grace', type=float, default=GRACE_PERIOD.total_seconds() / 3600, help='files saved this number of hours before the run are kept')
+        parser.add_argument('--max-delete', type=int, help='maximum number of files to delete')
+        parser.add_argument('--mark-batch', type=int, default=MARK_BATCH_SIZE, help='rows read at once')
+        parser.add_argument('--sweep-batch', type=int, default=SWEEP_BATCH_SIZE, help='files checked at once')
+        parser.add_argument('--pause', type=float, default=0.1, help='seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+
+        collector = GarbageCollector(
+            logger,
+            mark_batch_size=options['mark_batch'],
+            sweep_batch_size=options['sweep_batch'],
+            pause=options['pause'],
+            grace_period=datetime.timedelta(hours=options['grace']),
+        )
+        run = collector.get_run(options['restart'])
+        logger.info('Run #%d started at %s', run.id, run.start_time)
+        collector.mark(run)
+
+        count, size = collector.report(run)
+        logger.info('Reclaimable: %d files, %s', count, filesizeformat(size))
+        if not options['dry_run']:
+            count, size = collector.sweep(run, options['max_delete'])
+            logger.info('Deleted: %d files, %s', count, filesizeformat(size))
+            if run.finish_time is None:
+                logger.info('Run #%d is not finished, start the command again to continue', run.id)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from storage.backup import find_missing, restore
+from storage.resource_id import ResourceId
+
+
+class Command(BaseCommand):
+    help = 'Restores files from the backup to the storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('backup-dir', help='backup directory')
+        parser.add_argument('resource_id', nargs='*', help='files to restore')
+        parser.add_argument('--missing', action='store_true', help='restore all the files that are missing in the storage')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+
+        resource_ids = [ResourceId.parse(s) for s in options['resource_id']]
+        if options['missing']:
+            resource_ids.extend(find_missing(options['backup-dir']))
+        logger.info('Files to restore: %d', len(resource_ids))
+
+        restored, errors = restore(options['backup-dir'], resource_ids)
+        for resource_id, message in errors:
+            logger.error('%s: %s', resource_id, message)
+        logger.info('%d files restored', restored)
+        if errors:
+            raise CommandError('{} files have not been restored'.format(len(errors)))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from storage.backup import verify
+from storage.resource_id import ResourceId
+
+
+class Command(BaseCommand):
+    help = 'Checks that the files can be extracted from the backup and have the right hashes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('backup-dir', help='backup directory')
+        parser.add_argument('resource_id', nargs='*', help='files to check (all the files by default)')
+        parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='number of processes that check volumes')
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger('irunner_import')
+
+        resource_ids = [ResourceId.parse(s) for s in options['resource_id']] or None
+        errors = verify(options['backup-dir'], resource_ids, options['jobs'])
+        for resource_id, message in errors:
+            logger.error('%s: %s', resource_id, message)
+        if errors:
+            raise CommandError('{} files are damaged or missing'.format(len(errors)))
+        logger.info('OK')
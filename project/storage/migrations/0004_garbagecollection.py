@@ -0,0 +1,39 @@
+# Generated by Django 3.1.2 on 2026-10-18 14:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import storage.resource_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('storage', '0003_varbinary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GarbageCollection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('mark_time', models.DateTimeField(null=True)),
+                ('finish_time', models.DateTimeField(null=True)),
+                ('cursors', models.TextField(default='{}')),
+                ('deleted_count', models.IntegerField(default=0)),
+                ('deleted_size', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MarkedResource',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_id', storage.resource_id.ResourceIdField()),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='storage.garbagecollection')),
+            ],
+            options={
+                'unique_together': {('collection', 'resource_id')},
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from .resource_id import ResourceIdField
@@ -19,3 +20,25 @@ class FileMetadataBase(models.Model):
 
 class FileMetadata(FileMetadataBase):
     pass
+
+
+class GarbageCollection(models.Model):
+    '''
+    A run of the garbage collector. The references to the stored files are marked by scanning
+    the tables in the order of primary keys, then the files that are not marked are swept.
+    '''
+    start_time = models.DateTimeField(default=timezone.now)
+    mark_time = models.DateTimeField(null=True)
+    finish_time = models.DateTimeField(null=True)
+    # JSON: {model label: the last primary key marked}
+    cursors = models.TextField(default='{}')
+    deleted_count = models.IntegerField(default=0)
+    deleted_size = models.BigIntegerField(default=0)
+
+
+class MarkedResource(models.Model):
+    collection = models.ForeignKey(GarbageCollection, on_delete=models.CASCADE)
+    resource_id = ResourceIdField()
+
+    class Meta:
+        unique_together = [('collection', 'resource_id')]
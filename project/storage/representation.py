@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+import re
 import six
 
 from common.stringutils import cut_text_block
@@ -47,11 +48,17 @@ def _is_control_char(code):
     return (code < 9) or (13 < code < 32) or (code == 127)
 
 
+_CONTROL_CHARS = ''.join(six.unichr(code) for code in range(128) if _is_control_char(code))
+_CONTROL_CHAR_RE = re.compile('[{}]'.format(re.escape(_CONTROL_CHARS)))
+# all the bytes that are not control chars: translate() deletes them, and nothing is left of a text file
+_NON_CONTROL_BYTES = bytes(code for code in range(256) if not _is_control_char(code))
+
+
 def _is_binary(blob):
     if isinstance(blob, six.binary_type):
-        return any(_is_control_char(code) for code in six.iterbytes(blob))
+        return len(blob.translate(None, _NON_CONTROL_BYTES)) != 0
     if isinstance(blob, six.text_type):
-        return any(_is_control_char(ord(c)) for c in blob)
+        return _CONTROL_CHAR_RE.search(blob) is not None
     raise TypeError('unsupported argument type: {}'.format(type(blob)))
 
 
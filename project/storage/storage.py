@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import os
+
 from django.conf import settings
 
 _storage = None
@@ -11,9 +13,38 @@ def create_storage():
     if _storage is None:
         if settings.STORAGE_DIR:
             from .storage_fs import FileSystemStorage
-            _storage = FileSystemStorage(settings.STORAGE_DIR)
+            _storage = FileSystemStorage(
+                settings.STORAGE_DIR,
+                settings.STORAGE_INDEX_SIZE,
+                settings.STORAGE_COMPRESSION,
+                settings.STORAGE_COMPRESSION_THRESHOLD
+            )
         if settings.MONGODB_URI:
             from .storage_gridfs import GridFsStorage
             _storage = GridFsStorage(settings.MONGODB_URI)
 
     return _storage
+
+
+_derived_cache = None
+
+
+def create_derived_cache():
+    global _derived_cache
+
+    if _derived_cache is None:
+        from . import derived
+        kind = settings.STORAGE_DERIVED_CACHE
+        if kind == 'memory':
+            _derived_cache = derived.LocalMemoryCache(settings.STORAGE_DERIVED_CACHE_SIZE)
+        elif kind == 'filesystem':
+            directory = settings.STORAGE_DERIVED_CACHE_DIR or (os.path.normpath(settings.STORAGE_DIR) + '-derived')
+            _derived_cache = derived.FileSystemCache(directory, settings.STORAGE_DERIVED_CACHE_SIZE)
+        elif kind == 'django':
+            _derived_cache = derived.DjangoCache()
+        elif kind is None:
+            _derived_cache = derived.NullCache()
+        else:
+            raise ValueError('Unknown derived cache: {}'.format(kind))
+
+    return _derived_cache
@@ -3,7 +3,6 @@
 from __future__ import unicode_literals
 
 import binascii
-import hashlib
 import os
 import six
 import sys
@@ -19,6 +18,7 @@ from django.utils.encoding import force_text
 from .representation import represent_blob
 from .resource_id import HASH_SIZE
 from .resource_id import ResourceId
+from .storage import create_derived_cache
 
 
 def _get_data_directly(resource_id):
@@ -52,6 +52,12 @@ class IDataStorage(object):
         '''
         raise NotImplementedError()
 
+    def represent_many(self, resource_ids, limit=DEFAULT_REPRESENTATION_LIMIT, max_lines=None, max_line_length=None):
+        '''
+        Returns a list of ResourseRepresentation objects (or None for missing files) for each resource.
+        '''
+        raise NotImplementedError()
+
     def get_size_on_disk(self, resource_id):
         '''
         Returns file size (incl. storage overhead) or None if the file is not available.
@@ -64,9 +70,11 @@ class IDataStorage(object):
         '''
         raise NotImplementedError()
 
-    def check_availability(self, resource_ids):
+    def check_availability(self, resource_ids, touch=False):
         '''
         Returns a list of boolean flags for each resource.
+        If touch is True, the files found are marked as saved just now, so the garbage collector
+        keeps them: the caller is going to reference them instead of uploading.
         '''
         raise NotImplementedError()
 
@@ -85,10 +93,34 @@ class IDataStorage(object):
         '''
         raise NotImplementedError()
 
+    def list_all_with_mtime(self):
+        '''
+        Generates tuples (resource_id, size, mtime) for each stored file, where mtime is
+        the time (as a Unix timestamp) when the file was saved or touched last time.
+        Slow, used by the garbage collector.
+        '''
+        raise NotImplementedError()
+
+    def delete(self, resource_id, saved_before):
+        '''
+        Deletes the file unless it has been saved or touched since saved_before (a Unix timestamp).
+        Returns the number of bytes freed or None if the file has not been deleted.
+        '''
+        raise NotImplementedError()
+
+
+def hash_chunks(f, h):
+    '''
+    Yields chunks of the Django file, passing them to the hash object on the way.
+    '''
+    for chunk in f.chunks():
+        h.update(chunk)
+        yield chunk
+
 
 class DataStorage(IDataStorage):
-    def _do_save(self, resource_id, f):
-        # Saves a Django file and returns nothing
+    def _do_save(self, f):
+        # Saves a Django file reading it once, returns its resource_id (see hash_chunks)
         raise NotImplementedError()
 
     def save(self, f):
@@ -100,22 +132,34 @@ class DataStorage(IDataStorage):
             data = f.read()
             resource_id = ResourceId(data)
         else:
-            h = hashlib.sha1()
-            for chunk in f.chunks():
-                h.update(chunk)
-
-            resource_id = ResourceId(h.digest())
-            self._do_save(resource_id, f)
+            resource_id = self._do_save(f)
         return resource_id
 
-    def represent(self, resource_id, limit=DEFAULT_REPRESENTATION_LIMIT, max_lines=None, max_line_length=None):
-        if resource_id is None:
-            return None
+    def _do_represent(self, resource_id, limit, max_lines, max_line_length):
         blob, size = self.read_with_size(resource_id, limit)
         if blob is None:
             return None
         return represent_blob(blob, size, max_lines, max_line_length)
 
+    def represent(self, resource_id, limit=DEFAULT_REPRESENTATION_LIMIT, max_lines=None, max_line_length=None):
+        if resource_id is None:
+            return None
+        return self.represent_many([resource_id], limit, max_lines, max_line_length)[0]
+
+    def represent_many(self, resource_ids, limit=DEFAULT_REPRESENTATION_LIMIT, max_lines=None, max_line_length=None):
+        # the representations of stored files are taken from the derived cache with one request,
+        # missing files are not cached: they may be uploaded later
+        inline_ids = set(resource_id for resource_id in resource_ids if resource_id is not None and _get_data_directly(resource_id) is not None)
+        stored = create_derived_cache().get_or_make_many(
+            [None if resource_id in inline_ids else resource_id for resource_id in resource_ids],
+            'repr', (limit, max_lines, max_line_length),
+            lambda resource_id: self._do_represent(resource_id, limit, max_lines, max_line_length)
+        )
+        return [
+            self._do_represent(resource_id, limit, max_lines, max_line_length) if resource_id in inline_ids else representation
+            for resource_id, representation in zip(resource_ids, stored)
+        ]
+
     def _do_get_size_on_disk(self, resource_id):
         # Must return actual_size or 0 if the file is absent
         raise NotImplementedError()
@@ -153,11 +197,11 @@ class DataStorage(IDataStorage):
             return (blob, size <= max_size if max_size is not None else True)
         return (None, False)
 
-    def _do_get_existing_files(self, resource_ids):
+    def _do_get_existing_files(self, resource_ids, touch):
         # returns a set of resource_ids
         raise NotImplementedError()
 
-    def check_availability(self, resource_ids):
+    def check_availability(self, resource_ids, touch=False):
         inline_ids = set()
         ids_to_check = []
 
@@ -167,6 +211,6 @@ class DataStorage(IDataStorage):
             else:
                 ids_to_check.append(resource_id)
 
-        existing_ids = self._do_get_existing_files(ids_to_check) | inline_ids
+        existing_ids = self._do_get_existing_files(ids_to_check, touch) | inline_ids
 
         return [(resource_id in existing_ids) for resource_id in resource_ids]
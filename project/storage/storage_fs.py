@@ -1,30 +1,133 @@
 # -*- coding: utf-8 -*-
 
 import binascii
+import collections
+import errno
+import hashlib
+import itertools
 import os
 import six
+import stat
 import sys
 import tempfile
+import threading
 
 from wsgiref.util import FileWrapper
 
 from django.utils.encoding import force_text
 
+from .compression import SIGNATURE, get_codec, read_header, write_compressed, write_plain
 from .resource_id import HASH_SIZE
 from .resource_id import ResourceId
-from .storage_base import DataStorage, ServedData
+from .storage_base import DataStorage, ServedData, hash_chunks
 
 
-def _get_size(fd):
-    fd.seek(0, os.SEEK_END)
-    size = fd.tell()
-    fd.seek(0, os.SEEK_SET)
-    return size
+# A shard directory is listed instead of checking the files one by one if there are at least
+# this number of files to check in it. Listing does not read inodes, but it reads the whole directory:
+# with 1000 files in a shard listing costs as much as about 50 checks when everything is in the OS cache.
+SCANDIR_THRESHOLD = 128
+
+# The files that are already on disk and are at least this large are hashed first and then copied by the kernel
+# (or not copied at all if they are stored already). Smaller files are copied faster through a user space buffer.
+KERNEL_COPY_THRESHOLD = 2**24
+# the files that are already on disk are hashed by chunks of this size
+FILE_CHUNK_SIZE = 2**20
+# the files are served by chunks of this size
+SERVE_CHUNK_SIZE = 2**16
+
+# Smaller files are never compressed: they take a single block on disk anyway.
+COMPRESSION_THRESHOLD = 2**13
+
+
+class ResourceIndex(object):
+    '''
+    LRU set of resource ids that are known to be present in the storage.
+    '''
+    def __init__(self, size):
+        self._size = size
+        self._ids = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, resource_id):
+        with self._lock:
+            if resource_id not in self._ids:
+                return False
+            self._ids.move_to_end(resource_id)
+            return True
+
+    def add(self, resource_id):
+        with self._lock:
+            self._ids[resource_id] = None
+            self._ids.move_to_end(resource_id)
+            while len(self._ids) > self._size:
+                self._ids.popitem(last=False)
+
+    def discard(self, resource_id):
+        with self._lock:
+            self._ids.pop(resource_id, None)
+
+
+def _iter_and_close(fd, chunks):
+    try:
+        for chunk in chunks:
+            yield chunk
+    finally:
+        fd.close()
+
+
+def _get_fileno(f):
+    '''
+    Returns the descriptor of the large regular file behind the Django file, or None.
+    '''
+    try:
+        fileno = f.file.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    st = os.fstat(fileno)
+    return fileno if stat.S_ISREG(st.st_mode) and st.st_size >= KERNEL_COPY_THRESHOLD else None
+
+
+def _copy_file(src, dst, size):
+    '''
+    Copies the file without passing the data through the user space.
+    copy_file_range() shares the blocks on the file systems that support it (Btrfs, XFS).
+    Returns False if the kernel cannot copy the file.
+    Some file systems report that nothing has been copied instead of failing: the next method is tried then.
+    '''
+    for copy in _KERNEL_COPY_FUNCTIONS:
+        offset = 0
+        try:
+            while offset < size:
+                copied = copy(src, dst, offset, size - offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError as e:
+            if offset != 0 or e.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+            continue
+        if offset == 0 and size != 0:
+            continue
+        if offset != size:
+            # the stored file would not match its hash
+            raise IOError('Only {} bytes of {} have been copied'.format(offset, size))
+        return True
+    return False
+
+
+_KERNEL_COPY_FUNCTIONS = []
+if hasattr(os, 'copy_file_range'):
+    _KERNEL_COPY_FUNCTIONS.append(lambda src, dst, offset, count: os.copy_file_range(src, dst, count, offset, offset))
+if sys.platform.startswith('linux'):
+    _KERNEL_COPY_FUNCTIONS.append(lambda src, dst, offset, count: os.sendfile(dst, src, offset, count))
 
 
 class FileSystemStorage(DataStorage):
-    def __init__(self, directory):
+    def __init__(self, directory, index_size=0, compression=None, compression_threshold=COMPRESSION_THRESHOLD):
         self._directory = directory
+        self._index = ResourceIndex(index_size) if index_size > 0 else None
+        self._codec = get_codec(compression) if compression else None
+        self._compression_threshold = compression_threshold
         if not os.path.exists(directory):
             os.mkdir(directory)
 
@@ -46,27 +149,105 @@ class FileSystemStorage(DataStorage):
     def _get_temp_file(self):
         return tempfile.NamedTemporaryFile(dir=self._directory, delete=False)
 
-    def _do_save(self, resource_id, f):
+    def _write_temp_file(self, write):
+        with self._get_temp_file() as fd:
+            try:
+                result = write(fd)
+            except Exception:
+                fd.close()
+                os.remove(fd.name)
+                raise
+            return (fd.name, result)
+
+    def _do_save(self, f):
+        compress = self._codec is not None and f.size >= self._compression_threshold
+        if not compress:
+            fileno = _get_fileno(f)
+            if fileno is not None and os.pread(fileno, len(SIGNATURE), 0) != SIGNATURE:
+                return self._save_file(f, fileno)
+
+        # the data is hashed while being written to a temporary file which is then renamed
+        h = hashlib.sha1()
+        chunks = hash_chunks(f, h)
+        if compress:
+            temp_name = self._write_compressed(chunks)
+        else:
+            temp_name, _ = self._write_temp_file(lambda fd: write_plain(fd, chunks))
+
+        resource_id = ResourceId(h.digest())
         target_name = self._get_path(resource_id)
 
-        if not os.path.exists(target_name):
-            with self._get_temp_file() as fd:
-                for chunk in f.chunks():
-                    fd.write(chunk)
-                temp_name = fd.name
+        if not self._touch(target_name):
+            self._move(temp_name, target_name)
+        else:
+            os.remove(temp_name)
+
+        if self._index is not None:
+            self._index.add(resource_id)
+        return resource_id
+
+    def _write_compressed(self, chunks):
+        temp_name, compressed = self._write_temp_file(lambda fd: write_compressed(fd, chunks, self._codec))
+        if compressed:
+            return temp_name
 
-            if not os.path.exists(target_name):
+        # poorly compressible data is stored as it is: the part that has been compressed already
+        # is decompressed, and the rest is read from the source
+        try:
+            with open(temp_name, 'rb') as fd:
+                codec, _ = read_header(fd)
+                plain_name, _ = self._write_temp_file(lambda plain: write_plain(plain, itertools.chain(codec.iter_decompressed(fd), chunks)))
+        finally:
+            os.remove(temp_name)
+        return plain_name
+
+    def _save_file(self, f, fileno):
+        # the file is already on disk (e.g. a large upload): it is hashed first,
+        # and copied by the kernel only if it is not stored yet
+        h = hashlib.sha1()
+        for chunk in f.chunks(chunk_size=FILE_CHUNK_SIZE):
+            h.update(chunk)
+
+        resource_id = ResourceId(h.digest())
+        target_name = self._get_path(resource_id)
+
+        if not self._touch(target_name):
+            with self._get_temp_file() as fd:
                 try:
-                    os.rename(temp_name, target_name)
-                except OSError as e:
-                    # HACK: The file is locked by antivirus
-                    if not (sys.platform.startswith('win') and isinstance(e, WindowsError)):
-                        raise
-            else:
-                os.remove(temp_name)
+                    if not _copy_file(fileno, fd.fileno(), os.fstat(fileno).st_size):
+                        for chunk in f.chunks(chunk_size=FILE_CHUNK_SIZE):
+                            fd.write(chunk)
+                except Exception:
+                    fd.close()
+                    os.remove(fd.name)
+                    raise
+                temp_name = fd.name
+            self._move(temp_name, target_name)
 
+        if self._index is not None:
+            self._index.add(resource_id)
         return resource_id
 
+    def _touch(self, target_name):
+        # the garbage collector keeps the files that have been saved (or touched) recently,
+        # so an existing file is touched whenever it is saved once again
+        try:
+            os.utime(target_name)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _move(self, temp_name, target_name):
+        if not os.path.exists(target_name):
+            try:
+                os.rename(temp_name, target_name)
+            except OSError as e:
+                # HACK: The file is locked by antivirus
+                if not (sys.platform.startswith('win') and isinstance(e, WindowsError)):
+                    raise
+        else:
+            os.remove(temp_name)
+
     def _do_get_size_on_disk(self, resource_id):
         target_name = self._get_path(resource_id)
         # TODO
@@ -77,31 +258,88 @@ class FileSystemStorage(DataStorage):
         except FileNotFoundError:
             return 0
 
-    def _do_serve(self, resource_id):
+    def _open(self, resource_id):
+        # returns (fd, codec or None, logical size) or None if the file is missing;
+        # the file is not buffered: the data is read by large chunks or at once
         target_name = self._get_path(resource_id)
         try:
-            fd = open(target_name, 'rb')
+            fd = open(target_name, 'rb', buffering=0)
         except FileNotFoundError:
             return None
-        size = _get_size(fd)
-        return ServedData(size, FileWrapper(fd))
+        try:
+            header = read_header(fd)
+        except Exception:
+            fd.close()
+            raise
+        if header is None:
+            return (fd, None, os.fstat(fd.fileno()).st_size)
+        codec, size = header
+        return (fd, codec, size)
+
+    def _do_serve(self, resource_id):
+        opened = self._open(resource_id)
+        if opened is None:
+            return None
+        fd, codec, size = opened
+        if codec is None:
+            return ServedData(size, FileWrapper(fd, SERVE_CHUNK_SIZE))
+        return ServedData(size, _iter_and_close(fd, codec.iter_decompressed(fd)))
 
     def _do_read_with_size(self, resource_id, max_size):
-        target_name = self._get_path(resource_id)
-        try:
-            with open(target_name, 'rb') as fd:
-                size = _get_size(fd)
-                blob = fd.read() if max_size is None else fd.read(max_size)
-                return (blob, size)
-        except FileNotFoundError:
+        opened = self._open(resource_id)
+        if opened is None:
             return (None, 0)
+        fd, codec, size = opened
+        with fd:
+            if codec is None:
+                blob = fd.read() if max_size is None or max_size >= size else fd.read(max_size)
+            else:
+                chunks = []
+                length = 0
+                for chunk in codec.iter_decompressed(fd):
+                    chunks.append(chunk)
+                    length += len(chunk)
+                    if max_size is not None and length >= max_size:
+                        break
+                blob = b''.join(chunks)
+                if max_size is not None:
+                    blob = blob[:max_size]
+            return (blob, size)
+
+    def _do_get_existing_files(self, resource_ids, touch):
+        if touch:
+            # every file is touched, so the index does not help
+            result = set(resource_id for resource_id in resource_ids if self._touch(self._get_path(resource_id)))
+            if self._index is not None:
+                for resource_id in result:
+                    self._index.add(resource_id)
+            return result
 
-    def _do_get_existing_files(self, resource_ids):
         result = set()
+        shards = collections.defaultdict(list)
+
         for resource_id in resource_ids:
-            target_name = self._get_path(resource_id)
-            if os.path.exists(target_name):
-                result.insert(resource_id)
+            if self._index is not None and resource_id in self._index:
+                result.add(resource_id)
+            else:
+                subdir, name = os.path.split(self._get_path(resource_id))
+                shards[subdir].append((name, resource_id))
+
+        for subdir, files in shards.items():
+            if len(files) >= SCANDIR_THRESHOLD:
+                try:
+                    with os.scandir(subdir) as it:
+                        names = set(entry.name for entry in it)
+                except FileNotFoundError:
+                    names = set()
+                found = [resource_id for name, resource_id in files if name in names]
+            else:
+                found = [resource_id for name, resource_id in files if os.path.exists(os.path.join(subdir, name))]
+
+            result.update(found)
+            if self._index is not None:
+                for resource_id in found:
+                    self._index.add(resource_id)
         return result
 
     def list_all(self):
@@ -110,3 +348,35 @@ class FileSystemStorage(DataStorage):
             with os.scandir(subdir) as it:
                 for entry in it:
                     yield (ResourceId.parse(entry.name), entry.stat().st_size)
+
+    def list_all_with_mtime(self):
+        for subdir in FileSystemStorage._list_subdirectory_names(self._directory):
+            with os.scandir(subdir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield (ResourceId.parse(entry.name), st.st_size, st.st_mtime)
+
+    def delete(self, resource_id, saved_before):
+        if self._index is not None:
+            self._index.discard(resource_id)
+
+        # The file is moved away first. A concurrent save either touches it before that and the file is kept,
+        # or does not find it and writes it anew.
+        target_name = self._get_path(resource_id)
+        with self._get_temp_file() as fd:
+            temp_name = fd.name
+        try:
+            os.replace(target_name, temp_name)
+        except FileNotFoundError:
+            os.remove(temp_name)
+            return None
+
+        st = os.stat(temp_name)
+        if st.st_mtime >= saved_before:
+            self._move(temp_name, target_name)
+            return None
+        os.remove(temp_name)
+        return st.st_size
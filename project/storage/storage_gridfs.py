@@ -1,25 +1,46 @@
 # -*- coding: utf-8 -*-
 
+import calendar
+import datetime
+import hashlib
+
 from wsgiref.util import FileWrapper
 
 from .resource_id import ResourceId
-from .storage_base import DataStorage, ServedData
+from .storage_base import DataStorage, ServedData, hash_chunks
 
 from gridfs import GridFSBucket
 from gridfs.errors import NoFile
 from pymongo import MongoClient
 
+# files are uploaded under this name until their hash is known
+TEMP_FILENAME = '.incomplete'
+
 
 class GridFsStorage(DataStorage):
     def __init__(self, uri):
         self._db = MongoClient(uri).filestorage
         self._fs = GridFSBucket(self._db)
 
-    def _do_save(self, resource_id, f):
-        with self._fs.open_upload_stream(str(resource_id)) as grid_in:
-            for chunk in f.chunks():
+    def _do_save(self, f):
+        # the data is hashed while being uploaded under a temporary name, then the file is renamed
+        h = hashlib.sha1()
+        with self._fs.open_upload_stream(TEMP_FILENAME) as grid_in:
+            for chunk in hash_chunks(f, h):
                 grid_in.write(chunk)
 
+        resource_id = ResourceId(h.digest())
+        # the upload date of an existing file is updated: the garbage collector keeps the files saved recently
+        if self._touch([str(resource_id)]) == 0:
+            self._fs.rename(grid_in._id, str(resource_id))
+        else:
+            self._fs.delete(grid_in._id)
+        return resource_id
+
+    def _touch(self, names):
+        result = self._db.fs.files.update_many({'filename': {'$in': names}}, {'$set': {'uploadDate': datetime.datetime.utcnow()}})
+        return result.matched_count
+
     def _do_get_size_on_disk(self, resource_id):
         try:
             with self._fs.open_download_stream_by_name(str(resource_id)) as grid_out:
@@ -42,13 +63,27 @@ class GridFsStorage(DataStorage):
         except NoFile:
             return (None, 0)
 
-    def _do_get_existing_files(self, resource_ids):
+    def _do_get_existing_files(self, resource_ids, touch):
         names = [str(resource_id) for resource_id in resource_ids]
+        if touch:
+            self._touch(names)
         res = set()
         for fd in self._fs.find({"filename": {"$in": names}}):
             res.add(ResourceId.parse(fd.filename))
         return res
 
     def list_all(self):
-        for entry in self._fs.find():
-            yield (entry.filename, entry.length)
+        for entry in self._fs.find({'filename': {'$ne': TEMP_FILENAME}}):
+            yield (ResourceId.parse(entry.filename), entry.length)
+
+    def list_all_with_mtime(self):
+        for entry in self._fs.find({'filename': {'$ne': TEMP_FILENAME}}):
+            yield (ResourceId.parse(entry.filename), entry.length, calendar.timegm(entry.upload_date.utctimetuple()))
+
+    def delete(self, resource_id, saved_before):
+        saved_before = datetime.datetime.utcfromtimestamp(saved_before)
+        size = None
+        for entry in self._fs.find({'filename': str(resource_id), 'uploadDate': {'$lt': saved_before}}):
+            self._fs.delete(entry._id)
+            size = entry.length
+        return size
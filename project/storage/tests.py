@@ -4,19 +4,29 @@ from __future__ import unicode_literals
 
 from django.test import TestCase
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
+from django.core.files.base import ContentFile, File
 from django.utils.encoding import force_text
 
+from . import backup
+from .garbage import GarbageCollector, get_resource_fields
+from .models import FileMetadata, GarbageCollection, MarkedResource
+from .compression import SIGNATURE, is_compressed
+from .derived import DjangoCache, FileSystemCache, LocalMemoryCache
 from .encodings import try_decode_ascii
 from .storage_fs import FileSystemStorage
 from .resource_id import ResourceId
+from .storage import create_derived_cache
 from .validators import validate_filename
-from .representation import ResourseRepresentation, represent_blob
+from .representation import ResourseRepresentation, represent_blob, _is_binary, _is_control_char
 
 import codecs
+import logging
 import os
 import shutil
 import tempfile
+import time
+import zipfile
+from unittest import mock
 
 
 class DataIdTests(TestCase):
@@ -94,6 +104,320 @@ class FileSystemStorageTests(TestCase):
         finally:
             shutil.rmtree(dirpath)
 
+    def _check_availability(self, fs):
+        present = [fs.save(ContentFile('file {}'.format(i).encode() * 10)) for i in range(5)]
+        inline = fs.save(ContentFile(b'inline'))
+        absent = ResourceId.parse('59db6ba4a6aff5ed3d980542daf41be65624a1e8')
+        # the same shard as an existing file
+        absent_nearby = ResourceId.parse(str(present[0])[:2] + '0' * 38)
+
+        resource_ids = [absent, present[0], inline, absent_nearby] + present[1:]
+        expected = [False, True, True, False] + [True] * 4
+        self.assertEqual(fs.check_availability(resource_ids), expected)
+
+        with mock.patch('storage.storage_fs.SCANDIR_THRESHOLD', 1):
+            self.assertEqual(fs.check_availability(resource_ids), expected)
+        return present
+
+    def test_check_availability(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            self._check_availability(FileSystemStorage(os.path.join(dirpath, 'filestorage')))
+
+            # the index keeps the three files seen last and it is trusted:
+            # a file removed behind the storage's back is reported as present
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage_indexed'), index_size=3)
+            present = self._check_availability(fs)
+            for resource_id in present:
+                os.remove(fs._get_path(resource_id))
+            self.assertEqual(fs.check_availability(present), [False, False, True, True, True])
+        finally:
+            shutil.rmtree(dirpath)
+
+    @mock.patch('storage.storage_fs.KERNEL_COPY_THRESHOLD', 2**20)
+    def test_save_file(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage'))
+            data = os.urandom(3 * 2**20 + 1)
+            path = os.path.join(dirpath, 'upload')
+            with open(path, 'wb') as fd:
+                fd.write(data)
+
+            with open(path, 'rb') as fd:
+                resource_id = fs.save(File(fd))
+            self.assertEqual(fs.read_blob(resource_id, None), (data, True))
+            # the same file has been saved from memory
+            self.assertEqual(fs.save(ContentFile(data)), resource_id)
+            os.remove(fs._get_path(resource_id))
+
+            # the kernel cannot copy the file
+            with mock.patch('storage.storage_fs._KERNEL_COPY_FUNCTIONS', []), open(path, 'rb') as fd:
+                self.assertEqual(fs.save(File(fd)), resource_id)
+            self.assertEqual(fs.read_blob(resource_id, None), (data, True))
+            os.remove(fs._get_path(resource_id))
+
+            # the kernel reports that nothing has been copied
+            with mock.patch('storage.storage_fs._KERNEL_COPY_FUNCTIONS', [lambda src, dst, offset, count: 0]), open(path, 'rb') as fd:
+                self.assertEqual(fs.save(File(fd)), resource_id)
+            self.assertEqual(fs.read_blob(resource_id, None), (data, True))
+            os.remove(fs._get_path(resource_id))
+
+            # the copying stops halfway
+            def copy_half(src, dst, offset, count):
+                return os.sendfile(dst, src, offset, len(data) // 2) if offset == 0 else 0
+
+            with mock.patch('storage.storage_fs._KERNEL_COPY_FUNCTIONS', [copy_half]), open(path, 'rb') as fd:
+                self.assertRaises(IOError, fs.save, File(fd))
+            self.assertFalse(os.path.exists(fs._get_path(resource_id)))
+
+            # no temporary files are left
+            self.assertEqual([name for name in os.listdir(fs._directory) if len(name) != 2], [])
+        finally:
+            shutil.rmtree(dirpath)
+
+
+class CompressionTests(TestCase):
+    def _check(self, fs, data, compressed):
+        resource_id = fs.save(ContentFile(data))
+        path = fs._get_path(resource_id)
+        self.assertEqual(is_compressed(path), compressed)
+        self.assertEqual(os.path.getsize(path) < len(data), compressed)
+
+        self.assertEqual(fs.read_blob(resource_id, None), (data, True))
+        self.assertEqual(fs.read_blob(resource_id, 100), (data[:100], len(data) <= 100))
+        self.assertEqual(fs.read_with_size(resource_id, 2**20), (data[:2**20], len(data)))
+        served = fs.serve(resource_id)
+        self.assertEqual(served.size, len(data))
+        self.assertEqual(b''.join(served.generator), data)
+        self.assertEqual(fs.represent(resource_id).size, len(data))
+        return resource_id
+
+    def _run(self, compression):
+        dirpath = tempfile.mkdtemp()
+        try:
+            directory = os.path.join(dirpath, 'filestorage')
+            fs = FileSystemStorage(directory, compression=compression)
+            text = b''.join('{} {}\n'.format(i, i * i).encode() for i in range(500000))
+            noise = os.urandom(3 * 2**20)
+
+            resource_id = self._check(fs, text, True)
+            self._check(fs, b'small text' * 10, False)
+            self._check(fs, noise, False)
+            # poorly compressible data after a compressible part
+            self._check(fs, text[:2**19] + noise, False)
+            # data that looks like a compressed file
+            self._check(fs, SIGNATURE + text, True)
+            self._check(fs, SIGNATURE + noise, False)
+            self._check(fs, SIGNATURE * 4, False)
+
+            # the files are read the same way if compression is disabled
+            fs = FileSystemStorage(directory)
+            self.assertEqual(fs.read_blob(resource_id, None), (text, True))
+            self._check(fs, SIGNATURE + noise[:100], False)
+            with open(os.path.join(dirpath, 'upload'), 'wb+') as fd:
+                fd.write(SIGNATURE + noise)
+                fd.seek(0)
+                with mock.patch('storage.storage_fs.KERNEL_COPY_THRESHOLD', 2**20):
+                    resource_id = fs.save(File(fd))
+            self.assertEqual(fs.read_blob(resource_id, None), (SIGNATURE + noise, True))
+
+            # no temporary files are left
+            self.assertEqual([name for name in os.listdir(directory) if len(name) != 2], [])
+        finally:
+            shutil.rmtree(dirpath)
+
+    def test_deflate(self):
+        self._run('deflate')
+
+    def test_zstd(self):
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            self.skipTest('zstandard is not installed')
+        self._run('zstd')
+
+
+class RepresentationCacheTests(TestCase):
+    def setUp(self):
+        create_derived_cache().clear()
+
+    def test_represent_many(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage'))
+            stored = fs.save(ContentFile(b'1 2 3\n' * 1000))
+            inline = fs.save(ContentFile(b'4 5\n'))
+            absent = ResourceId.parse('59db6ba4a6aff5ed3d980542daf41be65624a1e8')
+
+            text = represent_blob(b'1 2 3\n' * 1000, max_lines=2).text
+            reprs = fs.represent_many([stored, None, inline, absent, stored], max_lines=2)
+            self.assertEqual([r.text if r is not None else None for r in reprs], [text, None, '4 5\n', None, text])
+            self.assertFalse(reprs[0].is_complete())
+            self.assertEqual(reprs[0].size, 6000)
+
+            # the files are not read once they have been represented
+            os.remove(fs._get_path(stored))
+            with mock.patch.object(fs, '_do_read_with_size', return_value=(None, 0)) as read:
+                self.assertEqual(fs.represent(stored, max_lines=2).text, text)
+                self.assertIsNone(fs.represent(absent))
+                self.assertEqual(read.call_count, 1)
+            # the representation depends on the parameters
+            self.assertIsNone(fs.represent(stored))
+        finally:
+            shutil.rmtree(dirpath)
+
+
+class DerivedCacheTests(TestCase):
+    def _run(self, derived_cache):
+        ids = [ResourceId.parse('{:040x}'.format(i)) for i in range(3)]
+        made = []
+
+        def make(resource_id):
+            made.append(resource_id)
+            return None if resource_id == ids[2] else [str(resource_id)] * 100
+
+        result = derived_cache.get_or_make_many([ids[0], None, ids[1], ids[2], ids[0]], 'test', (1, None), make)
+        self.assertEqual(result, [[str(ids[0])] * 100, None, [str(ids[1])] * 100, None, [str(ids[0])] * 100])
+        self.assertEqual(made, ids)
+
+        # None is not cached, the parameters are a part of the key
+        self.assertEqual(derived_cache.get_or_make(ids[1], 'test', (1, None), make), [str(ids[1])] * 100)
+        self.assertEqual(made, ids)
+        derived_cache.get_or_make(ids[2], 'test', (1, None), make)
+        derived_cache.get_or_make(ids[1], 'test', (2, None), make)
+        derived_cache.get_or_make(ids[1], 'other', (1, None), make)
+        self.assertEqual(made, ids + [ids[2], ids[1], ids[1]])
+
+        derived_cache.clear()
+        derived_cache.get_or_make(ids[0], 'test', (1, None), make)
+        self.assertEqual(made[-1], ids[0])
+
+    def test_memory(self):
+        self._run(LocalMemoryCache(2**20))
+
+        # the least recently used artifacts are evicted
+        derived_cache = LocalMemoryCache(2500)
+        ids = [ResourceId.parse('{:040x}'.format(i)) for i in range(3)]
+        for resource_id in ids + [ids[0]]:
+            derived_cache.get_or_make(resource_id, 'test', (), lambda resource_id: b'x' * 1000)
+        self.assertEqual(derived_cache.get_or_make_many(ids, 'test', (), lambda resource_id: None), [b'x' * 1000, None, b'x' * 1000])
+
+    def test_filesystem(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            self._run(FileSystemCache(os.path.join(dirpath, 'derived'), 2**20))
+
+            derived_cache = FileSystemCache(os.path.join(dirpath, 'derived'), 25000)
+            ids = [ResourceId.parse('{:040x}'.format(i)) for i in range(30)]
+            for i, resource_id in enumerate(ids):
+                derived_cache.get_or_make(resource_id, 'test', (), lambda resource_id: os.urandom(1000))
+                path = derived_cache._get_path('test:{}:'.format(resource_id))
+                os.utime(path, (i, i))
+            total = sum(size for _, size, _ in derived_cache._list())
+            self.assertLessEqual(total, 25000)
+            self.assertEqual(derived_cache.get_or_make(ids[0], 'test', (), lambda resource_id: None), None)
+            self.assertIsNotNone(derived_cache.get_or_make(ids[-1], 'test', (), lambda resource_id: None))
+        finally:
+            shutil.rmtree(dirpath)
+
+    def test_django(self):
+        self._run(DjangoCache())
+
+
+class BackupTests(TestCase):
+    def test_backup(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage'))
+            backup_dir = os.path.join(dirpath, 'backup')
+            logger = logging.getLogger('storage.tests')
+            resource_ids = [fs.save(ContentFile('file {}\n'.format(i).encode() * 100)) for i in range(5)]
+
+            with mock.patch('storage.backup.create_storage', return_value=fs):
+                self.assertEqual(backup.backup(backup_dir, logger, jobs=2, max_files=2), (5, []))
+                self.assertEqual(sorted(os.listdir(backup_dir)), ['fs.0000.zip', 'fs.0001.zip', 'fs.0002.zip', 'manifest.txt'])
+
+                # incremental runs take only the new files
+                self.assertEqual(backup.backup(backup_dir, logger), (0, []))
+                resource_ids.append(fs.save(ContentFile(b'new file' * 10)))
+                self.assertEqual(backup.backup(backup_dir, logger), (1, []))
+                self.assertEqual(backup.Manifest(backup_dir).load().entries[resource_ids[-1]], backup.BackupEntry(3, 80))
+
+                # volumes that are not in the manifest are indexed
+                os.remove(os.path.join(backup_dir, 'manifest.txt'))
+                self.assertEqual(set(backup.Manifest(backup_dir).load().entries), set(resource_ids))
+                self.assertEqual(backup.verify(backup_dir), [])
+
+                # a damaged volume
+                with zipfile.ZipFile(os.path.join(backup_dir, 'fs.0003.zip'), 'w') as zf:
+                    zf.writestr(str(resource_ids[-1]), b'damaged')
+                absent = ResourceId.parse('59db6ba4a6aff5ed3d980542daf41be65624a1e8')
+                self.assertEqual([resource_id for resource_id, _ in backup.verify(backup_dir, [resource_ids[-1], absent, resource_ids[0]])], [absent, resource_ids[-1]])
+
+                for resource_id in resource_ids[:2]:
+                    os.remove(fs._get_path(resource_id))
+                self.assertEqual(set(backup.find_missing(backup_dir)), set(resource_ids[:2]))
+                self.assertEqual(backup.restore(backup_dir, resource_ids[:2]), (2, []))
+                self.assertEqual(fs.check_availability(resource_ids[:2]), [True, True])
+                self.assertEqual(backup.restore(backup_dir, resource_ids[-1:])[0], 0)
+        finally:
+            shutil.rmtree(dirpath)
+
+
+class GarbageCollectorTests(TestCase):
+    def _save(self, fs, data, age):
+        resource_id = fs.save(ContentFile(data))
+        t = time.time() - age
+        os.utime(fs._get_path(resource_id), (t, t))
+        return resource_id
+
+    def test_resource_fields(self):
+        fields = {model._meta.label: fields for model, fields in get_resource_fields()}
+        self.assertEqual(fields['storage.FileMetadata'], ['resource_id'])
+        self.assertEqual(fields['problems.TestCase'], ['input_resource_id', 'answer_resource_id'])
+        self.assertNotIn('storage.MarkedResource', fields)
+
+    def test_collect(self):
+        dirpath = tempfile.mkdtemp()
+        try:
+            fs = FileSystemStorage(os.path.join(dirpath, 'filestorage'))
+            day = 24 * 60 * 60
+            referenced = self._save(fs, b'referenced' * 10, 2 * day)
+            garbage = [self._save(fs, 'garbage {}'.format(i).encode() * 10, 2 * day) for i in range(5)]
+            fresh = self._save(fs, b'fresh' * 10, 0)
+            FileMetadata.objects.create(filename='a.txt', size=100, resource_id=referenced)
+            FileMetadata.objects.create(filename='b.txt', size=3, resource_id=fs.save(ContentFile(b'abc')))
+
+            with mock.patch('storage.garbage.create_storage', return_value=fs):
+                collector = GarbageCollector(logging.getLogger('storage.tests'), mark_batch_size=1, sweep_batch_size=2)
+                run = collector.get_run()
+                collector.mark(run)
+                self.assertEqual(MarkedResource.objects.filter(collection=run).count(), 1)
+                self.assertEqual(collector.report(run), (5, 5 * 90))
+
+                # referenced by a new row, saved once again, reported to a worker
+                FileMetadata.objects.create(filename='c.txt', size=90, resource_id=garbage[0])
+                fs.save(ContentFile('garbage 1'.encode() * 10))
+                self.assertEqual(fs.check_availability([garbage[2]], touch=True), [True])
+
+                self.assertEqual(collector.sweep(run, max_count=1), (1, 90))
+                self.assertIsNone(GarbageCollection.objects.get(pk=run.pk).finish_time)
+                self.assertEqual(collector.get_run(), run)
+                self.assertEqual(collector.sweep(run), (1, 90))
+
+                run = GarbageCollection.objects.get(pk=run.pk)
+                self.assertIsNotNone(run.finish_time)
+                self.assertEqual((run.deleted_count, run.deleted_size), (2, 180))
+                self.assertEqual(MarkedResource.objects.count(), 0)
+                self.assertEqual(
+                    fs.check_availability([referenced, fresh] + garbage),
+                    [True, True, True, True, True, False, False]
+                )
+                self.assertNotEqual(collector.get_run(), run)
+        finally:
+            shutil.rmtree(dirpath)
+
 
 class FilenameValidatorTests(TestCase):
     def test_good(self):
@@ -168,6 +492,14 @@ class RepresentationTests(TestCase):
         self.assertFalse(r.is_utf8())
         self.assertTrue(r.is_binary())
 
+    def test_control_chars(self):
+        for code in range(256):
+            self.assertEqual(_is_binary(bytes([code])), code < 128 and _is_control_char(code))
+            self.assertEqual(_is_binary(chr(code)), _is_control_char(code))
+        self.assertTrue(_is_binary(b'text' * 1000 + b'\x7f'))
+        self.assertFalse(_is_binary(b'text\t\r\n\x0b\x0c\x80\xff'))
+        self.assertFalse(_is_binary('текст\r\n'))
+
     def test_boms(self):
         r = represent_blob(b'\xEF\xBB\xBF', 3)
         self.assertTrue(r.is_utf8())
@@ -0,0 +1,159 @@
+'''
+Load test for the HTTP semaphore.
+
+Opens N idle long-poll connections (/wait), then measures:
+  * single wake-up latency: one /signal while all N workers wait;
+  * burst wake-up latency: N /signal requests at once, time until each waiter gets its response.
+
+By default the semaphore is started in the same process; use --host/--port to test a running one.
+'''
+
+import argparse
+import asyncio
+import resource
+import statistics
+import time
+
+from semaphore import SemaphoreServer
+
+
+class Waiter(object):
+    def __init__(self, host, port, tag):
+        self._host = host
+        self._port = port
+        self._tag = tag
+        self._reader = None
+        self._writer = None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+
+    async def wait(self):
+        '''
+        Returns (status, time of response).
+        '''
+        self._writer.write(_make_request('/wait', self._tag))
+        await self._writer.drain()
+        status = await _read_status(self._reader)
+        return status, time.perf_counter()
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+def _make_request(path, tag):
+    lines = ['POST {} HTTP/1.1'.format(path), 'Host: semaphore', 'Content-Length: 0']
+    if tag:
+        lines.append('X-iRunner-Worker-Tag: {}'.format(tag))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _read_status(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1])
+
+
+async def _signal(host, port, tag, count):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        # pipelined requests on one keep-alive connection
+        writer.write(_make_request('/signal', tag) * count)
+        await writer.drain()
+        for _ in range(count):
+            await _read_status(reader)
+    finally:
+        writer.close()
+
+
+async def _wait_for_waiters(host, port, tag, count):
+    # the server registers waiters asynchronously, poll /stats until all of them are parked
+    while True:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(b'GET /stats HTTP/1.1\r\nHost: semaphore\r\nConnection: close\r\n\r\n')
+        data = await reader.read()
+        writer.close()
+        if '"waiters": {}'.format(count).encode('ascii') in data:
+            return
+        await asyncio.sleep(0.05)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _report(name, latencies):
+    ms = [x * 1000. for x in latencies]
+    print('{:<8} n={:<6} mean={:.2f}ms  p50={:.2f}ms  p99={:.2f}ms  max={:.2f}ms'.format(
+        name, len(ms), statistics.mean(ms), _percentile(ms, 0.5), _percentile(ms, 0.99), max(ms)))
+
+
+async def run(host, port, waiters, rounds, tag):
+    conns = [Waiter(host, port, tag) for _ in range(waiters)]
+    await asyncio.gather(*(c.connect() for c in conns))
+
+    # single wake-ups: one signal, N idle waiters
+    single = []
+    pending = {asyncio.ensure_future(c.wait()): c for c in conns}
+    await _wait_for_waiters(host, port, tag, waiters)
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        await _signal(host, port, tag, 1)
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            status, t1 = task.result()
+            assert status == 200
+            single.append(t1 - t0)
+            c = pending.pop(task)
+            pending[asyncio.ensure_future(c.wait())] = c
+    await _wait_for_waiters(host, port, tag, waiters)
+
+    # burst: as many signals as waiters
+    t0 = time.perf_counter()
+    await _signal(host, port, tag, waiters)
+    results = await asyncio.gather(*pending)
+    burst = [t1 - t0 for status, t1 in results if status == 200]
+
+    await asyncio.gather(*(c.close() for c in conns))
+
+    print('{} waiters'.format(waiters))
+    _report('single', single)
+    _report('burst', burst)
+    if len(burst) != waiters:
+        print('WARNING: {} of {} waiters have not been woken up'.format(waiters - len(burst), waiters))
+
+
+async def run_local(waiters, rounds, tag):
+    server = await SemaphoreServer(timeout=60).start('127.0.0.1', 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    async with server:
+        await run(host, port, waiters, rounds, tag)
+        # let the server see that the clients have gone
+        await asyncio.sleep(0.5)
+
+
+def _raise_fd_limit(need):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < need:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(need, hard), hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--waiters', type=int, default=1000)
+    parser.add_argument('-r', '--rounds', type=int, default=100, help='number of single wake-ups')
+    parser.add_argument('-t', '--tag', default='', help='worker tag')
+    parser.add_argument('--host', help='semaphore host (default: start in-process)')
+    parser.add_argument('--port', type=int, default=17083)
+    args = parser.parse_args()
+
+    _raise_fd_limit(2 * args.waiters + 100)
+    if args.host:
+        asyncio.run(run(args.host, args.port, args.waiters, args.rounds, args.tag))
+    else:
+        asyncio.run(run_local(args.waiters, args.rounds, args.tag))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,119 +1,434 @@
-import httplib
-import multiprocessing
-import socket
-from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
-from SocketServer import ThreadingMixIn
+'''
+HTTP semaphore: a long-poll wake-up service for testing workers.
 
-import win32service
-import win32serviceutil
+    POST /signal    adds a permit for the worker tag (wakes up one waiter, if any);
+                    X-iRunner-Signal-Count header asks for several permits at once
+    POST /wait      takes a permit; blocks up to TIMEOUT seconds if there are none.
+                    Responds 200 if a permit has been taken, 404 on timeout.
+    POST /push      hands the request body (a claimed job) to an idle worker
+                    that waits with X-iRunner-Accept-Push header. Responds 200
+                    with X-iRunner-Worker-Name of the worker once the job has
+                    been sent to it, 404 if there is no such worker at the
+                    moment or it has gone before getting the job.
+    GET  /          health check
+    GET  /stats     permits and waiters per tag (JSON)
 
-sem = multiprocessing.Semaphore(0)
+The tag is passed in X-iRunner-Worker-Tag header, requests without the header
+use the default tag. Every POST response carries queue-depth hints:
+X-iRunner-Semaphore-Permits (permits left) and X-iRunner-Semaphore-Waiters
+(idle workers waiting) for the tag.
+
+A pushed job is returned as the body of the /wait response, so the worker
+starts testing without a separate request for the job. An empty 200 response
+means a plain signal: the worker should take the job itself.
+The semaphore keeps no jobs: a job that has not been delivered is reported
+to the pusher, which puts it back to the queue.
+
+All the connections are served by one asyncio event loop, so thousands of
+idle workers cost neither threads nor processes.
+
+On Windows with pywin32 the semaphore runs as a service:
+    python semaphore.py install|update|remove|start|stop|restart|debug
+Otherwise (or without a service command) it runs in the console.
+'''
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import sys
 
 TIMEOUT = 20
 SCRIPT_PATH = ''
 HOST = '127.0.0.1'
 PORT = 17083
 
+# Signals that nobody has waited for are coalesced: there is no sense in waking
+# workers up more times than there are jobs, and a permit is consumed per job.
+MAX_PERMITS = 10000
+
+MAX_HEADER_SIZE = 16 * 1024
+# pushed jobs list all the tests of the problem
+MAX_BODY_SIZE = 16 * 1024 * 1024
+TAG_HEADER = 'x-irunner-worker-tag'
+NAME_HEADER = 'x-irunner-worker-name'
+ACCEPT_PUSH_HEADER = 'x-irunner-accept-push'
+SIGNAL_COUNT_HEADER = 'x-irunner-signal-count'
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+}
+
+
+class PushedJob(object):
+    '''
+    A job handed to a waiter. `delivered` is resolved when the job has been sent
+    to the worker (True) or the worker has gone before getting it (False).
+    '''
+    def __init__(self, payload):
+        self.payload = payload
+        self.delivered = asyncio.get_running_loop().create_future()
+
+    def resolve(self, delivered):
+        if not self.delivered.done():
+            self.delivered.set_result(delivered)
+
+
+class PermitPool(object):
+    '''
+    Counted permits of a single worker tag.
+    Waiters are woken up in FIFO order.
+    '''
+    def __init__(self, max_permits=MAX_PERMITS):
+        self.permits = 0
+        self.max_permits = max_permits
+        # ordered {future: worker name}: removal on timeout is O(1);
+        # the name is None for the waiters that do not accept pushed jobs
+        self._waiters = collections.OrderedDict()
+
+    @property
+    def waiters(self):
+        return len(self._waiters)
+
+    def signal(self):
+        if self._waiters:
+            fut, _ = self._waiters.popitem(last=False)
+            fut.set_result(True)
+        else:
+            self.permits = min(self.permits + 1, self.max_permits)
+
+    def push(self, payload):
+        '''
+        Gives the payload to the first waiter that accepts pushed jobs.
+        Returns (name of the waiter, PushedJob) or None if there is no such waiter.
+        '''
+        for fut, name in self._waiters.items():
+            if name is not None:
+                del self._waiters[fut]
+                job = PushedJob(payload)
+                fut.set_result(job)
+                return name, job
+        return None
+
+    def give_back(self, result):
+        if result is True:
+            self.signal()
+        else:
+            # the pusher puts the job back to the queue
+            result.resolve(False)
+
+    async def wait(self, timeout, disconnected=None, name=None):
+        '''
+        Returns True if a permit has been taken, PushedJob if a job has been
+        pushed (only when `name` is not None), False on timeout.
+        If `disconnected` future completes first, the wait is abandoned and
+        whatever might have been granted meanwhile is given back.
+        '''
+        if self.permits > 0:
+            self.permits -= 1
+            return True
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[fut] = name
+
+        aws = [fut] if disconnected is None else [fut, disconnected]
+        try:
+            await asyncio.wait(aws, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._waiters.pop(fut, None)
+
+        if not fut.done():
+            fut.cancel()
+            return False
+
+        if disconnected is not None and disconnected.done():
+            # nobody will receive the permit or the job
+            self.give_back(fut.result())
+            return False
+        return fut.result()
+
 
 class SemaphoreHolder(object):
-    def __init__(self):
-        self._default_sem = multiprocessing.Semaphore(0)
-        self._lock = multiprocessing.Lock()
-        self._sems = {}
+    def __init__(self, max_permits=MAX_PERMITS):
+        self._max_permits = max_permits
+        self._pools = {}
 
     def get(self, tag):
-        if tag is None:
-            return self._default_sem
+        pool = self._pools.get(tag)
+        if pool is None:
+            pool = PermitPool(self._max_permits)
+            self._pools[tag] = pool
+        return pool
 
-        with self._lock:
-            sem = self._sems.get(tag)
-            if sem is None:
-                sem = multiprocessing.Semaphore(0)
-                self._sems[tag] = sem
+    def stats(self):
+        return {
+            (tag if tag is not None else ''): {'permits': pool.permits, 'waiters': pool.waiters}
+            for tag, pool in self._pools.items()
+        }
 
-        return sem
 
+class Request(object):
+    def __init__(self, method, path, version, headers, body=b''):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
 
-semaphores = SemaphoreHolder()
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
 
 
-class Handler(BaseHTTPRequestHandler):
-    def _get_path(self):
-        p = self.path
-        if p.startswith(SCRIPT_PATH):
-            return p[len(SCRIPT_PATH):]
-        return p
+async def read_request(reader):
+    '''
+    Returns Request or None on EOF. Raises ValueError on malformed input.
+    '''
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise ValueError('incomplete request')
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError('request header is too large')
+
+    lines = head.decode('latin-1').split('\r\n')
+    tokens = lines[0].split()
+    if len(tokens) != 3:
+        raise ValueError('malformed request line')
+    method, path, version = tokens
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise ValueError('malformed header')
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise ValueError('malformed content length')
+    if length < 0 or length > MAX_BODY_SIZE:
+        raise ValueError('request body is too large')
+    body = b''
+    if length > 0:
+        body = await reader.readexactly(length)
+
+    return Request(method, path, version, headers, body)
 
-    def _signal(self, tag):
-        semaphores.get(tag).release()
-        return True
 
-    def _wait(self, tag):
-        return semaphores.get(tag).acquire(True, TIMEOUT)
+def make_response(status, headers=None, body=b'', keep_alive=True):
+    lines = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, ''))]
+    for name, value in (headers or {}).items():
+        lines.append('{}: {}'.format(name, value))
+    lines.append('Content-Length: {}'.format(len(body)))
+    lines.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+class SemaphoreServer(object):
+    def __init__(self, timeout=TIMEOUT, script_path=SCRIPT_PATH, max_permits=MAX_PERMITS):
+        self.timeout = timeout
+        self.script_path = script_path
+        self.semaphores = SemaphoreHolder(max_permits)
+
+    def _get_path(self, request):
+        p = request.path
+        if p.startswith(self.script_path):
+            return p[len(self.script_path):]
+        return p
+
+    @staticmethod
+    def _hints(pool):
+        return {
+            'X-iRunner-Semaphore-Permits': pool.permits,
+            'X-iRunner-Semaphore-Waiters': pool.waiters,
+        }
 
-    def do_POST(self):
-        tag = self.headers.getheader('X-iRunner-Worker-Tag', None)
-        path = self._get_path()
+    async def _handle_post(self, request, path, reader):
+        tag = request.headers.get(TAG_HEADER)
+        pool = self.semaphores.get(tag)
 
-        ok = False
         if path == '/signal':
-            ok = self._signal(tag)
-        elif path == '/wait':
-            ok = self._wait(tag)
+            try:
+                count = int(request.headers.get(SIGNAL_COUNT_HEADER, 1))
+            except ValueError:
+                return 400, {}, b''
+            # more signals than waiters and permits would be coalesced anyway
+            for _ in range(max(1, min(count, pool.waiters + pool.max_permits))):
+                pool.signal()
+            return 200, self._hints(pool), b''
 
-        self.send_response(httplib.OK if ok else httplib.NOT_FOUND)
-        self.end_headers()
+        if path == '/push':
+            if not request.body:
+                return 400, {}, b''
+            pushed = pool.push(request.body)
+            if pushed is None:
+                return 404, self._hints(pool), b''
+            name, job = pushed
+            # the receiver resolves it on any outcome (see handle_connection)
+            if not await job.delivered:
+                return 404, self._hints(pool), b''
+            headers = self._hints(pool)
+            headers['X-iRunner-Worker-Name'] = name
+            return 200, headers, b''
 
-    def do_GET(self):
-        path = self._get_path()
+        if path == '/wait':
+            name = None
+            if request.headers.get(ACCEPT_PUSH_HEADER):
+                name = request.headers.get(NAME_HEADER, '')
+            # a long-polling client sends nothing until it gets the response,
+            # so a completed read means that the client has gone
+            disconnected = asyncio.ensure_future(reader.read(1))
+            try:
+                result = await pool.wait(self.timeout, disconnected, name)
+            finally:
+                disconnected.cancel()
+                # the reader must be released before the next request is read
+                await asyncio.gather(disconnected, return_exceptions=True)
+            if result is not False and reader.at_eof():
+                pool.give_back(result)
+                result = False
+            if result is False:
+                return 404, self._hints(pool), b''
+            if result is True:
+                return 200, self._hints(pool), b''
+            headers = self._hints(pool)
+            headers['Content-Type'] = 'application/json'
+            # the body is sent by handle_connection, which resolves the job
+            return 200, headers, result
 
+        return 404, {}, b''
+
+    def _handle_get(self, path):
         if path == '/':
-            self.send_response(httplib.OK)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write('OK')
-        elif path in ('/signal', '/wait'):
-            self.send_response(httplib.METHOD_NOT_ALLOWED)
-            self.end_headers()
+            return 200, {'Content-Type': 'text/plain'}, b'OK'
+        if path == '/stats':
+            body = json.dumps(self.semaphores.stats(), sort_keys=True).encode('utf-8')
+            return 200, {'Content-Type': 'application/json'}, body
+        if path in ('/signal', '/wait', '/push'):
+            return 405, {}, b''
+        return 404, {}, b''
+
+    async def handle_connection(self, reader, writer):
+        job = None
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError:
+                    writer.write(make_response(400, keep_alive=False))
+                    break
+                if request is None:
+                    break
+
+                path = self._get_path(request)
+                if request.method == 'POST':
+                    status, headers, body = await self._handle_post(request, path, reader)
+                elif request.method == 'GET':
+                    status, headers, body = self._handle_get(path)
+                else:
+                    status, headers, body = 405, {}, b''
+                if isinstance(body, PushedJob):
+                    job, body = body, body.payload
+
+                if reader.at_eof():
+                    break
+
+                writer.write(make_response(status, headers, body, request.keep_alive))
+                await writer.drain()
+                if job is not None:
+                    job.resolve(True)
+                    job = None
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if job is not None:
+                # the worker has gone before getting the job
+                job.resolve(False)
+            writer.close()
+
+    async def start(self, host=HOST, port=PORT):
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_SIZE, backlog=4096)
+
+
+async def serve(host, port, timeout, stop_event=None):
+    server = await SemaphoreServer(timeout).start(host, port)
+    logging.info('Listening on %s:%d', host, port)
+    async with server:
+        if stop_event is None:
+            await server.serve_forever()
         else:
-            self.send_response(httplib.NOT_FOUND)
-            self.end_headers()
+            await stop_event.wait()
 
 
-class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-    """Handle requests in a separate thread."""
+try:
+    import win32service
+    import win32serviceutil
+except ImportError:
+    win32serviceutil = None
 
+# the arguments that are passed to win32serviceutil.HandleCommandLine()
+SERVICE_COMMANDS = {'install', 'update', 'remove', 'start', 'stop', 'restart', 'debug'}
 
-class PySvc(win32serviceutil.ServiceFramework):
-    # you can NET START/STOP the service by the following name
-    _svc_name_ = "HttpSemaphore"
-    # this text shows up as the service name in the Service
-    # Control Manager (SCM)
-    _svc_display_name_ = "HTTP Semaphore Service"
-    # this text shows up as the description in the SCM
-    _svc_description_ = "Semaphore with HTTP API"
+if win32serviceutil is not None:
+    class PySvc(win32serviceutil.ServiceFramework):
+        # you can NET START/STOP the service by the following name
+        _svc_name_ = "HttpSemaphore"
+        # this text shows up as the service name in the Service
+        # Control Manager (SCM)
+        _svc_display_name_ = "HTTP Semaphore Service"
+        # this text shows up as the description in the SCM
+        _svc_description_ = "Semaphore with HTTP API"
 
-    def __init__(self, args):
-        win32serviceutil.ServiceFramework.__init__(self, args)
-        socket.setdefaulttimeout(60)
-        self.server = ThreadedHTTPServer((HOST, PORT), Handler)
+        def __init__(self, args):
+            win32serviceutil.ServiceFramework.__init__(self, args)
+            self._loop = asyncio.new_event_loop()
+            self._stop_event = None
 
-    # core logic of the service
-    def SvcDoRun(self):
-        self.server.serve_forever()
+        # core logic of the service
+        def SvcDoRun(self):
+            asyncio.set_event_loop(self._loop)
+            self._stop_event = asyncio.Event()
+            self._loop.run_until_complete(serve(HOST, PORT, TIMEOUT, self._stop_event))
 
-    # called when we're being shut down
-    def SvcStop(self):
-        # tell the SCM we're shutting down
-        self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
-        self.server.shutdown()
+        # called when we're being shut down
+        def SvcStop(self):
+            # tell the SCM we're shutting down
+            self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
+            self._loop.call_soon_threadsafe(self._stop_event.set)
 
 
 def main():
-    server = ThreadedHTTPServer((HOST, PORT), Handler)
-    server.serve_forever()
+    if win32serviceutil is not None and SERVICE_COMMANDS.intersection(sys.argv[1:]):
+        win32serviceutil.HandleCommandLine(PySvc)
+        return
+
+    parser = argparse.ArgumentParser(description='HTTP semaphore for iRunner workers')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--timeout', type=float, default=TIMEOUT, help='max time to wait for a permit, seconds')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.timeout))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
-    win32serviceutil.HandleCommandLine(PySvc)
-    # main()
+    main()